@@ -26,6 +26,8 @@ def make_default_config():
         "hidden_collision_type_groups": "",
         "filter_view": "",
         "default_view": "topdownview",
+        "undo_history_memory_limit_mb": "64",
+        "gpu_picking": "False",
     }
 
     with open("editor_config.ini", "w") as f:
@@ -0,0 +1,50 @@
+"""
+Times writing KMP files with a growing number of objects that have routes, to check that
+`KMP.to_bytes()` scales linearly with the number of entries. Run from the editor directory:
+
+    python kmp_benchmark.py [counts...]
+"""
+import sys
+import time
+
+from lib.libkmp import KMP, MapObject
+from lib.vectors import Vector3
+
+# sound_river: an object with a route and no route start point setting.
+OBJECT_ID = 5
+DEFAULT_COUNTS = (500, 1000, 2000, 4000, 8000)
+REPEATS = 3
+
+
+def make_kmp(object_count):
+    kmp = KMP.make_useful()
+    for i in range(object_count):
+        obj = MapObject.new(OBJECT_ID)
+        obj.position = Vector3(i * 10.0, 0.0, 0.0)
+        obj.create_route(True, absolute_pos=True)
+        kmp.objects.append(obj)
+    return kmp
+
+
+def time_write(kmp):
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        data = kmp.to_bytes()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(data)
+
+
+def main(args):
+    counts = [int(arg) for arg in args] or DEFAULT_COUNTS
+
+    print("{0:>8} {1:>10} {2:>10} {3:>14}".format("objects", "bytes", "ms", "us per object"))
+    for count in counts:
+        elapsed, size = time_write(make_kmp(count))
+        print("{0:>8} {1:>10} {2:>10.2f} {3:>14.2f}".format(
+            count, size, elapsed * 1000, elapsed * 1000000 / count))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,20 +1,21 @@
 from argparse import _MutuallyExclusiveGroup
 import contextlib
+from itertools import chain
 import pickle
 import traceback
-import weakref
 import os
 from timeit import default_timer
 from copy import deepcopy
 from math import sin, cos, atan2
 import json
+from io import BytesIO, TextIOWrapper
+import numpy
 from PIL import Image
 
 
 from PySide6 import QtCore, QtGui, QtWidgets
 
 import opengltext
-import py_obj
 
 from widgets.editor_widgets import catch_exception
 from widgets.editor_widgets import AddPikObjectWindow
@@ -28,12 +29,16 @@ from widgets.editor_widgets import open_error_dialog, catch_exception_with_dialo
 from mkwii_widgets import KMPMapViewer, MODE_TOPDOWN, SnappingMode
 from lib.libkmp import *
 import lib.libkmp as libkmp
-from lib.libkcl import RacetrackCollision
+from lib import collision_cache
+from lib.collision import Collision
+from lib.collision_loader import CollisionLoader, load_kcl_collision
 from lib.model_rendering import TexturedModel, CollisionModel
+from lib.obj_loader import read_obj
 from widgets.editor_widgets import ErrorAnalyzer, ErrorAnalyzerButton, LoadingFix
 from widgets.file_select import FileSelect
 from widgets.data_editor_options import AREA_TYPES
 from lib.vectors import Vector3
+from lib.undo import UndoHistory
 from lib.file_system import *
 
 def get_treeitem(root:QtWidgets.QTreeWidgetItem, obj):
@@ -43,39 +48,12 @@ def get_treeitem(root:QtWidgets.QTreeWidgetItem, obj):
             return child
     return None
 
-class UndoEntry:
-    _cache = weakref.WeakValueDictionary()
-
-    class _UndoCacheEntry:
-
-        def __init__(self, bol_document):
-            self.bol_document = bol_document
-
-    def __init__(self, bol_document: bytes):
-        self.bol_hash = hash((bol_document))
-
-        # To avoid keeping track of duplicates of the BOL document (likely the case when the part
-        # that changes in the undo entry is the selection data), a cache is used.
-        if self.bol_hash not in UndoEntry._cache:
-            self._cache_entry = UndoEntry._UndoCacheEntry(bol_document)
-            UndoEntry._cache[self.bol_hash] = self._cache_entry
-        else:
-            self._cache_entry = UndoEntry._cache[self.bol_hash]
-        
-        self.bol_document = self._cache_entry.bol_document
-        self.hash = hash(self.bol_hash)
-
-    def __eq__(self, other) -> bool:
-        return self.hash == other.hash
-
 class GenEditor(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
         self.level_file = KMP.make_useful()
         self.setMinimumSize(200,200)
 
-        self.undo_history: list[UndoEntry] = []
-        self.redo_history: list[UndoEntry] = []
         self.undo_history_disabled_count: int  = 0
 
         try:
@@ -88,6 +66,9 @@ class GenEditor(QtWidgets.QMainWindow):
         self.editorconfig = self.configuration["editor"]
         self.current_gen_path = None
 
+        undo_memory_limit = int(self.editorconfig.get("undo_history_memory_limit_mb", "64"))
+        self.undo_history = UndoHistory(undo_memory_limit * 1024 * 1024)
+
         self.setAcceptDrops(True)
         self.setup_ui()
 
@@ -106,6 +87,10 @@ class GenEditor(QtWidgets.QMainWindow):
         self._window_title = ""
         self._user_made_change = False
         self._justupdatingselectedobject = False
+        # Whether the document may have been edited since the last undo entry was recorded, and
+        # the objects that were edited by id, or None if they are not known.
+        self._document_edited = False
+        self._touched_objects = {}
 
         self.bco_coll = None
         self.root_directory = None
@@ -123,7 +108,7 @@ class GenEditor(QtWidgets.QMainWindow):
         self.first_time_3dview = True
 
         self.restore_geometry()
-        self.undo_history.append(self.generate_undo_entry())
+        self.generate_undo_entry()
 
         self.obj_to_copy = None
         self.objs_to_copy = None
@@ -139,7 +124,7 @@ class GenEditor(QtWidgets.QMainWindow):
         if self.editorconfig.get("default_view") == "3dview":
             self.change_to_3dview(True)
 
-        self.undo_history.append(self.generate_undo_entry())
+        self.generate_undo_entry()
 
     def save_geometry(self):
         if "geometry" not in self.configuration:
@@ -223,7 +208,21 @@ class GenEditor(QtWidgets.QMainWindow):
         else:
             self.setWindowTitle("gcn kmp editor (demake)")
 
-    def set_has_unsaved_changes(self, hasunsavedchanges):
+    def set_has_unsaved_changes(self, hasunsavedchanges, changed_objects=None):
+        if hasunsavedchanges:
+            self._document_edited = True
+            if changed_objects is None:
+                self._touched_objects = None
+            elif self._touched_objects is not None:
+                # The positions and rotations of the objects are edited along with them.
+                for obj in chain(changed_objects, self.level_view.selected_positions,
+                                 self.level_view.selected_rotations):
+                    self._touched_objects[id(obj)] = obj
+
+        if hasunsavedchanges and changed_objects is not None:
+            # Other edits are drawn again once their undo entry is recorded.
+            self.level_view.invalidate_scene(changed_objects)
+
         if hasunsavedchanges and not self._user_made_change:
             self._user_made_change = True
 
@@ -238,72 +237,100 @@ class GenEditor(QtWidgets.QMainWindow):
             else:
                 self.setWindowTitle("gcn kmp editor (demake)")
 
-    def generate_undo_entry(self) -> UndoEntry:
-        self.level_file.set_selected(self.level_view.selected)
-        bol_document = self.level_file.to_bytes()
-        return UndoEntry(bol_document)
-
-    def load_top_undo_entry(self):
-        if not self.undo_history:
-            return
-
-        current_undo_entry = self.generate_undo_entry()
-        undo_entry = self.undo_history[-1]
+    def generate_undo_entry(self, touched=None):
+        return self.undo_history.record(self.level_file, self.level_view.selected, touched)
 
-        bol_changed = current_undo_entry.bol_hash != undo_entry.bol_hash
+    def load_top_undo_entry(self, document_changed, changes=None):
+        undo_entry = self.undo_history.top
 
-        self.level_file = KMP.from_bytes(undo_entry.bol_document)
+        # The changes themselves were already applied in place; only a different document (e.g.
+        # from before a file was loaded) needs to be swapped in.
+        if undo_entry.document is not self.level_file:
+            self.level_file = undo_entry.document
+            Area.level_file = Camera.level_file = MapObject.level_file = self.level_file
+            EnemyPointGroups.level_file = self.level_file
 
         self.level_view.level_file = self.level_file
         self.leveldatatreeview.set_objects(self.level_file)
 
         # Restore the selection that was current when the undo entry was produced.
-        self.level_view.selected = self.level_file.get_selected()
+        self.level_view.selected = list(undo_entry.selected)
         self.level_view.selected_positions = KMP.get_positions(self.level_view.selected)
-        self.level_file.selected_rotations = KMP.get_rotations(self.level_view.selected)
+        self.level_view.selected_rotations = KMP.get_rotations(self.level_view.selected)
 
+        if document_changed:
+            changed_objects = [obj for obj, _old, _new in (changes or {}).values()]
+            self.level_view.invalidate_scene(changed_objects, from_document=True)
         self.update_3d()
         self.pik_control.update_info()
 
-        if bol_changed:
+        if document_changed:
             self.set_has_unsaved_changes(True)
-            self.error_analyzer_button.analyze_kmp(self.level_file)
+            self.error_analyzer_button.analyze_kmp(self.level_file, changes)
+
+        self._document_edited = False
+        self._touched_objects = {}
 
     def on_undo_action_triggered(self):
-        if len(self.undo_history) > 1:
-            self.redo_history.insert(0, self.undo_history.pop())
+        undone_entry = self.undo_history.top
+        if self.undo_history.undo() is not None:
             self.update_undo_redo_actions()
-            self.load_top_undo_entry()
+            self.load_top_undo_entry(undone_entry.document_changed, undone_entry.changes)
 
     def on_redo_action_triggered(self):
-        if self.redo_history:
-            self.undo_history.append(self.redo_history.pop(0))
+        redone_entry = self.undo_history.redo()
+        if redone_entry is not None:
             self.update_undo_redo_actions()
-            self.load_top_undo_entry()
+            self.load_top_undo_entry(redone_entry.document_changed, redone_entry.changes)
 
-    def on_document_potentially_changed(self, update_unsaved_changes=True):
+    def on_document_potentially_changed(self, update_unsaved_changes=True, touched=None):
         # Early out if undo history is temporarily disabled.
         if self.undo_history_disabled_count:
             return
 
-        undo_entry = self.generate_undo_entry()
-
-        if self.undo_history[-1] != undo_entry:
-            bol_changed = self.undo_history[-1].bol_hash != undo_entry.bol_hash
+        undo_entry = self.generate_undo_entry(touched)
 
-            self.undo_history.append(undo_entry)
-            self.redo_history.clear()
+        if undo_entry is not None:
             self.update_undo_redo_actions()
 
-            if bol_changed:
+            if undo_entry.document_changed:
+                # Only the collections that the changed objects are part of are drawn again.
+                changed_objects = [obj for obj, _old, _new in undo_entry.changes.values()]
+                self.level_view.invalidate_scene(changed_objects, from_document=True)
+                self.level_view.do_redraw()
+
                 if update_unsaved_changes:
                     self.set_has_unsaved_changes(True)
 
-                self.error_analyzer_button.analyze_kmp(self.level_file)
+                self.error_analyzer_button.analyze_kmp(self.level_file, undo_entry.changes)
+
+        self._document_edited = False
+        self._touched_objects = {}
+
+    def on_potentially_editing_event(self, in_map_view):
+        # Clicks and keys in the map view only edit the document through the actions of the editor,
+        # which mark it as edited; a click that merely selected something is already recorded.
+        # Elsewhere, e.g. in the data editors of the side panel, widgets change it directly.
+        if in_map_view and not self._document_edited:
+            return
+
+        # Only the edits made in the map view are all known to the editor.
+        touched = None
+        if in_map_view and self._touched_objects is not None:
+            touched = list(self._touched_objects.values())
+        self.on_document_potentially_changed(touched=touched)
+
+    def on_selection_changed(self):
+        # Selection changes only record which objects are selected; the document is left alone.
+        if self.undo_history_disabled_count:
+            return
+
+        if self.undo_history.record_selection(self.level_view.selected) is not None:
+            self.update_undo_redo_actions()
 
     def update_undo_redo_actions(self):
-        self.undo_action.setEnabled(len(self.undo_history) > 1)
-        self.redo_action.setEnabled(bool(self.redo_history))
+        self.undo_action.setEnabled(self.undo_history.can_undo())
+        self.redo_action.setEnabled(self.undo_history.can_redo())
 
     @contextlib.contextmanager
     def undo_history_disabled(self):
@@ -523,6 +550,16 @@ class GenEditor(QtWidgets.QMainWindow):
         self.error_analyzer_button.clicked.connect(lambda _checked: self.analyze_for_mistakes())
         self.statusbar.addPermanentWidget(self.error_analyzer_button)
 
+        self.collision_progress = QtWidgets.QProgressBar()
+        self.collision_progress.setMaximumWidth(250)
+        self.collision_progress.hide()
+        self.statusbar.addPermanentWidget(self.collision_progress)
+
+        self.collision_loader = CollisionLoader(self)
+        self.collision_loader.progress.connect(self.on_collision_load_progress)
+        self.collision_loader.loaded.connect(self.on_collision_loaded)
+        self.collision_loader.failed.connect(self.on_collision_load_failed)
+
         self.connect_actions()
 
     @catch_exception_with_dialog
@@ -754,7 +791,7 @@ class GenEditor(QtWidgets.QMainWindow):
             self.collision_area_dialog = None
 
         collision_model = self.level_view.alternative_mesh
-        colltypes = tuple(sorted(collision_model.meshes))
+        colltypes = tuple(collision_model.coltypes)
 
         if self.variants is None:
 
@@ -927,16 +964,7 @@ class GenEditor(QtWidgets.QMainWindow):
                 ",".join(str(t) for t in collision_model.hidden_collision_type_groups)
 
             if self.level_view.collision is not None:
-                hidden_coltypes_str = self.configuration["editor"]["hidden_collision_types"]
-                hidden_colgroups_str = self.configuration["editor"]["hidden_collision_type_groups"]
-
-                hidden_coltypes = set(int(t) for t in hidden_coltypes_str.split(",") if t)
-                hidden_colgroups = set(int(t) for t in hidden_colgroups_str.split(",") if t)
-
-                CollisionModel.hidden_coltypes = hidden_coltypes
-                CollisionModel.hidden_colgroups = hidden_colgroups
-
-                self.level_view.set_hidden_coltypes(hidden_coltypes, hidden_colgroups)
+                self.apply_hidden_collision_types()
                 self.level_view.collision.set_visible_tris()
 
             save_cfg(self.configuration)
@@ -1032,6 +1060,7 @@ class GenEditor(QtWidgets.QMainWindow):
         self.editorconfig["filter_view"] = ','.join(filters)
         save_cfg(self.configuration)
 
+        self.level_view.invalidate_scene()
         self.level_view.do_redraw()
 
     def on_cull_faces_triggered(self, checked):
@@ -1340,6 +1369,7 @@ class GenEditor(QtWidgets.QMainWindow):
 
         self.level_file = kmp_file
         self.level_view.level_file = self.level_file
+        self.level_view.invalidate_scene()
         # self.pikmin_gen_view.update()
         self.level_view.do_redraw()
 
@@ -1386,6 +1416,8 @@ class GenEditor(QtWidgets.QMainWindow):
             self.button_save_level_as()
             return
 
+        self.level_file.set_selected(self.level_view.selected)
+
         if self.root_directory is not None:
             #dump_path = os.path.join(os.getcwd(), "lib")
             full_path = os.path.join(os.getcwd(), "lib\szsdump")
@@ -1428,6 +1460,7 @@ class GenEditor(QtWidgets.QMainWindow):
             self.last_chosen_type)
 
         if filepath:
+            self.level_file.set_selected(self.level_view.selected)
             if choosentype == "Archived files (*.arc)" or filepath.endswith(".arc"):
                 if self.loaded_archive is None or self.loaded_archive_file is None:
                     with open(filepath, "rb") as f:
@@ -1470,12 +1503,10 @@ class GenEditor(QtWidgets.QMainWindow):
             if not filepath:
                 return
 
-            with open(filepath, "r") as f:
-                faces = py_obj.read_obj(f)
-            alternative_mesh = TexturedModel.from_obj_path(filepath, rotate=True)
-
-
-            self.setup_collision(faces, filepath, alternative_mesh)
+            self.level_view.clear_collision()
+            # The collision is built with the hidden collision types applied on the worker.
+            self.apply_hidden_collision_types()
+            self.collision_loader.start(filepath, load_obj_collision, filepath)
 
         except Exception as e:
             traceback.print_exc()
@@ -1499,36 +1530,54 @@ class GenEditor(QtWidgets.QMainWindow):
             self.update_3d()
 
     def load_collision_kcl(self, filepath):
-        faces, model = self.read_kcl_file(filepath)
-        if faces is None:
+        data = self.read_kcl_data(filepath)
+        if data is None:
+            return
+        self.level_view.clear_collision()
+        self.apply_hidden_collision_types()
+        self.collision_loader.start(filepath, load_kcl_collision, data)
+
+    def on_collision_loaded(self, collision, model, filepath):
+        self.setup_collision(collision, filepath, alternative_mesh=model)
+        self.update_3d()
+
+    def on_collision_load_failed(self, filepath, error):
+        self.collision_progress.hide()
+        print("Error appeared while loading collision:", error)
+        open_error_dialog("Could not load {0}: {1}".format(filepath, error), self)
+
+    def on_collision_load_progress(self, percent, text):
+        if percent >= 100:
+            self.collision_progress.hide()
             return
-        self.setup_collision(faces, filepath, alternative_mesh=model)
+        self.collision_progress.setValue(percent)
+        self.collision_progress.setFormat("{0}... %p%".format(text))
+        self.collision_progress.show()
 
-    def read_kcl_file(self, filename, filename_only=False):
-        kcl_coll = RacetrackCollision()
-        faces = []
+    def read_kcl_data(self, filename, filename_only=False):
         if self.root_directory is not None:
             kcl_file_obj = self.root_directory.get_file(filename)
             if kcl_file_obj is None:
-                return None, None
-            kcl_coll.load_file(kcl_file_obj)
-        else:
-            if filename_only:
-                filepath_base = os.path.dirname(self.current_gen_path)
-                filename = filepath_base + '/' + filename
-            if not os.path.exists(filename):
-                return None, None
-            with open(filename, "rb") as f:
-                kcl_coll.load_file(f)
+                return None
+            return kcl_file_obj.getvalue()
 
-        faces = kcl_coll.triangles
-
-        model = CollisionModel(kcl_coll)
-        return faces, model
+        if filename_only:
+            filepath_base = os.path.dirname(self.current_gen_path)
+            filename = filepath_base + '/' + filename
+        if not os.path.exists(filename):
+            return None
+        with open(filename, "rb") as f:
+            return f.read()
 
-    def setup_collision(self, faces, filepath, alternative_mesh=None):
-        self.level_view.set_collision(faces, alternative_mesh)
+    def setup_collision(self, collision, filepath, alternative_mesh=None):
+        self.level_view.set_collision(collision, alternative_mesh)
         self.pathsconfig["collision"] = filepath
+        self.apply_hidden_collision_types()
+        # Only rebuilds the lookup structures if the hidden types changed while loading.
+        self.level_view.collision.set_visible_tris()
+        save_cfg(self.configuration)
+
+    def apply_hidden_collision_types(self):
         editor_config = self.configuration["editor"]
         hidden_coltypes = set(int(t) for t in editor_config.get("hidden_collision_types", "").split(",") if t)
         hidden_colgroups = set(int(t) for t in editor_config.get("hidden_collision_type_groups", "").split(",") if t)
@@ -1537,8 +1586,6 @@ class GenEditor(QtWidgets.QMainWindow):
         CollisionModel.hidden_colgroups = hidden_colgroups
 
         self.level_view.set_hidden_coltypes(hidden_coltypes, hidden_colgroups)
-        self.level_view.collision.set_visible_tris()
-        save_cfg(self.configuration)
 
     def button_open_add_item_window(self):
         self.next_checkpoint_start_position = None
@@ -2056,7 +2103,7 @@ class GenEditor(QtWidgets.QMainWindow):
         else:
             self.level_view.do_redraw()
             self.pik_control.update_info()
-            self.set_has_unsaved_changes(True)
+            self.set_has_unsaved_changes(True, changed_objects=self.level_view.selected)
 
     @catch_exception
     def action_move_objects_to(self, posx, posy, posz):
@@ -2076,7 +2123,7 @@ class GenEditor(QtWidgets.QMainWindow):
                                                   self.level_view.selected_positions)
         self.level_view.do_redraw()
         self.pik_control.update_info()
-        self.set_has_unsaved_changes(True)
+        self.set_has_unsaved_changes(True, changed_objects=self.level_view.selected)
 
     def action_stop_adding(self):
         self.points_added = 0
@@ -2241,7 +2288,7 @@ class GenEditor(QtWidgets.QMainWindow):
 
         #self.pikmin_gen_view.update()
         self.level_view.do_redraw()
-        self.set_has_unsaved_changes(True)
+        self.set_has_unsaved_changes(True, changed_objects=self.level_view.selected)
         self.pik_control.update_info()
 
     def action_scale_object(self, deltascale):
@@ -2268,26 +2315,31 @@ class GenEditor(QtWidgets.QMainWindow):
                 if deltascale.z > 0:
                     pos.z = (pos.z - orig_avg.z) *  deltascale.z + orig_avg.z
 
+        self.set_has_unsaved_changes(True, changed_objects=self.level_view.selected)
         self.action_update_info()
 
     def action_ground_objects(self, positions=None):
         selected = (positions is None)
+        from_selection = selected or positions is self.level_view.selected_positions
         if positions is None:
             positions = self.level_view.selected_positions
 
         if self.level_view.collision is None:
             return None
 
-        for pos in positions:
-            height = self.level_view.collision.collide_ray_closest(pos.x, pos.z, pos.y)
-            if height is not None:
-                pos.y = height
+        positions = list(positions)
+        heights = self.level_view.collision.collide_rays_closest(
+            numpy.array([(pos.x, pos.y, pos.z) for pos in positions], dtype=numpy.float64))
+        for pos, height in zip(positions, heights):
+            if not numpy.isnan(height):
+                pos.y = float(height)
 
         self.pik_control.update_info()
         if (selected):
             self.level_view.gizmo.move_to_average(self.level_view.selected,
                                                   self.level_view.selected_positions)
-        self.set_has_unsaved_changes(True)
+        self.set_has_unsaved_changes(
+            True, changed_objects=self.level_view.selected if from_selection else None)
         self.level_view.do_redraw()
 
     def action_delete_objects(self):
@@ -2594,7 +2646,15 @@ class GenEditor(QtWidgets.QMainWindow):
         self.change_selection(selected, positions, rotations)
 
 
+    def update_edited_objects(self, objects):
+        # Called by the data editors of the side panel after they changed `objects`.
+        self.level_view.invalidate_scene(objects, from_document=True)
+        self.update_3d()
+
     def update_3d(self):
+        # Most edits end with a call to update_3d().
+        self._document_edited = True
+        self._touched_objects = None
         self.level_view.gizmo.move_to_average(self.level_view.selected,
                                               self.level_view.selected_positions)
         self.level_view.do_redraw()
@@ -2665,9 +2725,10 @@ class GenEditor(QtWidgets.QMainWindow):
                                 objects.append("Camera {0}".format(i))
 
 
-                self.pik_control.set_info(currentobj, self.update_3d, objects)
+                self.pik_control.set_info(currentobj, lambda: self.update_edited_objects([currentobj]),
+                                           objects)
             else:
-                self.pik_control.set_info(currentobj, self.update_3d)
+                self.pik_control.set_info(currentobj, lambda: self.update_edited_objects([currentobj]))
 
 
             self.pik_control.update_info()
@@ -2675,10 +2736,12 @@ class GenEditor(QtWidgets.QMainWindow):
         elif len(selected) == 0:
 
             if self.leveldatatreeview.kartpoints.isSelected():
-                self.pik_control.set_info(self.leveldatatreeview.kartpoints.bound_to, self.update_3d)
+                kartpoints = self.leveldatatreeview.kartpoints.bound_to
+                self.pik_control.set_info(kartpoints, lambda: self.update_edited_objects([kartpoints]))
                 self.pik_control.update_info()
             elif self.leveldatatreeview.cameras.isSelected():
-                self.pik_control.set_info(self.leveldatatreeview.cameras.bound_to, self.update_3d)
+                cameras = self.leveldatatreeview.cameras.bound_to
+                self.pik_control.set_info(cameras, lambda: self.update_edited_objects([cameras]))
                 self.pik_control.update_info()
             elif self.leveldatatreeview.kmpheader.isSelected():
                 self.pik_control.set_info(self.level_file, self.update_3d)
@@ -2688,7 +2751,8 @@ class GenEditor(QtWidgets.QMainWindow):
 
         else:
 
-            self.pik_control.set_info_multiple(selected, self.update_3d)
+            self.pik_control.set_info_multiple(
+                selected, lambda: self.update_edited_objects(selected))
             #self.pik_control.reset_info("{0} objects selected".format(len(self.level_view.selected)))
             self.pik_control.set_objectlist(selected)
             self.pik_control.update_info()
@@ -2847,7 +2911,7 @@ class GenEditor(QtWidgets.QMainWindow):
                     display_string += f"   📏 {obj_pos.y - height:.2f}"
 
         self.statusbar.showMessage(display_string)
-        self.update_3d()
+        self.level_view.do_redraw()
 
     def action_connectedto_final(self):
         can_proceed = (self.level_view.connecting_mode) and (self.connect_start is not None)
@@ -3106,6 +3170,33 @@ class GenEditor(QtWidgets.QMainWindow):
     def change_area_type(self, obj, new_type):
         obj.change_type(new_type)
 
+def load_obj_collision(progress, filepath):
+    progress(0, "Reading collision")
+    with open(filepath, "rb") as f:
+        data = f.read()
+    obj = read_obj(TextIOWrapper(BytesIO(data)))
+
+    progress(30, "Reading model")
+    model = TexturedModel.from_obj_path(filepath, rotate=True, obj=obj)
+
+    # Only the collision is cached; the model is quickly rebuilt from the parsed file.
+    key = collision_cache.get_key(data, "obj")
+    arrays = collision_cache.read_cache(key)
+    if arrays is not None:
+        try:
+            return Collision.from_arrays(arrays), model
+        except KeyError:
+            pass
+
+    progress(60, "Building collision lookup")
+    faces = [group.triangles for group in obj.groups]
+    faces = numpy.concatenate(faces) if faces else numpy.zeros((0, 3), dtype=numpy.int64)
+    collision = Collision(obj.positions[faces])
+    collision_cache.write_cache(key, collision.get_arrays())
+
+    return collision, model
+
+
 def find_file(rarc_folder, ending):
     for filename in rarc_folder.files.keys():
         if filename.endswith(ending):
@@ -3132,7 +3223,8 @@ POTENTIALLY_EDITING_EVENTS = (
 
 class Application(QtWidgets.QApplication):
 
-    document_potentially_changed = QtCore.Signal()
+    # Whether the event was aimed at the map view.
+    document_potentially_changed = QtCore.Signal(bool)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -3146,11 +3238,20 @@ class Application(QtWidgets.QApplication):
             if isinstance(receiver, QtGui.QWindow):
                 disregardable = isinstance(self.focusWidget(), QtWidgets.QAbstractSpinBox)
                 if not disregardable or self._pending_focus_change:
+                    # Edits in the widget that had the focus before may not be recorded yet.
+                    in_map_view = (not self._pending_focus_change
+                                   and isinstance(self._get_event_widget(event), KMPMapViewer))
                     self._pending_focus_change = False
-                    QtCore.QTimer.singleShot(0, self.document_potentially_changed)
+                    QtCore.QTimer.singleShot(
+                        0, lambda: self.document_potentially_changed.emit(in_map_view))
 
         return super().notify(receiver, event)
 
+    def _get_event_widget(self, event: QtCore.QEvent) -> QtWidgets.QWidget:
+        if event.type() == QtCore.QEvent.MouseButtonRelease:
+            return self.widgetAt(event.globalPosition().toPoint())
+        return self.focusWidget()
+
     def _on_focus_changed(self, old: QtWidgets.QWidget, now: QtWidgets.QWidget):
         _ = old, now
         self._pending_focus_change = True
@@ -3199,7 +3300,7 @@ if __name__ == "__main__":
         editor_gui.setWindowIcon(QtGui.QIcon('resources/icon.ico'))
 
         app.document_potentially_changed.connect(
-            editor_gui.on_document_potentially_changed)
+            editor_gui.on_potentially_editing_event)
 
 
         editor_gui.show()
@@ -0,0 +1,91 @@
+"""
+Paints courses in the map view with every category visible, in the top-down and the 3D view,
+with PyOpenGL's error checking enabled, to check that drawing and caching the scene raises no GL
+errors. Run from the editor directory:
+
+    python kmp_paint_check.py course.kmp [course.kmp...]
+
+The exit code is 1 if painting any course raised an error.
+"""
+import sys
+
+import OpenGL
+# Must be set before the GL functions are imported.
+OpenGL.ERROR_CHECKING = True
+
+from OpenGL.GL import GL_NO_ERROR, glGetError
+
+from kmp_editor import Application, GenEditor
+from lib.libkmp import KMP
+
+PAINTS = 2
+
+
+def show_all(vismenu):
+    for entry in vismenu.get_entries():
+        entry.action_view_toggle.setChecked(True)
+        entry.action_viewplus_toggle.setChecked(True)
+        entry.action_select_toggle.setChecked(True)
+
+
+def paint(level_view, errors):
+    # The first paint records the cached categories, the following ones replay them.
+    for _ in range(PAINTS):
+        level_view.grabFramebuffer()
+
+    level_view.makeCurrent()
+    error = glGetError()
+    level_view.doneCurrent()
+    if error != GL_NO_ERROR:
+        errors.append("GL error 0x{0:X} after painting".format(error))
+
+
+def check_file(editor, filepath):
+    errors = []
+    # Exceptions raised in paintGL() are reported through the excepthook.
+    sys.excepthook = lambda cls, exception, traceback: errors.append(
+        "{0}: {1}".format(cls.__name__, exception))
+    try:
+        with open(filepath, "rb") as f:
+            kmp = KMP.from_file(f)
+        # Like GenEditor.setup_kmp_file(), without the dialog that lists the fixes.
+        kmp.fix_file()
+        editor.level_file = kmp
+        editor.level_view.level_file = kmp
+        editor.level_view.invalidate_scene()
+        show_all(editor.visibility_menu)
+
+        level_view = editor.level_view
+        level_view.change_from_3d_to_topdown()
+        paint(level_view, errors)
+        level_view.change_from_topdown_to_3d()
+        paint(level_view, errors)
+    finally:
+        sys.excepthook = sys.__excepthook__
+    return errors
+
+
+def main(args):
+    if not args:
+        print(__doc__.strip())
+        return 2
+
+    app = Application(sys.argv[:1])
+    editor = GenEditor()
+    editor.show()
+    app.processEvents()
+
+    failed = False
+    for filepath in args:
+        errors = check_file(editor, filepath)
+        print("{0}: {1}".format(filepath, "ok" if not errors else "failed"))
+        for error in errors:
+            print("    " + error)
+        failed = failed or bool(errors)
+
+    editor.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
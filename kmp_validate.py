@@ -0,0 +1,164 @@
+"""
+Checks KMP files for common errors without the editor's GUI, e.g. to validate whole directories of
+courses in a build pipeline. Runs the checks of the editor's error analyzer (see
+lib/kmp_analysis.py) on every file in parallel and writes a JSON report:
+
+    python kmp_validate.py tracks/ extra/course.kmp -o report.json
+
+Directories are searched for .kmp and .szs files. Course archives (.szs) are extracted with
+Wiimms SZS Tools (wszst), which must be on the PATH. The exit code is 0 if no problems were
+found, 1 if any file has problems and 2 if any file could not be checked.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, StringIO
+from contextlib import redirect_stdout
+
+EXTENSIONS = (".kmp", ".szs")
+EDITOR_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(EXTENSIONS):
+                        files.append(os.path.join(dirpath, filename))
+        else:
+            files.append(path)
+    return files
+
+
+def read_kmp_data(filepath):
+    if not filepath.lower().endswith(".szs"):
+        with open(filepath, "rb") as f:
+            return f.read()
+
+    # Every file is extracted into its own folder, as several are extracted at the same time.
+    with tempfile.TemporaryDirectory(prefix="kmp_validate") as dirpath:
+        outpath = os.path.join(dirpath, "szs")
+        result = subprocess.run(["wszst", "extract", filepath, "-d", outpath, "-o"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise RuntimeError("wszst could not extract the archive: " + result.stderr.strip())
+
+        kmp_path = os.path.join(outpath, "course.kmp")
+        if not os.path.exists(kmp_path):
+            raise RuntimeError("The archive does not contain a course.kmp.")
+        with open(kmp_path, "rb") as f:
+            return f.read()
+
+
+def validate_file(filepath):
+    """
+    Loads and checks the KMP or SZS file `filepath` and returns its report.
+    """
+    # libkmp reads its data files relative to the editor's directory when it is imported, which
+    # main() changes to first.
+    from lib.kmp_analysis import analyze_kmp_by_check
+    from lib.libkmp import KMP
+
+    report = {"path": filepath, "status": "ok", "load_fixes": [], "issues": []}
+    try:
+        data = read_kmp_data(filepath)
+
+        # Loading may print messages about the file, which would end up in the report's output.
+        with redirect_stdout(StringIO()):
+            kmp = KMP.from_file(BytesIO(data))
+            fixes = kmp.fix_file()
+            issues = analyze_kmp_by_check(kmp)
+    except Exception as e:
+        report["status"] = "error"
+        report["error"] = "{0}: {1}".format(type(e).__name__, e)
+        report["traceback"] = traceback.format_exc()
+        return report
+
+    report["load_fixes"] = [line.strip() for line in fixes.splitlines() if line.strip()]
+    report["issues"] = [{"check": name, "message": line} for name, line in issues]
+    if issues:
+        report["status"] = "issues"
+    return report
+
+
+def validate_files(filepaths, jobs=None):
+    """
+    Checks the files in `filepaths` in parallel and returns their reports in the same order.
+    """
+    if jobs == 1 or len(filepaths) < 2:
+        return [validate_file(filepath) for filepath in filepaths]
+
+    # Build the object parameter database once, instead of in every worker at the same time.
+    from lib.object_parameters import load_database
+    load_database()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(validate_file, filepaths, chunksize=4))
+
+
+def get_summary(reports):
+    summary = {"files": len(reports), "ok": 0, "issues": 0, "error": 0}
+    for report in reports:
+        summary[report["status"]] += 1
+    return summary
+
+
+def write_report(f, reports, format):
+    if format == "jsonl":
+        for report in reports:
+            f.write(json.dumps(report) + "\n")
+    elif format == "text":
+        for report in reports:
+            f.write("{0}: {1}\n".format(report["path"], report["status"]))
+            if report["status"] == "error":
+                f.write("    {0}\n".format(report["error"]))
+            for issue in report["issues"]:
+                f.write("    [{0}] {1}\n".format(issue["check"], issue["message"]))
+    else:
+        json.dump({"summary": get_summary(reports), "files": reports}, f, indent=2)
+        f.write("\n")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Checks KMP and SZS files for common errors.")
+    parser.add_argument("paths", nargs="+",
+                        help="KMP or SZS files, or directories to search for them.")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Path of the report. By default, it is written to the standard output.")
+    parser.add_argument("-f", "--format", default="json", choices=["json", "jsonl", "text"],
+                        help="Format of the report: one JSON document, one JSON object per file or "
+                        "plain text.")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of worker processes. Defaults to the number of CPUs.")
+    args = parser.parse_args(args)
+
+    filepaths = [os.path.abspath(path) for path in find_files(args.paths)]
+    output = os.path.abspath(args.output) if args.output is not None else None
+
+    # The object parameters that the checks need are looked up relative to the editor.
+    os.chdir(EDITOR_DIR)
+    reports = validate_files(filepaths, args.jobs)
+
+    if output is None:
+        write_report(sys.stdout, reports, args.format)
+    else:
+        with open(output, "w", encoding="utf-8") as f:
+            write_report(f, reports, args.format)
+
+    summary = get_summary(reports)
+    if summary["error"]:
+        return 2
+    return 1 if summary["issues"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,42 +1,81 @@
 import math
-from .vectors import Vector3, Vector3Mat, Triangle, Line
+from .vectors import Vector3, Line
 import numba
 import numpy
 
 class Collision(object):
     hidden_coltypes = set()
     hidden_colgroups = set()
-    def __init__(self, faces):
-        self.vertices = []
+    def __init__(self, triangles, materials=None, octree=None):
+        """
+        `triangles` is an N×3×3 array of triangle corners in KMP coordinates and `materials` holds
+        the N collision types (0xFFFF when not given). Everything is stored as NumPy arrays in the
+        editor's collision space, where a KMP position (x, y, z) becomes (x, -z, y).
+        """
+        triangles = numpy.asarray(triangles, dtype=numpy.float64).reshape(-1, 3, 3)
+        if materials is None:
+            materials = numpy.full(len(triangles), 0xFFFF, dtype=numpy.uint16)
+
+        corners = numpy.stack((triangles[..., 0], -triangles[..., 2], triangles[..., 1]), axis=-1)
+
+        # Shared corners are stored once; `faces` holds the vertex indices of every triangle.
+        vertices, faces = numpy.unique(corners.reshape(-1, 3), axis=0, return_inverse=True)
+
+        self._setup(materials, vertices, faces.reshape(-1, 3), corners, octree)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Recreates a collision from the arrays returned by `get_arrays()`, without building any of
+        its lookup structures again.
+        """
+        collision = cls.__new__(cls)
+        vertices = arrays["vertices"]
+        faces = arrays["faces"]
+        bvh_keys = sorted((key for key in arrays if key.startswith("octree_bvh_")),
+                          key=lambda key: int(key[len("octree_bvh_"):]))
+        octree_bvh = tuple(arrays[key] for key in bvh_keys) if bvh_keys else None
+        collision._setup(arrays["materials"], vertices, faces, vertices[faces],
+                         octree_bvh=octree_bvh)
+        return collision
+
+    def get_arrays(self):
+        """
+        Returns the arrays that make up the collision as a dict, e.g. for storing them on disk.
+        """
+        arrays = {
+            "materials": self.materials,
+            "vertices": self.vertices,
+            "faces": self.faces,
+        }
+        if self.octree_bvh is not None:
+            for i, array in enumerate(self.octree_bvh):
+                arrays["octree_bvh_{0}".format(i)] = array
+        return arrays
+
+    def _setup(self, materials, vertices, faces, corners, octree=None, octree_bvh=None):
+        self.materials = numpy.asarray(materials, dtype=numpy.uint16)
+        self.vertices = vertices
         self.faces = faces
-        self.triangles = []
-        self.face_centers = []
-        self.edge_centers = []
 
-        for face in self.faces:
-            v1, v2, v3 = face[0:3]
-            col_type = 0xFFFF
-            if len(face) > 3:
-                col_type = face[3]
-            v1 = Vector3Mat(v1.x, -v1.z, v1.y, col_type)
-            v2 = Vector3Mat(v2.x, -v2.z, v2.y, col_type)
-            v3 = Vector3Mat(v3.x, -v3.z, v3.y, col_type)
+        self.face_centers = corners.mean(axis=1)
+        self.edge_centers = (corners[:, (0, 0, 1)] + corners[:, (1, 2, 2)]) / 2.0
 
-            self.vertices.extend( (v1, v2, v3) )
+        # Degenerate faces can't be hit by a ray and are left out of the triangles.
+        normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        self.triangle_faces = numpy.flatnonzero(normals.any(axis=1))
+        self.triangles = corners[self.triangle_faces]
 
-            face_center = (v1 + v2 + v3) / 3.0
-            self.face_centers.append( Vector3Mat(face_center.x, face_center.y, face_center.z, col_type))
+        self.hash = hash((corners.tobytes(), self.materials.tobytes()))
 
-            for edge_center in ((v1 + v2) / 2.0, (v1 + v3) / 2.0, (v2 + v3) / 2.0):
-                self.edge_centers.append(Vector3Mat(edge_center.x, edge_center.y, edge_center.z, col_type))
-
-            triangle = Triangle(v1,v2,v3,col_type)
-            if not triangle.normal.is_zero():
-                self.triangles.append(triangle)
-
-        self.vertices = list(set(self.vertices))
-        self.hash = hash((tuple(self.vertices), tuple(faces)))
+        # When the faces come from a KCL file, its own octree is reused as the acceleration
+        # structure instead of building a new hierarchy.
+        self.octree = octree
+        self.octree_bvh = octree_bvh
+        if octree is not None:
+            self.octree_bvh = self._bvh_from_octree(octree)
 
+        self.hidden_types = None
         self.set_visible_tris()
         self.obj_meshes = {}
 
@@ -59,20 +98,62 @@ class Collision(object):
         dist2 = abs(y - result2.z)
         return result2.z if dist1 > dist2 else result1.z
 
+    def collide_rays_closest(self, positions):
+        """
+        Batched version of `collide_ray_closest()`. Takes an N×3 array of (x, y, z) positions in
+        KMP coordinates and returns an array with the N closest ground heights, or NaN where
+        neither the upwards nor the downwards ray hits anything.
+        """
+        positions = numpy.ascontiguousarray(positions, dtype=numpy.float64).reshape(-1, 3)
+        return _collide_rays_closest(positions, self.flat_triangles, *self.bvh)
+
+    def _bvh_from_octree(self, octree):
+        face_min = numpy.full((len(self.faces), 3), math.inf)
+        face_max = numpy.full((len(self.faces), 3), -math.inf)
+        face_min[self.triangle_faces] = self.triangles.min(axis=1)
+        face_max[self.triangle_faces] = self.triangles.max(axis=1)
+
+        return _build_bvh_from_octree(octree.nodes, octree.leaf_offsets, octree.leaf_triangles,
+                                      octree.root_count, face_min, face_max)
+
     def set_visible_tris(self):
-        self.flat_triangles = []
-        for t in self.triangles:
-            if self.is_invisible_tri(t.material):
-                continue
-            self.flat_triangles.extend((t.origin.x, t.origin.y, t.origin.z, t.p2.x, t.p2.y, t.p2.z,
-                                        t.p3.x, t.p3.y, t.p3.z))
-        self.flat_triangles = numpy.array(self.flat_triangles)
+        # The lookup structures only depend on the hidden collision types, so they are kept until
+        # those change.
+        hidden_types = (frozenset(self.__class__.hidden_coltypes),
+                        frozenset(self.__class__.hidden_colgroups))
+        if hidden_types == self.hidden_types:
+            return
+        self.hidden_types = hidden_types
+
+        self.visible_faces = ~self.is_invisible_tri(self.materials)
+        self._visible_points = {}
+
+        visible_triangles = self.visible_faces[self.triangle_faces]
+        visible_faces = self.triangle_faces[visible_triangles]
+        self.flat_triangles = numpy.ascontiguousarray(self.triangles[visible_triangles].reshape(-1))
+
+        if self.octree_bvh is not None:
+            # The octree lists faces; point its leaves at the visible triangles instead. The extra
+            # trailing entry maps the -1 placeholders (and hidden faces) to -1.
+            face_to_triangle = numpy.full(len(self.faces) + 1, -1, dtype=numpy.int64)
+            face_to_triangle[visible_faces] = numpy.arange(len(visible_faces))
+            self.bvh = self.octree_bvh[:-1] + (face_to_triangle[self.octree_bvh[-1]], )
+        else:
+            # The hierarchy only covers the visible triangles, so it needs to be rebuilt whenever
+            # the hidden collision types change.
+            self.bvh = _build_bvh(self.flat_triangles)
 
     def is_invisible_tri(self, face_mat):
-        return ( face_mat in self.__class__.hidden_coltypes) or ( face_mat & 0x1F in self.__class__.hidden_colgroups)
+        """
+        Works on a single collision type as well as on an array of them.
+        """
+        hidden_coltypes = list(self.__class__.hidden_coltypes)
+        hidden_colgroups = list(self.__class__.hidden_colgroups)
+        return (numpy.isin(face_mat, hidden_coltypes)
+                | numpy.isin(numpy.bitwise_and(face_mat, 0x1F), hidden_colgroups))
 
     def collide_ray(self, ray):
-        place_at = _collide_ray_and_triangles(
+        place_at = _collide_ray_and_bvh(
             ray.origin.x,
             ray.origin.y,
             ray.origin.z,
@@ -80,6 +161,7 @@ class Collision(object):
             ray.direction.y,
             ray.direction.z,
             self.flat_triangles,
+            *self.bvh,
         )
 
         if math.isnan(place_at[0]):
@@ -87,44 +169,52 @@ class Collision(object):
 
         return Vector3(*place_at)
 
+    def _get_visible_points(self, kind):
+        # The snapping points are queried on every mouse move, so they are only gathered once per
+        # visibility change.
+        points = self._visible_points.get(kind)
+        if points is None:
+            if kind == "edge_centers":
+                points = self.edge_centers[self.visible_faces].reshape(-1, 3)
+            elif kind == "face_centers":
+                points = self.face_centers[self.visible_faces]
+            else:
+                points = self.vertices[numpy.unique(self.faces[self.visible_faces])]
+            points = numpy.ascontiguousarray(points)
+            points.flags.writeable = False
+            self._visible_points[kind] = points
+        return points
+
     def get_edge_centers(self):
-        return [center for center in self.edge_centers if not self.is_invisible_tri(center.mat)]
+        return self._get_visible_points("edge_centers")
 
     def get_face_centers(self):
-        return [center for center in self.face_centers if not self.is_invisible_tri(center.mat)]
+        return self._get_visible_points("face_centers")
 
     def get_vertices(self):
-        return [center for center in self.vertices if not self.is_invisible_tri(center.mat)]
+        return self._get_visible_points("vertices")
 
     def get_triangles(self):
-        return [center for center in self.triangles if not self.is_invisible_tri(center.material)]
+        return self.triangles[self.visible_faces[self.triangle_faces]]
 
     @staticmethod
     def get_closest_point(ray, points):
-        distances_and_points = []
-        tuple_points = [(point.x, point.y, point.z) for point in points]
-        for point in tuple_points:
-            try:
-                distance = _distance_between_line_and_point(
-                    ray.origin.x,
-                    ray.origin.y,
-                    ray.origin.z,
-                    ray.direction.x,
-                    ray.direction.y,
-                    ray.direction.z,
-                    *point
-                )
-            except Exception:
-                continue
-            if distance is not math.nan:
-                distances_and_points.append((distance, point))
+        points = numpy.ascontiguousarray(points, dtype=numpy.float64).reshape(-1, 3)
+        index = _closest_point_to_line(
+            ray.origin.x,
+            ray.origin.y,
+            ray.origin.z,
+            ray.direction.x,
+            ray.direction.y,
+            ray.direction.z,
+            points,
+        )
 
-        if not distances_and_points:
+        if index < 0:
             return None
 
-        _distance, closest_point = min(distances_and_points)
-        return Vector3(*closest_point)
-    
+        return Vector3(*points[index].tolist())
+
 @numba.jit(nopython=True, nogil=True, cache=True)
 def cross(
     x0: float,
@@ -203,6 +293,30 @@ def _distance_between_line_and_point(
     return length(*cross(*p1_to_p2, *p3_to_p1)) / length(*p1_to_p2)
 
 
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _closest_point_to_line(
+    x: float,
+    y: float,
+    z: float,
+    dx: float,
+    dy: float,
+    dz: float,
+    points: numpy.ndarray,
+) -> int:
+    closest_index = -1
+    if dx == 0.0 and dy == 0.0 and dz == 0.0:
+        return closest_index
+
+    closest_distance = math.inf
+    for i in range(points.shape[0]):
+        distance = _distance_between_line_and_point(x, y, z, dx, dy, dz, points[i, 0],
+                                                    points[i, 1], points[i, 2])
+        if distance < closest_distance:
+            closest_distance = distance
+            closest_index = i
+    return closest_index
+
+
 @numba.jit(nopython=True, nogil=True, cache=True)
 def _collide_ray_and_triangle(
     x: float,
@@ -244,40 +358,294 @@ def _collide_ray_and_triangle(
     return -1, 0.0, 0.0, 0.0
 
 
+# Maximum number of triangles stored in a leaf node of the bounding volume hierarchy.
+BVH_LEAF_SIZE = 4
+
+# Upper bound for the depth of a hierarchy, used to size the traversal stack. Nodes are split at
+# the median, so the depth is logarithmic in the number of triangles; KCL octrees are shallower.
+BVH_MAX_DEPTH = 64
+
+
 @numba.jit(nopython=True, nogil=True, cache=True)
-def _collide_ray_and_triangles(
+def _build_bvh(triangles: numpy.array):
+    """
+    Builds a bounding volume hierarchy over the flat triangle array (nine floats per triangle).
+
+    Returns the node bounds, the index of the first child of each inner node (-1 for leaves)
+    and its number of children, the range of each leaf in the triangle order array, and the
+    triangle order array itself. The children of an inner node are always stored next to each
+    other and after their parent.
+    """
+    count = len(triangles) // 9
+
+    tri_min = numpy.empty((count, 3))
+    tri_max = numpy.empty((count, 3))
+    centroids = numpy.empty((count, 3))
+    for t in range(count):
+        for axis in range(3):
+            a = triangles[t * 9 + axis]
+            b = triangles[t * 9 + 3 + axis]
+            c = triangles[t * 9 + 6 + axis]
+            tri_min[t, axis] = min(a, b, c)
+            tri_max[t, axis] = max(a, b, c)
+            centroids[t, axis] = (a + b + c) / 3.0
+
+    order = numpy.arange(count)
+
+    max_nodes = max(1, 2 * count)
+    node_min = numpy.zeros((max_nodes, 3))
+    node_max = numpy.zeros((max_nodes, 3))
+    node_child = numpy.full(max_nodes, -1, dtype=numpy.int64)
+    node_child_count = numpy.zeros(max_nodes, dtype=numpy.int64)
+    node_start = numpy.zeros(max_nodes, dtype=numpy.int64)
+    node_count = numpy.zeros(max_nodes, dtype=numpy.int64)
+    nodes_used = 1
+
+    stack = [(0, 0, count)]
+    while stack:
+        node, start, end = stack.pop()
+
+        if end > start:
+            for axis in range(3):
+                node_min[node, axis] = math.inf
+                node_max[node, axis] = -math.inf
+            for i in range(start, end):
+                t = order[i]
+                for axis in range(3):
+                    node_min[node, axis] = min(node_min[node, axis], tri_min[t, axis])
+                    node_max[node, axis] = max(node_max[node, axis], tri_max[t, axis])
+
+        node_start[node] = start
+        node_count[node] = end - start
+        if end - start <= BVH_LEAF_SIZE:
+            continue
+
+        # Split along the axis in which the triangle centroids are spread the most.
+        split_axis = 0
+        split_extent = -1.0
+        for axis in range(3):
+            lowest = math.inf
+            highest = -math.inf
+            for i in range(start, end):
+                value = centroids[order[i], axis]
+                lowest = min(lowest, value)
+                highest = max(highest, value)
+            if highest - lowest > split_extent:
+                split_axis = axis
+                split_extent = highest - lowest
+
+        keys = numpy.empty(end - start)
+        for i in range(start, end):
+            keys[i - start] = centroids[order[i], split_axis]
+        order[start:end] = order[start:end][numpy.argsort(keys)]
+
+        mid = (start + end) // 2
+        node_child[node] = nodes_used
+        node_child_count[node] = 2
+        node_count[node] = 0
+        stack.append((nodes_used, start, mid))
+        stack.append((nodes_used + 1, mid, end))
+        nodes_used += 2
+
+    return (node_min[:nodes_used], node_max[:nodes_used], node_child[:nodes_used],
+            node_child_count[:nodes_used], node_start[:nodes_used], node_count[:nodes_used], order)
+
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _build_bvh_from_octree(
+    nodes: numpy.array,
+    leaf_offsets: numpy.array,
+    leaf_triangles: numpy.array,
+    root_count: int,
+    face_min: numpy.array,
+    face_max: numpy.array,
+):
+    """
+    Converts a KCL octree (see `KCLOctree`) into the same node layout that `_build_bvh()`
+    produces. A virtual node is added as the parent of all the root cells, and the bounds of each
+    node are taken from the triangles it contains, so no triangle is missed even when it extends
+    beyond its octree cell. The returned order array still refers to faces.
+    """
+    node_total = len(nodes) + 1
+    node_min = numpy.full((node_total, 3), math.inf)
+    node_max = numpy.full((node_total, 3), -math.inf)
+    node_child = numpy.full(node_total, -1, dtype=numpy.int64)
+    node_child_count = numpy.zeros(node_total, dtype=numpy.int64)
+    node_start = numpy.zeros(node_total, dtype=numpy.int64)
+    node_count = numpy.zeros(node_total, dtype=numpy.int64)
+
+    node_child[0] = 1
+    node_child_count[0] = root_count
+
+    for i in range(len(nodes)):
+        node = i + 1
+        value = nodes[i]
+        if value >= 0:
+            node_child[node] = value + 1
+            node_child_count[node] = 8
+            continue
+
+        leaf = ~value
+        node_start[node] = leaf_offsets[leaf]
+        node_count[node] = leaf_offsets[leaf + 1] - leaf_offsets[leaf]
+        for j in range(leaf_offsets[leaf], leaf_offsets[leaf + 1]):
+            face = leaf_triangles[j]
+            if face < 0:
+                continue
+            for axis in range(3):
+                node_min[node, axis] = min(node_min[node, axis], face_min[face, axis])
+                node_max[node, axis] = max(node_max[node, axis], face_max[face, axis])
+
+    # Children always come after their parent, so walking backwards sees them first.
+    for node in range(node_total - 1, -1, -1):
+        child = node_child[node]
+        if child < 0:
+            continue
+        for c in range(child, child + node_child_count[node]):
+            for axis in range(3):
+                node_min[node, axis] = min(node_min[node, axis], node_min[c, axis])
+                node_max[node, axis] = max(node_max[node, axis], node_max[c, axis])
+
+    return (node_min, node_max, node_child, node_child_count, node_start, node_count,
+            leaf_triangles)
+
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _clip_ray_to_slab(
+    origin: float,
+    direction: float,
+    lowest: float,
+    highest: float,
+    near: float,
+    far: float,
+) -> tuple[float, float]:
+    if direction == 0.0:
+        if origin < lowest or origin > highest:
+            return math.inf, -math.inf
+        return near, far
+    t0 = (lowest - origin) / direction
+    t1 = (highest - origin) / direction
+    if t0 > t1:
+        t0, t1 = t1, t0
+    return max(near, t0), min(far, t1)
+
+
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _ray_hits_box(
     x: float,
     y: float,
     z: float,
     dx: float,
     dy: float,
     dz: float,
-    triangles: numpy.array,
-) -> tuple[float, float, float]:
-    collisions = []
-    for t in range(len(triangles) // 9):
-        collision = _collide_ray_and_triangle(
-            x,
-            y,
-            z,
-            dx,
-            dy,
-            dz,
-            triangles[t * 9 + 0],
-            triangles[t * 9 + 1],
-            triangles[t * 9 + 2],
-            triangles[t * 9 + 3],
-            triangles[t * 9 + 4],
-            triangles[t * 9 + 5],
-            triangles[t * 9 + 6],
-            triangles[t * 9 + 7],
-            triangles[t * 9 + 8],
-        )
-
-        if collision[0] >= 0.0:
-            collisions.append(collision)
+    box_min: numpy.array,
+    box_max: numpy.array,
+    max_distance: float,
+) -> bool:
+    near, far = _clip_ray_to_slab(x, dx, box_min[0], box_max[0], 0.0, max_distance)
+    if near > far:
+        return False
+    near, far = _clip_ray_to_slab(y, dy, box_min[1], box_max[1], near, far)
+    if near > far:
+        return False
+    near, far = _clip_ray_to_slab(z, dz, box_min[2], box_max[2], near, far)
+    return near <= far
 
-    if collisions:
-        return min(collisions)[1:]
 
-    return math.nan, math.nan, math.nan
\ No newline at end of file
+@numba.jit(nopython=True, nogil=True, cache=True)
+def _collide_ray_and_bvh(
+    x: float,
+    y: float,
+    z: float,
+    dx: float,
+    dy: float,
+    dz: float,
+    triangles: numpy.array,
+    node_min: numpy.array,
+    node_max: numpy.array,
+    node_child: numpy.array,
+    node_child_count: numpy.array,
+    node_start: numpy.array,
+    node_count: numpy.array,
+    order: numpy.array,
+) -> tuple[float, float, float]:
+    closest = (math.inf, math.nan, math.nan, math.nan)
+
+    if len(order) == 0:
+        return closest[1:]
+
+    stack = numpy.empty(node_child_count[0] + 8 * BVH_MAX_DEPTH, dtype=numpy.int64)
+    stack[0] = 0
+    stack_size = 1
+    while stack_size > 0:
+        stack_size -= 1
+        node = stack[stack_size]
+
+        if not _ray_hits_box(x, y, z, dx, dy, dz, node_min[node], node_max[node], closest[0]):
+            continue
+
+        child = node_child[node]
+        if child >= 0:
+            for c in range(child, child + node_child_count[node]):
+                stack[stack_size] = c
+                stack_size += 1
+            continue
+
+        for i in range(node_start[node], node_start[node] + node_count[node]):
+            t = order[i]
+            if t < 0:
+                continue
+            collision = _collide_ray_and_triangle(
+                x,
+                y,
+                z,
+                dx,
+                dy,
+                dz,
+                triangles[t * 9 + 0],
+                triangles[t * 9 + 1],
+                triangles[t * 9 + 2],
+                triangles[t * 9 + 3],
+                triangles[t * 9 + 4],
+                triangles[t * 9 + 5],
+                triangles[t * 9 + 6],
+                triangles[t * 9 + 7],
+                triangles[t * 9 + 8],
+            )
+
+            if collision[0] >= 0.0 and collision < closest:
+                closest = collision
+
+    return closest[1:]
+
+
+@numba.jit(nopython=True, nogil=True, parallel=True, cache=True)
+def _collide_rays_closest(
+    positions: numpy.array,
+    triangles: numpy.array,
+    node_min: numpy.array,
+    node_max: numpy.array,
+    node_child: numpy.array,
+    node_child_count: numpy.array,
+    node_start: numpy.array,
+    node_count: numpy.array,
+    order: numpy.array,
+) -> numpy.array:
+    heights = numpy.empty(len(positions))
+    for i in numba.prange(len(positions)):
+        x = positions[i, 0]
+        y = -positions[i, 2]
+        z = positions[i, 1]
+        down = _collide_ray_and_bvh(x, y, z, 0.0, 0.0, -1.0, triangles, node_min, node_max,
+                                    node_child, node_child_count, node_start, node_count,
+                                    order)[2]
+        up = _collide_ray_and_bvh(x, y, z, 0.0, 0.0, 1.0, triangles, node_min, node_max,
+                                  node_child, node_child_count, node_start, node_count,
+                                  order)[2]
+        if math.isnan(down):
+            heights[i] = up
+        elif math.isnan(up):
+            heights[i] = down
+        else:
+            heights[i] = up if abs(z - down) > abs(z - up) else down
+    return heights
@@ -0,0 +1,84 @@
+"""
+On-disk cache of loaded collision, so that opening the same course again skips parsing the
+collision file and building its lookup structures. Entries hold the arrays of the `Collision`
+and the vertex data of its model in an uncompressed .npz file next to the editor's config.
+
+Entries are keyed by the size and a hash of the file contents rather than its modification
+time, as the files of a course archive are written anew every time the archive is extracted.
+
+The collision of map objects (see model_cache.py) is cached in a directory of its own, so that
+the many small object models of a course do not push the course collision out of the cache.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy
+
+CACHE_DIR = "collision_cache"
+CACHE_VERSION = 1
+MAX_ENTRIES = 32
+OBJECT_CACHE_DIR = os.path.join(CACHE_DIR, "objects")
+MAX_OBJECT_ENTRIES = 256
+
+
+def get_key(data, kind):
+    return "{0}-{1}-{2}-{3}".format(kind, CACHE_VERSION, len(data), hashlib.sha1(data).hexdigest())
+
+
+def read_cache(key, dirpath=CACHE_DIR):
+    """
+    Returns the arrays stored for `key` as a dict, or None if there are none.
+    """
+    path = os.path.join(dirpath, key + ".npz")
+    try:
+        with numpy.load(path, allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+    # The least recently used entries are the first to be removed.
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return arrays
+
+
+def write_cache(key, arrays, dirpath=CACHE_DIR, max_entries=MAX_ENTRIES):
+    try:
+        os.makedirs(dirpath, exist_ok=True)
+
+        # Entries may be written from several threads; they only appear once they are complete.
+        fd, temppath = tempfile.mkstemp(suffix=".tmp", dir=dirpath)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                numpy.savez(f, **arrays)
+            os.replace(temppath, os.path.join(dirpath, key + ".npz"))
+        except BaseException:
+            os.remove(temppath)
+            raise
+
+        _remove_old_entries(dirpath, max_entries)
+    except OSError as e:
+        print("Could not write collision cache:", str(e))
+
+
+def _remove_old_entries(dirpath, max_entries):
+    entries = []
+    with os.scandir(dirpath) as scanned:
+        for entry in scanned:
+            if entry.name.endswith(".npz"):
+                try:
+                    entries.append((entry.stat().st_mtime_ns, entry.path))
+                except OSError:
+                    pass
+
+    entries.sort(reverse=True)
+    for _mtime, path in entries[max_entries:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,121 @@
+"""
+Loading of the course collision on a worker thread, so that the editor stays responsive (and the
+KMP editable) while a collision file is parsed and its acceleration structures are built. Only
+the finished `Collision` and model are handed to the GUI thread, which creates their GL buffers
+once they are first drawn.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy
+from PySide6 import QtCore
+
+from . import collision_cache
+from .collision import Collision
+from .libkcl import RacetrackCollision
+from .model_rendering import CollisionModel
+
+
+def load_kcl_collision(progress, data, cache_dir=collision_cache.CACHE_DIR,
+                       max_cache_entries=collision_cache.MAX_ENTRIES):
+    key = collision_cache.get_key(data, "kcl")
+    arrays = collision_cache.read_cache(key, cache_dir)
+    if arrays is not None:
+        progress(50, "Reading cached collision")
+        try:
+            return (Collision.from_arrays(arrays),
+                    CollisionModel.from_vertex_data(arrays["model_vertex_data"],
+                                                    arrays["model_ranges"]))
+        except KeyError:
+            pass
+
+    progress(0, "Reading collision")
+    kcl_coll = RacetrackCollision()
+    kcl_coll.load_file(BytesIO(data))
+
+    progress(40, "Building collision model")
+    model = CollisionModel(kcl_coll)
+
+    progress(60, "Building collision lookup")
+    collision = Collision(kcl_coll.triangle_vertices, kcl_coll.triangle_types, kcl_coll.octree)
+
+    progress(90, "Caching collision")
+    arrays = collision.get_arrays()
+    arrays["model_vertex_data"] = model.vertex_data
+    arrays["model_ranges"] = numpy.array(model.ranges, dtype=numpy.int64).reshape(-1, 3)
+    collision_cache.write_cache(key, arrays, cache_dir, max_cache_entries)
+
+    return collision, model
+
+
+class CollisionLoader(QtCore.QObject):
+    """
+    Runs collision loading jobs in the background. A job is called as `job(progress, *args)`,
+    reports its progress by calling `progress(percent, text)` and returns the `Collision` and the
+    model that displays it.
+
+    Only the most recently started job is reported; starting a new job (e.g. because another
+    course was opened) makes the loader ignore the result of the previous one.
+    """
+    progress = QtCore.Signal(int, str)
+    loaded = QtCore.Signal(object, object, str)
+    failed = QtCore.Signal(str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="CollisionLoader")
+        self._future = None
+        self._token = None
+        self._filepath = None
+        self._progress = (0, "")
+        self._reported_progress = None
+
+        # The worker thread only stores its state; it is reported from the GUI thread.
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(50)
+        self._timer.timeout.connect(self._poll)
+
+    def is_loading(self):
+        return self._future is not None
+
+    def start(self, filepath, job, *args):
+        if self._future is not None:
+            self._future.cancel()
+
+        token = self._token = object()
+
+        def set_progress(percent, text):
+            # A job that was replaced by a newer one may still be running until it finishes.
+            if token is self._token:
+                self._progress = (percent, text)
+
+        self._filepath = filepath
+        self._progress = (0, "")
+        self._reported_progress = None
+        self._future = self._executor.submit(job, set_progress, *args)
+        self._timer.start()
+        self._poll()
+
+    def _poll(self):
+        future = self._future
+        if future is None:
+            self._timer.stop()
+            return
+
+        if not future.done():
+            if self._progress != self._reported_progress:
+                self._reported_progress = self._progress
+                self.progress.emit(*self._progress)
+            return
+
+        self._future = None
+        self._timer.stop()
+
+        try:
+            collision, model = future.result()
+        except Exception as e:
+            self.failed.emit(self._filepath, str(e))
+        else:
+            self.progress.emit(100, "")
+            self.loaded.emit(collision, model, self._filepath)
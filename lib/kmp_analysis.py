@@ -0,0 +1,200 @@
+"""
+Checks for common errors in KMP files. They are shared by the error analyzer of the editor and the
+command-line validator (kmp_validate.py), so nothing here may depend on Qt or OpenGL.
+
+Every check is called as `check(kmp, write_line)` on a fixed up `KMP` (see `KMP.fix_file()`) and
+reports every problem it finds as a line of text.
+"""
+from .libkmp import get_kmp_name
+from .undo import get_reachable_ids
+
+
+def check_kartpoints(kmp, write_line):
+    #ktpt testing
+    #check number
+    num_kartpoints = len(kmp.kartpoints)
+    if num_kartpoints == 0:
+        write_line("WARNING: There are no starting points.")
+    elif num_kartpoints > 2 and num_kartpoints < 12:
+        write_line("There are {0} starting points.".format(num_kartpoints))
+    elif num_kartpoints > 12:
+        write_line("There are {0} starting points. Battle stages use 12".format(num_kartpoints))
+
+    player_ids = {}
+    for i, point in enumerate(kmp.kartpoints):
+        id = point.playerid
+        if id in player_ids:
+            player_ids[id].append(i)
+        else:
+            player_ids[id] = [i]
+
+    #check for ids outside of the -1 to 11 range
+    #check for reused ids
+    for id in player_ids:
+        num_with_id = len(player_ids[id])
+        if id == 255 and num_with_id > 2:
+            write_line("There are {0} starting points with id 255 : {1}. Normally there is one, but LE-CODE supports two.".format(num_with_id, player_ids[255]))
+        elif num_with_id > 1 and id != 255:
+            write_line("There are {0} starting points with id {1} : {2}.".format(num_with_id, id, player_ids[id]))
+
+
+def check_enemypoints(kmp, write_line):
+    #check enemy poitns
+    if len(kmp.enemypointgroups.groups) == 0:
+        write_line("You need at least one enemy point group!")
+    """
+    else:
+        for group in kmp.enemypointgroups.groups:
+            if len(group.points) == 1 and (group in group.next or group in group.prev):
+                write_line("There is a self-linked enemy group. Oh no!")"""
+    #check for unreachable groups
+
+
+def check_object_routes(kmp, write_line):
+    #check for empty (and used!) routes
+    """
+    for i, group in enumerate(kmp.routes):
+
+        if len(group.used_by) > 0 :
+            if len(group.points) == 0:
+                write_line("Route {0} is used, but does not have any points".format( i ))
+            elif len(group.points) == 1:
+                write_line("Route {0} is used, but only has one point".format( i ))
+        if len(group.points) == 2 and group.smooth != 0:
+            write_line("Route {0} has two points, but is set to smooth".format( i ))
+    """
+    # Validate path id in objects
+    for object in kmp.objects:
+        if object.route_info() > 0 and object.route_obj is None:
+            write_line("Object {0} needs a route.".format( get_kmp_name(object.objectid)))
+
+
+def check_replay_cameras(kmp, write_line):
+    # Check camera indices in areas
+    for i, area in enumerate(kmp.replayareas):
+        if area.camera is None:
+            write_line("Area {0} needs a connected camera".format(i))
+
+
+def check_checkpoints_convex(kmp, write_line):
+    for gindex, group in enumerate(kmp.checkpoints.groups):
+        if len(group.points) > 1:
+            for i in range(1, len(group.points)):
+                c1 = group.points[i-1]
+                c2 = group.points[i]
+
+                if check_box_convex(c1, c2):
+                    write_line("Quad formed by checkpoints {0} and {1} in checkpoint group {2} isn't convex.".format(
+                                i-1, i, gindex
+                            ))
+
+
+def check_box_convex(c1, c2):
+    lastsign = None
+    for p1, mid, p3 in ((c1.start, c2.start, c2.end),
+                        (c2.start, c2.end, c1.end),
+                        (c2.end, c1.end, c1.start),
+                        (c1.end, c1.start, c2.start)):
+        side1 = p1 - mid
+        side2 = p3 - mid
+        prod = side1.x * side2.z - side2.x * side1.z
+        if lastsign is None:
+            lastsign = prod > 0
+        else:
+            if not (lastsign == (prod > 0)):
+                return True
+
+
+class Rule(object):
+    """
+    A check along with the sections of the KMP it reads, as the names of the `KMP` attributes that
+    hold them. The results of a rule can only change when an object that is reachable from one of
+    its sections changes.
+    """
+
+    def __init__(self, name, sections, check):
+        self.name = name
+        self.sections = sections
+        self.check = check
+
+
+# The rules in the order their results are reported.
+RULES = (
+    Rule("kartpoints", ("kartpoints", ), check_kartpoints),
+    Rule("enemypoints", ("enemypointgroups", ), check_enemypoints),
+    Rule("object_routes", ("objects", ), check_object_routes),
+    Rule("replay_cameras", ("replayareas", ), check_replay_cameras),
+    Rule("checkpoints_convex", ("checkpoints", ), check_checkpoints_convex),
+)
+
+
+def analyze_kmp_by_check(kmp) -> 'list[tuple[str, str]]':
+    """
+    Runs all checks on `kmp` and returns the problems found as (check name, line) tuples.
+    """
+    results = []
+    for rule in RULES:
+        rule.check(kmp, lambda line, name=rule.name: results.append((name, line)))
+    return results
+
+
+def analyze_kmp(kmp) -> 'list[str]':
+    return [line for _name, line in analyze_kmp_by_check(kmp)]
+
+
+class IncrementalAnalyzer(object):
+    """
+    Runs the rules on a document over and over as it is edited, keeping the results of every rule
+    until one of the objects of its sections changes.
+    """
+
+    def __init__(self, rules=RULES):
+        self.rules = rules
+        self.document = None
+
+        # The object of every section and the ids of the objects reachable from it, by name.
+        self.section_objects = {}
+        # The lines reported by every rule, by name.
+        self.results = {}
+
+    def reset(self):
+        self.document = None
+        self.section_objects.clear()
+        self.results.clear()
+
+    def analyze(self, kmp, changed=None) -> 'list[str]':
+        """
+        Returns the problems found in `kmp`, like `analyze_kmp()`. `changed` holds the ids of all
+        objects that changed since the previous call, e.g. the changes of an undo entry; only the
+        rules that read any of them are run again. If it is None, or `kmp` is another document,
+        all rules are run.
+        """
+        if changed is None or kmp is not self.document:
+            self.reset()
+            self.document = kmp
+
+        try:
+            changed_sections = set()
+            for rule in self.rules:
+                for section in rule.sections:
+                    if section in changed_sections:
+                        continue
+                    root = getattr(kmp, section)
+                    cached = self.section_objects.get(section)
+                    if cached is None or cached[0] is not root or not cached[1].isdisjoint(changed):
+                        self.section_objects[section] = (root, get_reachable_ids(root))
+                        changed_sections.add(section)
+
+            lines = []
+            for rule in self.rules:
+                if rule.name not in self.results or changed_sections.intersection(rule.sections):
+                    rule_lines = []
+                    rule.check(kmp, rule_lines.append)
+                    self.results[rule.name] = rule_lines
+                lines.extend(self.results[rule.name])
+        except Exception:
+            # The sections are already marked as up to date, even for rules that did not run.
+            self.reset()
+            raise
+
+        return lines
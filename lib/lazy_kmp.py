@@ -0,0 +1,439 @@
+"""
+Section-level lazy loading of KMP files, for tools that only look at a few sections of many
+courses.
+
+A `LazyKMP` only indexes the section offsets of the header when it is opened. The objects of a
+section are read the first time its attribute is accessed, in the form `KMP.from_file()` reads
+them, i.e. before `KMP.fix_file()` links them to each other: references between sections stay
+indices (`MapObject.route`, `Area.cameraid`, `Checkpoint.respawnid`, ...).
+
+When written, sections that were never accessed and sections whose objects still encode to what
+was read are copied from the original file byte-for-byte, as are sections the editor does not
+know about. Only modified sections are encoded anew, with the `to_row()` of their objects like
+`KMP.write()` does, so e.g. the selection state in the lowest bit of x is cleared.
+"""
+from functools import cached_property
+from io import BytesIO
+from struct import Struct, error as StructError, pack
+
+from .libkmp import (
+    Area, Areas, Camera, Cameras, CannonPoint, Checkpoint, CheckpointGroups, ColorRGB, EnemyPoint,
+    EnemyPointGroups, ItemPoint, ItemPointGroups, JugemPoint, KartStartPoint, KartStartPoints, KMP,
+    MapObject, MapObjects, MissionPoint, ObjectContainer, PointGroup, Route, read_entries,
+    write_entries)
+
+HEADER = Struct(">4sIHHI")
+SECTION_HEADER = Struct(">4sHH")
+FLOAT = Struct(">f")
+
+# The sections of the header, in the order of their offsets.
+SECTION_MAGICS = (b"KTPT", b"ENPT", b"ENPH", b"ITPT", b"ITPH", b"CKPT", b"CKPH", b"GOBJ", b"POTI",
+                  b"AREA", b"CAME", b"JGPT", b"CNPT", b"MSPT", b"STGI")
+
+# The attributes of a `LazyKMP` and the header sections each of them is read from.
+SECTIONS = (
+    ("kartpoints", (0, )),
+    ("enemypointgroups", (1, 2)),
+    ("itempointgroups", (3, 4)),
+    ("checkpoints", (5, 6)),
+    ("objects", (7, )),
+    ("routes", (8, )),
+    ("areas", (9, )),
+    ("cameras", (10, )),
+    ("respawnpoints", (11, )),
+    ("cannonpoints", (12, )),
+    ("missionpoints", (13, )),
+    ("stage_info", (14, )),
+)
+
+
+class StageInfo(object):
+    """
+    The contents of the STGI section, which `KMP` spreads over several of its attributes.
+    """
+    STRUCT = Struct(">BBBBB3BBB2s")
+
+    def __init__(self):
+        self.lap_count = 3
+        self.pole_position = 0
+        self.start_squeeze = 0
+        self.lens_flare = 1
+        self.flare_color = ColorRGB(255, 255, 255)
+        self.flare_alpha = 0x32
+        self.speed_modifier = 0
+        self.unknowns = (0, 0)
+
+    @classmethod
+    def from_row(cls, row):
+        info = cls()
+        (info.lap_count, info.pole_position, info.start_squeeze, info.lens_flare, unknown1, r, g, b,
+         info.flare_alpha, unknown2, speed) = row
+        info.flare_color = ColorRGB(r, g, b)
+        info.speed_modifier = FLOAT.unpack(speed + b"\x00\x00")[0]
+        info.unknowns = (unknown1, unknown2)
+        return info
+
+    def to_row(self):
+        color = self.flare_color
+        return (self.lap_count, self.pole_position, self.start_squeeze, self.lens_flare,
+                self.unknowns[0], color.r, color.g, color.b, self.flare_alpha, self.unknowns[1],
+                FLOAT.pack(self.speed_modifier)[0:2])
+
+
+class ReadIndices(object):
+    """
+    Stands in for the `IndexMap`s that `to_row()` resolves references with, for references that
+    are still the indices that were read.
+    """
+
+    def find(self, index):
+        return index
+
+    def index(self, index):
+        return index
+
+
+READ_INDICES = ReadIndices()
+
+
+# The linked objects keep the indices of their references, which these resolve to when written.
+class ReadMapObject(MapObject):
+    def set_route(self, routes):
+        return self.route
+
+
+class ReadArea(Area):
+    def set_camera(self, cameras):
+        return self.cameraid
+
+    def set_route(self, routes):
+        return self.route
+
+    def find_enemypoint(self, enemypoints):
+        return self.enemypointid
+
+
+class ReadCamera(Camera):
+    @classmethod
+    def from_row(cls, row):
+        cam = super().from_row(row)
+        # The type stays the one of the file, so both kinds of positions are the ones read.
+        cam.position2_simple = cam.position2_player = cam.position2
+        cam.position3_simple = cam.position3_player = cam.position3
+        return cam
+
+    def to_kmp_type(self):
+        return self.type
+
+    def set_nextcam(self, cameras):
+        return self.nextcam
+
+    def set_route(self, routes):
+        return self.route
+
+
+def encode_section(magic, count, value, struct, rows):
+    f = BytesIO()
+    f.write(SECTION_HEADER.pack(magic, count, value))
+    write_entries(f, struct, rows)
+    return f.getvalue()
+
+
+def encode_groups(magic, groups):
+    rows = []
+    start = 0
+    for group in groups:
+        # The links are the indices that were read, including the 0xFF of unused ones.
+        rows.append(group.to_row(start, READ_INDICES))
+        start += len(group.points)
+    return encode_section(magic, len(groups), 0, PointGroup.STRUCT, rows)
+
+
+class LazyKMP(object):
+    """
+    A KMP file whose sections are read on first access. See the module documentation.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+
+        magic, _size, section_count, self.header_len, self.version = HEADER.unpack_from(data)
+        assert magic == b"RKMD"
+        assert section_count >= len(SECTION_MAGICS)
+
+        self.offsets = Struct(">{0}I".format(section_count)).unpack_from(data, HEADER.size)
+        body_end = len(data) - self.header_len
+
+        # Every section extends up to the next one, so that padding between sections is kept.
+        # Sections that share their offset with an earlier one are aliases of it.
+        ordered = sorted(range(section_count), key=lambda i: (self.offsets[i], i))
+        starts = sorted(set(self.offsets)) + [body_end]
+        self.order = []
+        self.aliases = {}
+        self.raw = {}
+        for i in ordered:
+            offset = self.offsets[i]
+            if self.order and self.offsets[self.order[-1]] == offset:
+                self.aliases[i] = self.order[-1]
+                continue
+            end = starts[starts.index(offset) + 1]
+            self.raw[i] = self.data[self.header_len + offset: self.header_len + end]
+            self.order.append(i)
+
+        # Anything between the offsets and the first section.
+        self.prefix = self.data[HEADER.size + section_count * 4:
+                                self.header_len + min(self.offsets, default=0)]
+
+        # The encoding of every section when it was read, to tell whether it was modified.
+        self.read_encodings = {}
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'LazyKMP':
+        return cls(data)
+
+    @classmethod
+    def from_file(cls, f):
+        return cls(f.read())
+
+    def is_loaded(self, name):
+        return name in self.__dict__
+
+    def get_section(self, index):
+        """
+        Returns a file positioned at the start of the header section `index`.
+        """
+        raw = self.raw[self.aliases.get(index, index)]
+        assert bytes(raw[0:4]) == SECTION_MAGICS[index]
+        return BytesIO(raw)
+
+    def get_section_pair(self, index, entry_struct):
+        """
+        Returns a file positioned at the start of the point section `index`, followed directly by
+        its group section, as `EnemyPointGroups.from_file()` and the like expect them.
+        """
+        points = self.get_section(index)
+        _magic, count, _ = SECTION_HEADER.unpack(points.read(SECTION_HEADER.size))
+        points_size = SECTION_HEADER.size + count * entry_struct.size
+        groups = self.get_section(index + 1).getvalue()
+        return BytesIO(points.getvalue()[:points_size] + groups)
+
+    def read_section(self, index):
+        f = self.get_section(index)
+        _magic, count, value = SECTION_HEADER.unpack(f.read(SECTION_HEADER.size))
+        return f, count, value
+
+    def loaded(self, name, value):
+        self.__dict__[name] = value
+        try:
+            self.read_encodings[name] = self.encode(name)
+        except StructError:
+            # Values the editor cannot write, which KMP.write() fails on as well.
+            self.read_encodings[name] = None
+        return value
+
+    @cached_property
+    def kartpoints(self):
+        f, count, self.kartpoints_value = self.read_section(0)
+        return self.loaded("kartpoints", KartStartPoints.from_file(f, count))
+
+    @cached_property
+    def enemypointgroups(self):
+        f = self.get_section_pair(1, EnemyPoint.STRUCT)
+        return self.loaded("enemypointgroups", EnemyPointGroups.from_file(f))
+
+    @cached_property
+    def itempointgroups(self):
+        f = self.get_section_pair(3, ItemPoint.STRUCT)
+        return self.loaded("itempointgroups", ItemPointGroups.from_file(f))
+
+    @cached_property
+    def checkpoints(self):
+        f = self.get_section_pair(5, Checkpoint.STRUCT)
+        return self.loaded("checkpoints", CheckpointGroups.from_file(f, None))
+
+    @cached_property
+    def objects(self):
+        f, count, _ = self.read_section(7)
+        objects = MapObjects()
+        objects.extend(read_entries(f, count, ReadMapObject))
+        return self.loaded("objects", objects)
+
+    @cached_property
+    def routes(self):
+        f, count, _ = self.read_section(8)
+        return self.loaded("routes", ObjectContainer.from_file(f, count, Route))
+
+    @cached_property
+    def areas(self):
+        f, count, _ = self.read_section(9)
+        areas = Areas()
+        areas.extend(read_entries(f, count, ReadArea))
+        return self.loaded("areas", areas)
+
+    @cached_property
+    def cameras(self):
+        f, count, value = self.read_section(10)
+        cameras = Cameras(read_entries(f, count, ReadCamera))
+        cameras.startcamid = value >> 8
+        return self.loaded("cameras", cameras)
+
+    @cached_property
+    def respawnpoints(self):
+        f, count, _ = self.read_section(11)
+        return self.loaded("respawnpoints", ObjectContainer(read_entries(f, count, JugemPoint)))
+
+    @cached_property
+    def cannonpoints(self):
+        f, count, _ = self.read_section(12)
+        return self.loaded("cannonpoints", ObjectContainer(read_entries(f, count, CannonPoint)))
+
+    @cached_property
+    def missionpoints(self):
+        f, count, _ = self.read_section(13)
+        missionpoints = ObjectContainer(read_entries(f, count, MissionPoint))
+        # Mission points do not set up their selection state, which `to_row()` reads.
+        missionpoints.set_selected(False)
+        return self.loaded("missionpoints", missionpoints)
+
+    @cached_property
+    def stage_info(self):
+        f, count, self.stage_info_value = self.read_section(14)
+        self.stage_info_count = count
+        row = StageInfo.STRUCT.unpack(f.read(StageInfo.STRUCT.size))
+        return self.loaded("stage_info", StageInfo.from_row(row))
+
+    def encode(self, name):
+        """
+        Returns the contents of the header sections of the attribute `name`, encoded from its
+        objects.
+        """
+        return getattr(self, "encode_" + name)()
+
+    def encode_kartpoints(self):
+        rows = [point.to_row() for point in self.kartpoints]
+        return [encode_section(b"KTPT", len(rows), self.kartpoints_value, KartStartPoint.STRUCT,
+                               rows)]
+
+    def encode_enemypointgroups(self):
+        groups = self.enemypointgroups.groups
+        rows = [point.to_row() for group in groups for point in group.points]
+        return [encode_section(b"ENPT", len(rows), 0, EnemyPoint.WRITE_STRUCT, rows),
+                encode_groups(b"ENPH", groups)]
+
+    def encode_itempointgroups(self):
+        groups = self.itempointgroups.groups
+        rows = [point.to_row() for group in groups for point in group.points]
+        return [encode_section(b"ITPT", len(rows), 0, ItemPoint.STRUCT, rows),
+                encode_groups(b"ITPH", groups)]
+
+    def encode_checkpoints(self):
+        groups = self.checkpoints.groups
+        rows = []
+        key = 0
+        for group in groups:
+            for point in group.points:
+                row, key = point.to_row(point.prev, point.next, key)
+                rows.append(row)
+        return [encode_section(b"CKPT", len(rows), 0, Checkpoint.STRUCT, rows),
+                encode_groups(b"CKPH", groups)]
+
+    def encode_objects(self):
+        rows = [obj.to_row(READ_INDICES) for obj in self.objects]
+        return [encode_section(b"GOBJ", len(rows), 0, MapObject.STRUCT, rows)]
+
+    def encode_routes(self):
+        f = BytesIO()
+        f.write(SECTION_HEADER.pack(b"POTI", len(self.routes),
+                                    sum(len(route.points) for route in self.routes)))
+        for route in self.routes:
+            route.write(f)
+        return [f.getvalue()]
+
+    def encode_areas(self):
+        rows = [area.to_row(READ_INDICES, READ_INDICES, READ_INDICES) for area in self.areas]
+        return [encode_section(b"AREA", len(rows), 0, Area.WRITE_STRUCT, rows)]
+
+    def encode_cameras(self):
+        rows = [camera.to_row(READ_INDICES, READ_INDICES) for camera in self.cameras]
+        return [encode_section(b"CAME", len(rows), (self.cameras.startcamid & 0xFF) << 8,
+                               Camera.WRITE_STRUCT, rows)]
+
+    def encode_respawnpoints(self):
+        # The ids of respawn points are not read; like KMP.write(), they are numbered anew.
+        rows = [point.to_row(i) for i, point in enumerate(self.respawnpoints)]
+        return [encode_section(b"JGPT", len(rows), 0, JugemPoint.WRITE_STRUCT, rows)]
+
+    def encode_cannonpoints(self):
+        rows = [point.to_row() for point in self.cannonpoints]
+        return [encode_section(b"CNPT", len(rows), 0, CannonPoint.STRUCT, rows)]
+
+    def encode_missionpoints(self):
+        # `to_row()` writes the id it is given, which are kept as they were read.
+        rows = [point.to_row(point.mission_id) for point in self.missionpoints]
+        return [encode_section(b"MSPT", len(rows), 0, MissionPoint.STRUCT, rows)]
+
+    def encode_stage_info(self):
+        row = self.stage_info.to_row()
+        return [encode_section(b"STGI", self.stage_info_count, self.stage_info_value,
+                               StageInfo.STRUCT, [row])]
+
+    def get_modified_sections(self):
+        """
+        Returns the new contents of the header sections of modified attributes by index.
+        """
+        sections = {}
+        for name, indices in SECTIONS:
+            if not self.is_loaded(name):
+                continue
+            try:
+                encoded = self.encode(name)
+            except StructError:
+                if self.read_encodings[name] is None:
+                    # Sections that could not be encoded when they were read are copied.
+                    continue
+                raise
+            if encoded != self.read_encodings[name]:
+                sections.update(zip(indices, encoded))
+        return sections
+
+    def write(self, f):
+        modified = self.get_modified_sections()
+
+        start = f.tell()
+        f.write(HEADER.pack(b"RKMD", 0, len(self.offsets), self.header_len, self.version))
+        offsets_off = f.tell()
+        f.write(b"\x00" * 4 * len(self.offsets))
+        f.write(self.prefix)
+
+        offsets = [0] * len(self.offsets)
+        body_start = start + self.header_len
+        for i in self.order:
+            offsets[i] = f.tell() - body_start
+            f.write(modified.get(i, self.raw[i]))
+
+        # Aliases of a section keep pointing at it, unless they were modified themselves.
+        for i, target in self.aliases.items():
+            if i in modified:
+                offsets[i] = f.tell() - body_start
+                f.write(modified[i])
+            else:
+                offsets[i] = offsets[target]
+
+        end = f.tell()
+        f.seek(start + 4)
+        f.write(pack(">I", end - start))
+        f.seek(offsets_off)
+        f.write(pack(">{0}I".format(len(offsets)), *offsets))
+        f.seek(end)
+
+    def to_bytes(self) -> bytes:
+        f = BytesIO()
+        self.write(f)
+        return f.getvalue()
+
+    def to_kmp(self) -> KMP:
+        """
+        Returns the file as a `KMP`, with all sections read and linked for editing.
+        """
+        return KMP.from_bytes(self.to_bytes())
+
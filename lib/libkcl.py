@@ -1,5 +1,6 @@
 # Python 3 necessary
 from struct import unpack
+import numpy
 from .vectors import Vector3
 
 def read_int16(f):
@@ -17,6 +18,106 @@ def read_float(f):
 def read_uint32_triple(f):
     return unpack(">III", f.read(12))
 
+
+PRISM_DTYPE = numpy.dtype([
+    ("length", ">f4"),
+    ("vertex", ">u2"),
+    ("direction", ">u2"),
+    ("normal_a", ">u2"),
+    ("normal_b", ">u2"),
+    ("normal_c", ">u2"),
+    ("collision_type", ">u2"),
+])
+
+
+class KCLOctree(object):
+    """
+    Compact array form of the spatial index stored in a KCL file.
+
+    `nodes` holds every node of the octree, with the root cells first. A non-negative value is
+    the index of the first of the node's eight children; a negative value `~i` marks a leaf whose
+    triangles are `leaf_triangles[leaf_offsets[i]:leaf_offsets[i + 1]]`. Triangle indices refer
+    to `RacetrackCollision.triangles`, or are -1 for prisms that could not be turned into a
+    triangle.
+    """
+    def __init__(self, area_min, area_masks, shifts, nodes, leaf_offsets, leaf_triangles):
+        self.area_min = area_min
+        self.area_masks = area_masks
+        self.coord_shift, self.y_shift, self.z_shift = shifts
+
+        self.nodes = nodes
+        self.leaf_offsets = leaf_offsets
+        self.leaf_triangles = leaf_triangles
+
+    @property
+    def root_count(self):
+        x_count, y_count, z_count = (((~mask & 0xFFFFFFFF) >> self.coord_shift) + 1
+                                     for mask in self.area_masks)
+        return x_count * y_count * z_count
+
+    @classmethod
+    def from_data(cls, data, spatial_offset, area_min, area_masks, shifts, prism_to_triangle):
+        octree = cls(area_min, area_masks, shifts, None, None, None)
+        root_count = octree.root_count
+
+        words = numpy.frombuffer(data, dtype=">u4", count=len(data) // 4).astype(numpy.int64)
+        halfwords = numpy.frombuffer(data, dtype=">u2", count=len(data) // 2)
+
+        # The tree is walked one level at a time. For every node of the current level, the byte
+        # offset of its value and of the block it belongs to (branch and leaf offsets are
+        # relative to the start of the block) are known.
+        node_values = []
+        leaf_nodes = []
+        leaf_list_offsets = []
+        value_offsets = spatial_offset + 4 * numpy.arange(root_count, dtype=numpy.int64)
+        block_offsets = numpy.full(root_count, spatial_offset, dtype=numpy.int64)
+        first_index = 0
+        while len(value_offsets):
+            values = words[value_offsets // 4]
+            is_leaf = (values & 0x80000000) != 0
+            level = numpy.empty(len(values), dtype=numpy.int64)
+
+            leaf_nodes.append(first_index + numpy.flatnonzero(is_leaf))
+            leaf_list_offsets.append(block_offsets[is_leaf] + (values[is_leaf] & 0x7FFFFFFF))
+
+            child_blocks = block_offsets[~is_leaf] + values[~is_leaf]
+            next_index = first_index + len(values)
+            level[~is_leaf] = next_index + 8 * numpy.arange(len(child_blocks))
+            node_values.append(level)
+
+            value_offsets = (child_blocks[:, None] + 4 * numpy.arange(8)).ravel()
+            block_offsets = numpy.repeat(child_blocks, 8)
+            first_index = next_index
+
+        nodes = numpy.concatenate(node_values)
+        leaf_nodes = numpy.concatenate(leaf_nodes)
+        list_offsets, leaf_ids = numpy.unique(numpy.concatenate(leaf_list_offsets),
+                                              return_inverse=True)
+        nodes[leaf_nodes] = ~leaf_ids.reshape(-1)
+
+        # Each leaf offset points to the halfword right before its list of 1-based triangle
+        # indices, which is terminated by a zero.
+        starts = (list_offsets + 2) // 2
+        terminators = numpy.flatnonzero(halfwords[spatial_offset // 2:] == 0) + spatial_offset // 2
+        ends = terminators[numpy.searchsorted(terminators, starts)]
+        lengths = ends - starts
+
+        leaf_offsets = numpy.zeros(len(starts) + 1, dtype=numpy.int64)
+        numpy.cumsum(lengths, out=leaf_offsets[1:])
+        entries = (numpy.repeat(starts - leaf_offsets[:-1], lengths)
+                   + numpy.arange(leaf_offsets[-1], dtype=numpy.int64))
+        prisms = halfwords[entries].astype(numpy.int64) - 1
+
+        # Prisms that fall outside of the triangle section map to -1 too.
+        prism_to_triangle = numpy.append(prism_to_triangle, -1)
+        prisms[(prisms < 0) | (prisms >= len(prism_to_triangle) - 1)] = -1
+
+        octree.nodes = nodes
+        octree.leaf_offsets = leaf_offsets
+        octree.leaf_triangles = prism_to_triangle[prisms]
+        return octree
+
+
 class RacetrackCollision(object):
     def __init__(self):
         self._data = None
@@ -24,8 +125,21 @@ class RacetrackCollision(object):
         self.entrycount = 0
 
         self.grids = []
-        self.triangles = []
         self.vertices = []
+        self.octree = None
+
+        # Triangle corners (N×3×3) and collision types (N), as decoded from the prisms.
+        self.triangle_vertices = numpy.empty((0, 3, 3), dtype=numpy.float32)
+        self.triangle_types = numpy.empty(0, dtype=numpy.uint16)
+
+    @property
+    def triangles(self):
+        """
+        The triangles as (v1, v2, v3, collision type) tuples of `Vector3`s.
+        """
+        return [(Vector3(*v1), Vector3(*v2), Vector3(*v3), coltype)
+                for (v1, v2, v3), coltype in zip(self.triangle_vertices.tolist(),
+                                                 self.triangle_types.tolist())]
 
     def load_file(self, f):
 
@@ -38,55 +152,50 @@ class RacetrackCollision(object):
         triangles_offset = read_uint32(f) + 0x10
         spatial_offset = read_uint32(f)
 
+        _thickness = read_float(f)
+        area_min = (read_float(f), read_float(f), read_float(f))
+        area_masks = read_uint32_triple(f)
+        shifts = read_uint32_triple(f)
 
-        # parse vertices
-        f.seek(vertices_offset)
-        vertices = []
         vertices_count = (normals_offset - vertices_offset) // 0xC
-        for i in range(vertices_count):
-            vertices.append( Vector3(*unpack(">fff", f.read(12))) )
-
-        # parse normals
-        f.seek(normals_offset)
-        normals = []
         normals_count = (triangles_offset - normals_offset) // 0xC
-        for i in range(normals_count):
-            normals.append( Vector3(*unpack(">fff", f.read(12))) )
-        
-        # Parse triangles
-        f.seek(triangles_offset)
         trianglescount = (spatial_offset - triangles_offset) // 0x10
-        
-
-        for i in range(trianglescount):
-            length = read_float(f)
-            v1_index = read_uint16(f)
-            dir_index = read_uint16(f)
-            norma_index = read_uint16(f)
-            normb_index = read_uint16(f)
-            normc_index = read_uint16(f)
-
-            collision_type = read_uint16(f)
-
-            assert(v1_index < vertices_count)
-            assert(dir_index < normals_count)
-            assert(norma_index < normals_count)
-            assert(normb_index < normals_count)
-            assert(normc_index < normals_count)
-
-            v1 = vertices[v1_index]
-            direc = normals[dir_index]
-            norma = normals[norma_index]
-            normb = normals[normb_index]
-            normc = normals[normc_index]
-
-            crossa = norma.cross(direc)
-            crossb = normb.cross(direc)
-
-            if crossb.dot(normc) != 0 and crossa.dot(normc) != 0:
-                v2 = v1 + crossb * (length / crossb.dot(normc))
-                #check for float division by zero
-                v3 = v1 + crossa * (length / crossa.dot(normc))
-
-                self.triangles.append((v1,v2,v3, collision_type))
+
+        vertices = numpy.frombuffer(data, dtype=">f4", count=vertices_count * 3,
+                                    offset=vertices_offset).reshape(-1, 3).astype(numpy.float64)
+        normals = numpy.frombuffer(data, dtype=">f4", count=normals_count * 3,
+                                   offset=normals_offset).reshape(-1, 3).astype(numpy.float64)
+        prisms = numpy.frombuffer(data, dtype=PRISM_DTYPE, count=trianglescount,
+                                  offset=triangles_offset)
+
+        assert (prisms["vertex"] < vertices_count).all()
+        for field in ("direction", "normal_a", "normal_b", "normal_c"):
+            assert (prisms[field] < normals_count).all()
+
+        # Rebuild the two remaining corners of every prism in one go.
+        v1 = vertices[prisms["vertex"]]
+        direc = normals[prisms["direction"]]
+        normc = normals[prisms["normal_c"]]
+        crossa = numpy.cross(normals[prisms["normal_a"]], direc)
+        crossb = numpy.cross(normals[prisms["normal_b"]], direc)
+        dota = (crossa * normc).sum(axis=1)
+        dotb = (crossb * normc).sum(axis=1)
+
+        #check for float division by zero
+        valid = (dota != 0) & (dotb != 0)
+        length = prisms["length"][valid].astype(numpy.float64)[:, None]
+        v1 = v1[valid]
+        v2 = v1 + crossb[valid] * (length / dotb[valid][:, None])
+        v3 = v1 + crossa[valid] * (length / dota[valid][:, None])
+
+        self.triangle_vertices = numpy.ascontiguousarray(numpy.stack((v1, v2, v3), axis=1),
+                                                         dtype=numpy.float32)
+        self.triangle_types = numpy.ascontiguousarray(prisms["collision_type"][valid],
+                                                      dtype=numpy.uint16)
+
+        prism_to_triangle = numpy.full(trianglescount, -1, dtype=numpy.int64)
+        prism_to_triangle[valid] = numpy.arange(len(self.triangle_types))
+
+        self.octree = KCLOctree.from_data(data, spatial_offset, area_min, area_masks, shifts,
+                                          prism_to_triangle)
 
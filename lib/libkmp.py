@@ -1,8 +1,10 @@
 import json
 from numpy import arctan, argmin, array
-from struct import unpack, pack
+from struct import unpack, pack, Struct
 from .vectors import Vector3, Vector2, Rotation, Vector3Relative
+from .object_parameters import load_database
 from collections import OrderedDict
+from types import MappingProxyType
 from io import BytesIO
 from copy import deepcopy, copy
 from itertools import chain
@@ -61,10 +63,66 @@ def read_string(f):
     return string
 
 
+def read_rows(f, count, struct):
+    """
+    Reads `count` consecutive entries laid out as `struct` in a single read and returns an
+    iterator over their unpacked values.
+    """
+    return struct.iter_unpack(f.read(struct.size * count))
+
+
+def read_entries(f, count, objcls):
+    """
+    Reads `count` consecutive entries of `objcls`, whose `STRUCT` describes the layout of an
+    entry, and builds them with `objcls.from_row()`.
+    """
+    return [objcls.from_row(row) for row in read_rows(f, count, objcls.STRUCT)]
+
+
+def write_entries(f, struct, rows):
+    """
+    Writes one entry laid out as `struct` for each of the `rows` of values, packed into a single
+    buffer.
+    """
+    buffer = bytearray(struct.size * len(rows))
+    for i, row in enumerate(rows):
+        struct.pack_into(buffer, i * struct.size, *row)
+    f.write(buffer)
+
+
 def write_uint16(f, val):
     f.write(pack(">H", val))
 
 
+class IndexMap(dict):
+    """
+    The positions of the objects in a sequence, by object identity. Built once per write, so that
+    references between entries are resolved with a lookup instead of a search through the list.
+    """
+    def __init__(self, objects):
+        super().__init__()
+        for i, obj in enumerate(objects):
+            self.setdefault(id(obj), i)
+
+    def find(self, obj):
+        """
+        Returns the position of `obj`, or -1 if it is not in the sequence.
+        """
+        return self.get(id(obj), -1)
+
+    def index(self, obj):
+        """
+        Returns the position of `obj`. Raises ValueError if it is not in the sequence.
+        """
+        try:
+            return self[id(obj)]
+        except KeyError:
+            raise ValueError("{0!r} is not in the sequence".format(obj)) from None
+
+
+FLOAT = Struct(">f")
+UINT32 = Struct(">L")
+
 PADDING = b"This is padding data to align"
 
 
@@ -152,14 +210,20 @@ class PositionedObject(object):
         self.position = position
         self.selected = False
 
-    def write_position(self, f):
+    def get_file_position(self):
+        """
+        Returns the position as it is written to the file, with the selection state stored in the
+        lowest bit of x.
+        """
         if self.selected:
-            modified_int = unpack('>L', pack('>f', self.position.x))[0] | 0x1
+            modified_int = UINT32.unpack(FLOAT.pack(self.position.x))[0] | 0x1
         else:
-            modified_int = unpack('>L', pack('>f', self.position.x))[0] & 0xFFFFFFFE
-        modified_float = unpack( '>f', pack('>L', modified_int))[0]
-        modified_position = Vector3(modified_float, self.position.y, self.position.z)
-        modified_position.write(f)
+            modified_int = UINT32.unpack(FLOAT.pack(self.position.x))[0] & 0xFFFFFFFE
+        modified_float = FLOAT.unpack(UINT32.pack(modified_int))[0]
+        return modified_float, self.position.y, self.position.z
+
+    def write_position(self, f):
+        f.write(pack(">fff", *self.get_file_position()))
 
     def set_selected_from_float(self):
         hex_value = unpack('>l', pack('>f', self.position.x))[0]
@@ -234,11 +298,40 @@ class KMPPoint(PositionedObject):
         super().__init__(position)
 
 class PointGroup(object):
+    # start point, point count, previous groups, next groups
+    STRUCT = Struct(">BB6s6s2x")
+
     def __init__(self):
         self.points = []
         self.prevgroup = []
         self.nextgroup = []
 
+    @classmethod
+    def from_file(cls, f, idx, points):
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)), idx, points)
+
+    @classmethod
+    def from_row(cls, row, idx, points):
+        start_idx, length, prevgroup, nextgroup = row
+        group = cls()
+        group.id = idx
+        group.prevgroup = list(prevgroup)
+        group.nextgroup = list(nextgroup)
+
+        for i in range(start_idx, start_idx + length):
+            group.points.append(points[i])
+
+        return group
+
+    def to_row(self, start_idx, groups):
+        """
+        Returns the values of the group's entry. `start_idx` is the index of its first point and
+        `groups` the `IndexMap` of all groups, which unused links are padded with 0xFF for.
+        """
+        prevgroup = bytes(groups.index(grp) for grp in self.prevgroup).ljust(6, b"\xFF")
+        nextgroup = bytes(groups.index(grp) for grp in self.nextgroup).ljust(6, b"\xFF")
+        return start_idx, len(self.points), prevgroup, nextgroup
+
     def insert_point(self, enemypoint, index=-1):
         self.points.insert(index, enemypoint)
 
@@ -537,6 +630,9 @@ class ELineControl():
 
 
 class EnemyPoint(KMPPoint):
+    STRUCT = Struct(">ffffHBB")
+    WRITE_STRUCT = Struct(">ffffHbB")
+
     def __init__(self,
                  position,
                  scale,
@@ -559,22 +655,20 @@ class EnemyPoint(KMPPoint):
 
     @classmethod
     def from_file(cls, f):
-        point = cls.new()
-        point.position = Vector3.from_file(f)
-        point.scale = read_float(f)
-        point.enemyaction = read_uint16(f)
-        point.enemyaction2 = read_uint8(f)
-        point.unknown = read_uint8(f)
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
 
-        return point
+    @classmethod
+    def from_row(cls, row):
+        x, y, z, scale, enemyaction, enemyaction2, unknown = row
+        return cls(Vector3(x, y, z), scale, enemyaction, enemyaction2, unknown)
 
 
-    def write(self, f):
+    def to_row(self):
+        return (*self.get_file_position(), self.scale, self.enemyaction, self.enemyaction2,
+                self.unknown)
 
-        self.write_position(f)
-        f.write(pack(">f", self.scale ) )
-        f.write(pack(">H", self.enemyaction) )
-        f.write(pack(">bB", self.enemyaction2, self.unknown) )
+    def write(self, f):
+        f.write(self.WRITE_STRUCT.pack(*self.to_row()))
 
     def copy(self):
         return deepcopy(self)
@@ -603,23 +697,6 @@ class EnemyPointGroup(PointGroup):
     def new(cls):
         return cls()
 
-    @classmethod
-    def from_file(cls, f, idx, points):
-        group = cls()
-        group.id = idx
-        start_idx = read_uint8(f)
-        len = read_uint8(f)
-
-
-        group.prevgroup = list(unpack(">BBBBBB", f.read(6)) )
-        group.nextgroup = list(unpack(">BBBBBB", f.read(6)) )
-        f.read( 2)
-
-        for i in range(start_idx, start_idx + len):
-            group.points.append(points[i])
-
-        return group
-
     def copy_group(self):
         group = EnemyPointGroup()
         return super().copy_group( group)
@@ -628,26 +705,6 @@ class EnemyPointGroup(PointGroup):
         group = EnemyPointGroup()
         return super().copy_group_after(point, group)
 
-    def write_points_enpt(self, f):
-        for point in self.points:
-            point.write(f)
-        return len(self.points)
-
-    def write_enph(self, f, index, groups):
-        f.write(pack(">B", index) )
-        f.write(pack(">B", len(self.points) ) )
-        for grp in self.prevgroup:
-           f.write(pack(">B", groups.get_idx(grp)))
-        for i in range( 6 - len(self.prevgroup) ):
-           f.write(pack(">b", -1))
-
-        for grp in self.nextgroup:
-           f.write(pack(">B", groups.get_idx(grp)))
-        for i in range( 6 - len(self.nextgroup) ):
-           f.write(pack(">b", -1))
-
-        f.write(pack(">H",  0) )
-
 class EnemyPointGroups(PointGroups):
     level_file = None
     def __init__(self):
@@ -684,56 +741,45 @@ class EnemyPointGroups(PointGroups):
         f.read(2)
 
 
-        all_points = []
         #read the enemy points
-        for i in range(count):
-            enemypoint = EnemyPoint.from_file(f)
-            all_points.append(enemypoint)
+        all_points = read_entries(f, count, EnemyPoint)
 
         assert f.read(4) == b"ENPH"
         count = read_uint16(f)
         f.read(2)
 
-
-        for i in range(count):
-            enemypath = EnemyPointGroup.from_file(f, i, all_points)
+        for i, row in enumerate(read_rows(f, count, EnemyPointGroup.STRUCT)):
+            enemypath = EnemyPointGroup.from_row(row, i, all_points)
             enemypointgroups.groups.append(enemypath)
 
         return enemypointgroups
 
     def write(self, f):
-
+        points = list(self.points())
+        if len(points) > 0xFF:
+            raise Exception("too many enemy points")
 
         f.write(b"ENPT")
-        count_offset = f.tell()
-        f.write(pack(">H", 0) ) # will be overridden later
-        f.write(pack(">H", 0) )
+        f.write(pack(">HH", len(points), 0) )
+        write_entries(f, EnemyPoint.WRITE_STRUCT, [point.to_row() for point in points])
 
-        sum_points = 0
-        point_indices = []
-
-        for group in self.groups:
-            point_indices.append(sum_points)
-            sum_points += group.write_points_enpt(f)
         enph_offset = f.tell()
-
-        if sum_points > 0xFF:
-            raise Exception("too many enemy points")
-        else:
-            f.seek(count_offset)
-            f.write(pack(">H", sum_points) )
-
-        f.seek(enph_offset)
         f.write(b"ENPH")
-        f.write(pack(">H", len(self.groups) ) )
-        f.write(pack(">H", 0) )
+        f.write(pack(">HH", len(self.groups), 0) )
 
-        for idx, group in enumerate( self.groups ):
-            group.write_enph(f, point_indices[idx], self)
+        groups = IndexMap(self.groups)
+        rows = []
+        sum_points = 0
+        for group in self.groups:
+            rows.append(group.to_row(sum_points, groups))
+            sum_points += len(group.points)
+        write_entries(f, PointGroup.STRUCT, rows)
 
         return enph_offset
 
 class ItemPoint(KMPPoint):
+    STRUCT = Struct(">ffffHH")
+
     def __init__(self, position, scale, setting1, setting2) :
         super().__init__(position)
         self.scale = scale
@@ -754,25 +800,22 @@ class ItemPoint(KMPPoint):
 
     @classmethod
     def from_file(cls, f):
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
 
-        point = cls.new()
-
-        point.position = Vector3.from_file(f)
-        point.scale = read_float(f)
-        point.setting1 = read_uint16(f)
-        point.set_setting2(read_uint16(f))
-
-        return point
-
-
-    def write(self, f):
+    @classmethod
+    def from_row(cls, row):
+        x, y, z, scale, setting1, setting2 = row
+        return cls(Vector3(x, y, z), scale, setting1, setting2)
 
-        self.write_position(f)
 
+    def to_row(self):
         setting2 = self.unknown << 0x2
         setting2 = setting2 | (self.lowpriority << 0x1)
         setting2 = setting2 | self.dontdrop
-        f.write(pack(">fHH", self.scale, self.setting1, setting2))
+        return (*self.get_file_position(), self.scale, self.setting1, setting2)
+
+    def write(self, f):
+        f.write(self.STRUCT.pack(*self.to_row()))
     
     def copy(self):
         return deepcopy(self)
@@ -802,23 +845,6 @@ class ItemPointGroup(PointGroup):
     def new(cls):
         return cls()
 
-    @classmethod
-    def from_file(cls, f, idx, points):
-        group = cls()
-        group.id = idx
-        start_idx = read_uint8(f)
-        len = read_uint8(f)
-
-
-        group.prevgroup = list( unpack(">BBBBBB", f.read(6)) )
-        group.nextgroup = list(unpack(">BBBBBB", f.read(6)) )
-        f.read( 2)
-
-        for i in range(start_idx, start_idx + len):
-            group.points.append(points[i])
-
-        return group
-
     def copy_group(self):
         group = ItemPointGroup()
         return super().copy_group(group)
@@ -831,27 +857,6 @@ class ItemPointGroup(PointGroup):
         self.nextgroup.remove(group)
         self.nextgroup.insert(0, group)
 
-    def write_itpt(self, f):
-        for point in self.points:
-            point.write(f)
-        return len(self.points)
-
-    def write_itph(self, f, index, groups):
-
-
-        f.write(pack(">B", index ) )
-        f.write(pack(">B", len(self.points) ) )
-
-        for grp in self.prevgroup:
-           f.write(pack(">B", groups.get_idx(grp)))
-        for i in range( 6 - len(self.prevgroup) ):
-           f.write(pack(">b", -1))
-        for grp in self.nextgroup:
-           f.write(pack(">B", groups.get_idx(grp)))
-        for i in range( 6 - len(self.nextgroup) ):
-           f.write(pack(">b", -1))
-
-        f.write(pack(">H",  0) )
 
 class ItemPointGroups(PointGroups):
     def __init__(self):
@@ -873,20 +878,15 @@ class ItemPointGroups(PointGroups):
         f.read(2)
 
 
-        all_points = []
         #read the item points
-        for i in range(count):
-            itempoint = ItemPoint.from_file(f)
-            all_points.append(itempoint)
-
+        all_points = read_entries(f, count, ItemPoint)
 
         assert f.read(4) == b"ITPH"
         count = read_uint16(f)
         f.read(2)
 
-
-        for i in range(count):
-            itempath = ItemPointGroup.from_file(f, i, all_points)
+        for i, row in enumerate(read_rows(f, count, ItemPointGroup.STRUCT)):
+            itempath = ItemPointGroup.from_row(row, i, all_points)
             itempointgroups.groups.append(itempath)
         return itempointgroups
 
@@ -896,41 +896,31 @@ class ItemPointGroups(PointGroups):
                 group.make_default(default_group)
 
     def write(self, f):
+        points = list(self.points())
+        if len(points) > 0xFF:
+            raise Exception("too many enemy points")
 
         f.write(b"ITPT")
-
-        count_offset = f.tell()
-        f.write(pack(">H", 0) ) #overwritten
-        f.write(pack(">H", 0) )
-
-        sum_points = 0
-        point_indices = []
-
-        for group in self.groups:
-            point_indices.append(sum_points)
-            sum_points += group.write_itpt(f)
+        f.write(pack(">HH", len(points), 0) )
+        write_entries(f, ItemPoint.STRUCT, [point.to_row() for point in points])
 
         itph_offset = f.tell()
-
-        if sum_points > 0xFF:
-            raise Exception("too many enemy points")
-        else:
-            f.seek(count_offset)
-            f.write(pack(">H", sum_points) )
-
-        f.seek(itph_offset)
-
         f.write(b"ITPH")
-        f.write(pack(">H", len(self.groups) ) )
-        f.write(pack(">H", 0) )
-
-        for idx, group in enumerate( self.groups ):
-            group.write_itph(f, point_indices[idx], self)
+        f.write(pack(">HH", len(self.groups), 0) )
 
+        groups = IndexMap(self.groups)
+        rows = []
+        sum_points = 0
+        for group in self.groups:
+            rows.append(group.to_row(sum_points, groups))
+            sum_points += len(group.points)
+        write_entries(f, PointGroup.STRUCT, rows)
 
-        return  itph_offset
+        return itph_offset
 
 class Checkpoint(KMPPoint):
+    STRUCT = Struct(">ffffBBBB")
+
     def __init__(self, start, end, respawn=0, type=0):
         super().__init__( (start+end)/2.0 )
         self.start = start
@@ -964,39 +954,48 @@ class Checkpoint(KMPPoint):
 
     @classmethod
     def from_file(cls, f):
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
+
+    @classmethod
+    def from_row(cls, row):
+        start_x, start_z, end_x, end_z, respawnid, checkpoint_type, prev, next = row
         checkpoint = cls.new()
 
-        checkpoint.start = Vector3(*unpack(">f", f.read(4) ), 0, *unpack(">f", f.read(4) ) )
-        checkpoint.end = Vector3(*unpack(">f", f.read(4) ), 0, *unpack(">f", f.read(4) ) )
+        checkpoint.start = Vector3(start_x, 0, start_z)
+        checkpoint.end = Vector3(end_x, 0, end_z)
 
-        checkpoint.respawnid = read_uint8(f) #respawn
+        checkpoint.respawnid = respawnid #respawn
 
-        checkpoint_type = read_uint8(f)
         if checkpoint_type == 0:
             checkpoint.lapcounter = 1
         elif checkpoint_type != 0xFF:
             checkpoint.type = 1
 
-        checkpoint.prev = read_uint8(f)
-        checkpoint.next = read_uint8(f)
+        checkpoint.prev = prev
+        checkpoint.next = next
 
         return checkpoint
 
 
-    def write(self, f, prev, next, key, lap_counter = False ):
-        f.write(pack(">ff", self.start.x, self.start.z))
-        f.write(pack(">ff", self.end.x, self.end.z))
-        f.write(pack(">b", self.respawnid))
-
+    def to_row(self, prev, next, key):
+        """
+        Returns the values of the checkpoint's entry and the key checkpoint id that follows it.
+        """
         if self.lapcounter == 1:
-            f.write(pack(">b", 0))
+            checkpoint_type = 0
             key = 1
         elif self.type == 1:
-            f.write(pack(">b", key))
+            checkpoint_type = key
             key += 1
         else:
-            f.write(pack(">B", 0xFF))
-        f.write(pack(">BB", prev & 0xFF, next & 0xFF) )
+            checkpoint_type = 0xFF
+        row = (self.start.x, self.start.z, self.end.x, self.end.z, self.respawnid,
+               checkpoint_type, prev & 0xFF, next & 0xFF)
+        return row, key
+
+    def write(self, f, prev, next, key, lap_counter = False ):
+        row, key = self.to_row(prev, next, key)
+        f.write(self.STRUCT.pack(*row))
         return key
 
     def copy(self):
@@ -1048,57 +1047,54 @@ class CheckpointGroup(PointGroup):
 
     @classmethod
     def from_file(cls, f, all_points, id):
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)), id, all_points)
+
+    @classmethod
+    def from_row(cls, row, id, all_points):
+        start_point, length, prevgroup, nextgroup = row
 
         checkpointgroup = cls.new()
         checkpointgroup.id = id
 
-        start_point = read_uint8(f)
-        length = read_uint8(f)
-
         if len(all_points) > 0:
             assert( all_points[start_point].prev == 0xFF )
             if length > 1:
                 assert( all_points[start_point + length - 1].next == 0xFF)
         checkpointgroup.points = all_points[start_point: start_point + length]
 
-        checkpointgroup.prevgroup = list(unpack(">BBBBBB", f.read(6)))
-        checkpointgroup.nextgroup = list(unpack(">BBBBBB", f.read(6)))
-        f.read(2)
+        checkpointgroup.prevgroup = list(prevgroup)
+        checkpointgroup.nextgroup = list(nextgroup)
 
         return checkpointgroup
 
     def set_rspid(self, rsps):
+        """
+        Sets the respawn ids of the checkpoints from their respawn objects. `rsps` is the
+        `IndexMap` of the respawn points.
+        """
         for point in self.points:
             if point.respawn_obj is not None:
                 point.respawnid = rsps.index(point.respawn_obj)
             else:
                 point.respawnid = 0
 
-    def write_ckpt(self, f, key, prev):
-
+    def get_ckpt_rows(self, key, prev):
+        """
+        Returns the entries of the group's checkpoints and the key checkpoint id that follows
+        them. `prev` is the index of the group's first checkpoint.
+        """
+        rows = []
         if len(self.points) > 0:
-            key = self.points[0].write(f, -1, 1 + prev, key)
+            row, key = self.points[0].to_row(-1, 1 + prev, key)
+            rows.append(row)
 
             for i in range(1, len( self.points) -1 ):
-                key = self.points[i].write(f, i-1 + prev, i + 1 + prev, key)
+                row, key = self.points[i].to_row(i-1 + prev, i + 1 + prev, key)
+                rows.append(row)
             if len(self.points) > 1:
-                key = self.points[-1].write(f, len(self.points) - 2 + prev, -1, key)
-        return key
-
-    def write_ckph(self, f, index, groups):
-        f.write(pack(">B", index ) )
-        f.write(pack(">B", len(self.points) ) )
-
-        for grp in self.prevgroup:
-           f.write(pack(">B", groups.get_idx(grp)))
-        for i in range( 6 - len(self.prevgroup) ):
-           f.write(pack(">b", -1))
-        for grp in self.nextgroup:
-           f.write(pack(">B", groups.get_idx(grp)))
-        for i in range( 6 - len(self.nextgroup) ):
-           f.write(pack(">b", -1))
-
-        f.write(pack(">H",  0) )
+                row, key = self.points[-1].to_row(len(self.points) - 2 + prev, -1, key)
+                rows.append(row)
+        return rows, key
 
 class CheckpointGroups(PointGroups):
     def __init__(self):
@@ -1117,18 +1113,15 @@ class CheckpointGroups(PointGroups):
         count = read_uint16(f)
         f.read(2)
 
-        all_points = []
-        #read the enemy points
-        for i in range(count):
-            checkpoint = Checkpoint.from_file(f)
-            all_points.append(checkpoint)
+        #read the checkpoints
+        all_points = read_entries(f, count, Checkpoint)
 
         assert f.read(4) == b"CKPH"
         count = read_uint16(f)
         f.read(2)
 
-        for i in range(count):
-            checkpointpath = CheckpointGroup.from_file(f, all_points, i)
+        for i, row in enumerate(read_rows(f, count, CheckpointGroup.STRUCT)):
+            checkpointpath = CheckpointGroup.from_row(row, i, all_points)
             checkpointgroups.groups.append(checkpointpath)
 
         return checkpointgroups
@@ -1146,6 +1139,7 @@ class CheckpointGroups(PointGroups):
         num_key = 0
         starting_key_cp = [0] * len(self.groups)
 
+        groups = IndexMap(self.groups)
         to_visit = []
         visited = []
         for i in range(len(self.groups)):
@@ -1165,24 +1159,27 @@ class CheckpointGroups(PointGroups):
             num_key = curr_group.calculate_key_cps(starting_key_cp[curr_group_idx])
 
             for grp in curr_group.nextgroup:
-                next_idx = self.get_idx(grp)
+                next_idx = groups.index(grp)
                 starting_key_cp[ next_idx ] = max( starting_key_cp[next_idx], num_key)
                 to_visit.append(next_idx)
 
         
 
+        rows = []
         for i, group in enumerate(self.groups):
             indices_offset.append(sum_points)
-            num_key = group.write_ckpt(f, starting_key_cp[i], sum_points)
+            group_rows, num_key = group.get_ckpt_rows(starting_key_cp[i], sum_points)
+            rows.extend(group_rows)
             sum_points += len(group.points)
+        write_entries(f, Checkpoint.STRUCT, rows)
         ckph_offset = f.tell()
 
         f.write(b"CKPH")
         f.write(pack(">H", len(self.groups) ) )
         f.write(pack(">H", 0) )
 
-        for idx, group in enumerate( self.groups ):
-            group.write_ckph(f, indices_offset[idx], self)
+        rows = [group.to_row(indices_offset[idx], groups) for idx, group in enumerate(self.groups)]
+        write_entries(f, PointGroup.STRUCT, rows)
         return ckph_offset
 
     def set_key_cps(self):
@@ -1231,6 +1228,9 @@ class CheckpointGroups(PointGroups):
 # Section 3
 # Routes/Paths for cameras, objects and other things
 class Route(object):
+    # point count, smooth, cyclic
+    STRUCT = Struct(">HBB")
+
     def __init__(self):
         self.points = []
         self._pointcount = 0
@@ -1270,13 +1270,8 @@ class Route(object):
     @classmethod
     def from_file(cls, f):
         route = cls()
-        route._pointcount = read_uint16(f)
-        route.smooth = read_uint8(f)
-        route.cyclic = read_uint8(f)
-
-        for i in range(route._pointcount):
-            point: RoutePoint = RoutePoint.from_file(f)
-            route.points.append( point  )
+        route._pointcount, route.smooth, route.cyclic = cls.STRUCT.unpack(f.read(cls.STRUCT.size))
+        route.points = read_entries(f, route._pointcount, RoutePoint)
 
         return route
 
@@ -1291,12 +1286,8 @@ class Route(object):
         return new_route
 
     def write(self, f):
-        f.write(pack(">H", len(self.points) ) )
-        f.write(pack(">B", self.smooth ) )
-        f.write(pack(">B", self.cyclic) )
-
-        for point in self.points:
-            point.write(f)
+        f.write(self.STRUCT.pack(len(self.points), self.smooth, self.cyclic))
+        write_entries(f, RoutePoint.STRUCT, [point.to_row() for point in self.points])
         return len(self.points)
 
     def add_points(self, position=None, absolute_pos=False, ref_points=None):
@@ -1401,6 +1392,8 @@ class ReplayCameraRoute(Route):
 # Section 4
 # Route point for use with routes from section 3
 class RoutePoint(PositionedObject):
+    STRUCT = Struct(">fffHH")
+
     def __init__(self, position):
         super().__init__(position)
         self.unk1 = 0
@@ -1412,11 +1405,15 @@ class RoutePoint(PositionedObject):
 
     @classmethod
     def from_file(cls, f):
-        position = Vector3.from_file(f)
-        point = cls(position)
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
+
+    @classmethod
+    def from_row(cls, row):
+        x, y, z, unk1, unk2 = row
+        point = cls(Vector3(x, y, z))
 
-        point.unk1 = read_uint16(f)
-        point.unk2 = read_uint16(f)
+        point.unk1 = unk1
+        point.unk2 = unk2
         return point
 
     def copy(self, RPClass=None):
@@ -1428,9 +1425,11 @@ class RoutePoint(PositionedObject):
         obj.unk2 = self.unk2
         return obj
 
+    def to_row(self):
+        return (*self.get_file_position(), self.unk1, self.unk2)
+
     def write(self, f):
-        self.write_position(f)
-        f.write(pack(">HH", self.unk1, self.unk2) )
+        f.write(self.STRUCT.pack(*self.to_row()))
 
     def __iadd__(self, other):
         self.position += other.position
@@ -1462,6 +1461,8 @@ class AreaRoutePoint(RoutePoint):
 # Section 5
 # Objects
 class MapObject(RoutedObject, RotatedObject):
+    STRUCT = Struct(">H2xfffffffffH8hH")
+
     def __init__(self, position, objectid, rotation):
         RoutedObject.__init__(self, position)
         RotatedObject.__init__(self, position, rotation)
@@ -1551,46 +1552,43 @@ class MapObject(RoutedObject, RotatedObject):
 
     @classmethod
     def from_file(cls, f):
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
+
+    @classmethod
+    def from_row(cls, row):
         object = cls(Vector3(0.0, 0.0, 0.0), 0, Rotation.default())
 
-        object.objectid = read_uint16(f)
+        object.objectid = row[0]
 
-        f.read(2)
-        object.position = Vector3.from_file(f)
-        object.rotation = Rotation.from_file(f)
+        object.position = Vector3(*row[1:4])
+        object.rotation = Rotation(*row[4:7])
 
-        object.scale = Vector3.from_file(f)
-        object.route = read_uint16(f)
+        object.scale = Vector3(*row[7:10])
+        object.route = row[10]
         if object.route == 65535:
             object.route = -1
-        object.userdata = list(unpack(">hhhhhhhh", f.read(2 * 8)))
-        object.split_prescence( read_uint16(f) )
+        object.userdata = list(row[11:19])
+        object.split_prescence( row[19] )
 
         return object
 
-    def write(self, f, routes):
-
-        f.write(pack(">H", self.objectid  ))
-
-
-        f.write(pack(">H", 0) )
-        self.write_position(f)
-        self.rotation.write(f)
-        self.scale.write(f)
+    def to_row(self, routes):
         route = self.set_route(routes)
         route = (2 ** 16 - 1) if route == -1 else route
-        f.write(pack(">H", route) )
 
         special_setting = self.get_routepoint_idx()
         if special_setting is not None and self.route_obj is not None and self.routepoint in self.route_obj.points:
             self.userdata[special_setting] = self.route_obj.points.index(self.routepoint)
 
-        for i in range(8):
-            f.write(pack(">h", self.userdata[i]))
-
         presence = self.single | (self.double << 1) | (self.triple << 2)
 
-        f.write( pack(">H", presence) )
+        return (self.objectid, *self.get_file_position(),
+                self.rotation.x, self.rotation.y, self.rotation.z,
+                self.scale.x, self.scale.y, self.scale.z,
+                route, *self.userdata[:8], presence)
+
+    def write(self, f, routes):
+        f.write(self.STRUCT.pack(*self.to_row(routes)))
         return 1
     def copy(self):
 
@@ -1620,18 +1618,10 @@ class MapObject(RoutedObject, RotatedObject):
         return None
 
     def set_route(self, routes):
-        for i, route in enumerate(routes):
-            if route == self.route_obj:
-                return i
-        return -1
+        return routes.find(self.route_obj)
 
     def load_param_file(self):
-        if (self.objectid is None) or (not self.objectid in OBJECTNAMES):
-            return None
-        name = OBJECTNAMES[self.objectid]
-        with open(os.path.join("object_parameters", name+".json"), "r") as f:
-            data = json.load(f)
-        return data
+        return get_object_parameters(self.objectid)
 
     def get_single_json_val(self, text):
         json_data = self.load_param_file()
@@ -1716,11 +1706,7 @@ class MapObjects(ObjectContainer):
     @classmethod
     def from_file(cls, f, objectcount):
         mapobjs = cls()
-
-        for i in range(objectcount):
-            obj = MapObject.from_file(f)
-            if obj is not None:
-                mapobjs.append(obj)
+        mapobjs.extend(read_entries(f, objectcount, MapObject))
 
         return mapobjs
 
@@ -1730,8 +1716,7 @@ class MapObjects(ObjectContainer):
         f.write(pack(">H", len(self)))
         f.write(pack(">H", 0) )
 
-        for object in self:
-            object.write(f, routes)
+        write_entries(f, MapObject.STRUCT, [object.to_row(routes) for object in self])
 
     def get_routes(self):
         return list(set([obj.route_obj for obj in self if obj.route_obj is not None and obj.route_info()]))
@@ -1756,6 +1741,8 @@ class MapObjects(ObjectContainer):
 # Kart/Starting positions
 
 class KartStartPoint(RotatedObject):
+    STRUCT = Struct(">ffffffH2x")
+
     def __init__(self, position, rotation):
         super().__init__(position, rotation)
         self.playerid = 0xFF
@@ -1766,22 +1753,21 @@ class KartStartPoint(RotatedObject):
 
     @classmethod
     def from_file(cls, f):
-        position = Vector3.from_file(f)
-        rotation = Rotation.from_file(f)
-        kstart = cls(position, rotation)
-        kstart.playerid = read_uint16(f)
-        read_uint16(f)
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
+
+    @classmethod
+    def from_row(cls, row):
+        kstart = cls(Vector3(*row[0:3]), Rotation(*row[3:6]))
+        kstart.playerid = row[6]
         return kstart
 
-    def write(self,f):
-        self.write_position(f)
-        self.rotation.write(f)
+    def to_row(self):
+        playerid = self.playerid + 0xFF00 if self.playerid == 0xFF else self.playerid
+        return (*self.get_file_position(), self.rotation.x, self.rotation.y, self.rotation.z,
+                playerid)
 
-        if self.playerid == 0xFF:
-            f.write(pack(">H", self.playerid + 0xFF00 ) )
-        else:
-            f.write(pack(">H", self.playerid ) )
-        f.write(pack(">H",  0) )
+    def write(self,f):
+        f.write(self.STRUCT.pack(*self.to_row()))
 
     def copy(self):
         return deepcopy(self)
@@ -1809,9 +1795,7 @@ class KartStartPoints(ObjectContainer):
     @classmethod
     def from_file(cls, f, count):
         kspoints = cls()
-        for i in range(count):
-            kstart = KartStartPoint.from_file(f)
-            kspoints.append(kstart)
+        kspoints.extend(read_entries(f, count, KartStartPoint))
 
         return kspoints
 
@@ -1819,12 +1803,13 @@ class KartStartPoints(ObjectContainer):
         f.write(b"KTPT")
         f.write(pack(">H", len(self)))
         f.write(pack(">H", 1) )
-        for position in self:
-            position.write(f)
+        write_entries(f, KartStartPoint.STRUCT, [position.to_row() for position in self])
 
 # Section 7
 # Areas
 class Area(RoutedObject, RotatedObject):
+    STRUCT = Struct(">BBbBfffffffffhhBB2x")
+    WRITE_STRUCT = Struct(">BBBBfffffffffHHBB2x")
     level_file = None
     can_copy = True
     def __init__(self, position, rotation):
@@ -1863,13 +1848,13 @@ class Area(RoutedObject, RotatedObject):
 
     @classmethod
     def from_file(cls, f):
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
 
-        shape = read_uint8(f) #shape
-        type = read_uint8(f)
-        camera = read_int8(f)
-        priority = read_uint8(f)    #priority
+    @classmethod
+    def from_row(cls, row):
+        shape, type, camera, priority = row[0:4]
 
-        position = Vector3.from_file(f)
+        position = Vector3(*row[4:7])
         area = cls(position, Rotation.default())
 
         area.shape = shape
@@ -1879,40 +1864,38 @@ class Area(RoutedObject, RotatedObject):
         if type != 0:
             area.cameraid = -1
         area.priority = priority
-        area.rotation = Rotation.from_file(f)
+        area.rotation = Rotation(*row[7:10])
 
-        area.scale = Vector3.from_file(f)
+        area.scale = Vector3(*row[10:13])
 
-        area.setting1 = read_int16(f) #unk1
-        area.setting2 = read_int16(f) #unk2
-        area.route = read_uint8(f) #route
+        area.setting1, area.setting2, area.route, area.enemypointid = row[13:17]
         if area.type != 3:
             area.route = -1
-        area.enemypointid = read_uint8(f) #enemy
         if area.type != 4:
             area.enemypointid = -1
 
-        f.read(2)
-
         return area
 
-    def write(self, f, cameras, routes, enemypoints):
-        f.write(pack(">B", self.shape) ) #shape
-        f.write(pack(">B", self.type ) )
+    def to_row(self, cameras, routes, enemypoints):
+        """
+        Returns the values of the area's entry. `cameras`, `routes` and `enemypoints` are the
+        `IndexMap`s of the written cameras, routes and enemy points.
+        """
         cameraid = self.set_camera(cameras)
         cameraid = 255 if cameraid < 0 else cameraid
-        f.write(pack(">B", cameraid) )
-        f.write(pack(">B", self.priority) ) #priority
 
-        self.write_position(f)
-        self.rotation.write(f)
-        self.scale.write(f)
-
-        enemypointid = self.set_enemypointid(enemypoints)
+        enemypointid = self.find_enemypoint(enemypoints)
         enemypointid = 255 if enemypointid < 0 else enemypointid
         route = self.set_route(routes)
         route = 255 if route < 0 else route
-        f.write(pack(">HHBBH", self.setting1, self.setting2, route, enemypointid, 0 ) )
+
+        return (self.shape, self.type, cameraid, self.priority, *self.get_file_position(),
+                self.rotation.x, self.rotation.y, self.rotation.z,
+                self.scale.x, self.scale.y, self.scale.z,
+                self.setting1, self.setting2, route, enemypointid)
+
+    def write(self, f, cameras, routes, enemypoints):
+        f.write(self.WRITE_STRUCT.pack(*self.to_row(cameras, routes, enemypoints)))
         return 1
 
     def copy(self, copy_cam = False):
@@ -1945,20 +1928,21 @@ class Area(RoutedObject, RotatedObject):
     #type 0 - camera
     def set_camera(self, cameras):
         if self.type == 0:
-            for i, camera in enumerate(cameras):
-                if camera == self.camera:
-                    return i
+            return cameras.find(self.camera)
         return -1
 
     #type 3 - moving road
     def set_route(self, routes):
         if self.type == 3:
-            for i, route in enumerate(routes):
-                if route == self.route_obj:
-                    return i
+            return routes.find(self.route_obj)
         return -1
 
     #type 4 - force recalc
+    def find_enemypoint(self, enemypoints):
+        if self.type == 4:
+            return enemypoints.find(self.enemypoint)
+        return -1
+
     def set_enemypointid(self, enemies):
         if self.type == 4:
             point_idx = enemies.get_index_from_point(self.enemypoint)
@@ -2054,27 +2038,17 @@ class Areas(ObjectContainer):
     @classmethod
     def from_file(cls, f, count):
         areas = cls()
-        for i in range(count):
-            new_area = Area.from_file(f)
-            if new_area is not None:
-                areas.append(new_area)
+        areas.extend(read_entries(f, count, Area))
 
         return areas
 
     def write(self, f, cameras, routes, enemypoints):
         f.write(b"AREA")
-        area_count_off = f.tell()
-        f.write(pack(">H", 0xFFFF) )
+        f.write(pack(">H", len(self)) )
         f.write(pack(">H", 0) )
 
-        num_written = 0
-        for area in self:
-            num_written += area.write(f, cameras, routes, enemypoints)
-
-        end_sec = f.tell()
-        f.seek(area_count_off)
-        f.write(pack(">H", num_written) )
-        f.seek(end_sec)
+        rows = [area.to_row(cameras, routes, enemypoints) for area in self]
+        write_entries(f, Area.WRITE_STRUCT, rows)
 
     def get_type(self, area_type):
         return [area for area in self if area.type == area_type]
@@ -2163,9 +2137,7 @@ class Cameras(ObjectContainer):
     @classmethod
     def from_file(cls, f, count):
         cameras = cls()
-        for i in range(count):
-
-            cameras.append( Camera.from_file(f) )
+        cameras.extend(read_entries(f, count, Camera))
 
         return cameras
 
@@ -2218,6 +2190,8 @@ class Cameras(ObjectContainer):
         return selected_points
 
 class Camera(RoutedObject):
+    STRUCT = Struct(">BbBbHHHBBfffffffffffffff")
+    WRITE_STRUCT = Struct(">BBBBHHHBBfffffffffffffff")
     level_file = None
     can_copy = True
     def __init__(self, position):
@@ -2266,20 +2240,14 @@ class Camera(RoutedObject):
 
     @classmethod
     def from_file(cls, f):
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
 
-        type = read_uint8(f)
-        next_cam = read_int8(f)
-        shake = read_uint8(f)
-        route = read_int8(f)
-
-        move_velocity = read_uint16(f)
-        zoom_velocity = read_uint16(f)
-        view_velocity = read_uint16(f)
-
-        start_flag = read_uint8(f)
-        movie_flag = read_uint8(f)
+    @classmethod
+    def from_row(cls, row):
+        (type, next_cam, shake, route, move_velocity, zoom_velocity, view_velocity,
+         start_flag, movie_flag) = row[0:9]
 
-        position = Vector3.from_file(f)
+        position = Vector3(*row[9:12])
         cam = cls(position)
 
         cam.type = type
@@ -2293,19 +2261,18 @@ class Camera(RoutedObject):
         cam.startflag = start_flag
         cam.movieflag = movie_flag
 
-        cam.rot = Rotation.from_file(f)
+        cam.rot = Rotation(*row[12:15])
 
-        cam.fov.start = read_float(f)
-        cam.fov.end = read_float(f)
-        cam.position2 = Vector3.from_file(f)
-        cam.position3 = Vector3.from_file(f)
+        cam.fov.start, cam.fov.end = row[15:17]
+        cam.position2 = Vector3(*row[17:20])
+        cam.position3 = Vector3(*row[20:23])
         if cam.type in (0, 1,2, 4, 5):
             cam.position2_simple = cam.position2.copy()
             cam.position3_simple = cam.position3.copy()
         else:
             cam.position2_player = Vector3Relative(cam.position2, cam.position)
             cam.position3_player = Vector3Relative(cam.position3, cam.position)
-        cam.camduration = read_float(f)
+        cam.camduration = row[23]
 
         return cam
 
@@ -2332,50 +2299,39 @@ class Camera(RoutedObject):
 
         return new_camera
 
-    def write(self, f, cameras, routes):
+    def to_row(self, cameras, routes):
+        """
+        Returns the values of the camera's entry. `cameras` and `routes` are the `IndexMap`s of
+        the written cameras and routes.
+        """
         type = self.to_kmp_type()
-        f.write(pack(">B", type ) )
         nextcam = self.set_nextcam(cameras)
         nextcam = 255 if nextcam < 0 else nextcam
         route = self.set_route(routes)
         route = 255 if route < 0 else route
-        f.write(pack(">BBB", nextcam, 0, route) )
-
-        f.write(pack(">H", self.routespeed ) )
-        f.write(pack(">H", self.zoomspeed ) )
-        f.write(pack(">H", self.viewspeed ) )
-
-        f.write(pack(">B", self.startflag ) )
-        f.write(pack(">B", self.movieflag ) )
-
-        self.write_position(f)
-        self.rot.write(f)
-
-        f.write(pack(">ff", self.fov.start, self.fov.end))
 
         position2 = self.position2_player if self.type == 3 else self.position2_simple
         position3 = self.position3_player if self.type == 3 else self.position3_simple
-        f.write(pack(">fff", position2.x, position2.y, position2.z))
-        f.write(pack(">fff", position3.x, position3.y, position3.z))
 
-        f.write(pack(">f", self.camduration) )
+        return (type, nextcam, 0, route, self.routespeed, self.zoomspeed, self.viewspeed,
+                self.startflag, self.movieflag, *self.get_file_position(),
+                self.rot.x, self.rot.y, self.rot.z, self.fov.start, self.fov.end,
+                position2.x, position2.y, position2.z, position3.x, position3.y, position3.z,
+                self.camduration)
 
+    def write(self, f, cameras, routes):
+        f.write(self.WRITE_STRUCT.pack(*self.to_row(cameras, routes)))
         return 1
 
     def set_route(self, routes):
         if self.route_info():
-            for i,route in enumerate(routes):
-                if route == self.route_obj:
-                    return i
+            return routes.find(self.route_obj)
         return -1
 
     def set_nextcam(self, cameras):
         if self.nextcam_obj is None:
             return -1
-        for i, camera in enumerate(cameras):
-            if self.nextcam_obj == camera:
-                return i
-        return -1
+        return cameras.find(self.nextcam_obj)
 
     def get_route_text(self):
         return ["Speed", None]
@@ -2507,6 +2463,9 @@ class GoalCamera(Camera):
 # Section 9
 # Jugem Points
 class JugemPoint(RotatedObject):
+    STRUCT = Struct(">ffffff2xh")
+    WRITE_STRUCT = Struct(">ffffffHh")
+
     def __init__(self, position, rotation=Rotation.default()):
         super().__init__(position, rotation)
         self.range = 0
@@ -2518,23 +2477,22 @@ class JugemPoint(RotatedObject):
 
     @classmethod
     def from_file(cls, f):
-        position = Vector3.from_file(f)
-        rotation = Rotation.from_file(f)
-        jugem = cls(position, rotation)
-
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
 
-        read_uint16(f)
-
-        jugem.range = read_int16(f)
+    @classmethod
+    def from_row(cls, row):
+        jugem = cls(Vector3(*row[0:3]), Rotation(*row[3:6]))
+        jugem.range = row[6]
 
         return jugem
 
 
+    def to_row(self, count):
+        return (*self.get_file_position(), self.rotation.x, self.rotation.y, self.rotation.z,
+                count, self.range)
+
     def write(self, f, count):
-        self.write_position(f)
-        self.rotation.write(f)
-        f.write(pack(">H", count) )
-        f.write(pack(">h", self.range ) )
+        f.write(self.WRITE_STRUCT.pack(*self.to_row(count)))
 
     def copy(self):
         return deepcopy(self)
@@ -2552,6 +2510,8 @@ class JugemPoint(RotatedObject):
         return self
 
 class CannonPoint(RotatedObject):
+    STRUCT = Struct(">ffffffHh")
+
     def __init__(self, position, rotation):
         super().__init__(position, rotation)
         self.id = 0
@@ -2564,23 +2524,24 @@ class CannonPoint(RotatedObject):
 
     @classmethod
     def from_file(cls, f):
-        position = Vector3.from_file(f)
-        rotation = Rotation.from_file(f)
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
 
-        cannon = cls(position, rotation)
-        cannon.id = read_uint16(f)
-        cannon.shoot_effect = read_int16(f)
+    @classmethod
+    def from_row(cls, row):
+        cannon = cls(Vector3(*row[0:3]), Rotation(*row[3:6]))
+        cannon.id, cannon.shoot_effect = row[6:8]
         if cannon.shoot_effect > 3 or cannon.shoot_effect < 0:
             cannon.shoot_effect = 0
 
         return cannon
 
 
+    def to_row(self):
+        return (*self.get_file_position(), self.rotation.x, self.rotation.y, self.rotation.z,
+                self.id, self.shoot_effect)
+
     def write(self, f):
-        self.write_position(f)
-        self.rotation.write(f)
-        #print(self.shoot_effect)
-        f.write(pack(">Hh", self.id, self.shoot_effect) )
+        f.write(self.STRUCT.pack(*self.to_row()))
 
 
     def copy(self):
@@ -2599,6 +2560,8 @@ class CannonPoint(RotatedObject):
         return self
 
 class MissionPoint(PositionedObject):
+    STRUCT = Struct(">ffffffHH")
+
     def __init__(self, position):
         self.position = position
         self.rotation = Rotation.default()
@@ -2612,20 +2575,24 @@ class MissionPoint(PositionedObject):
 
     @classmethod
     def from_file(cls, f):
-        position = Vector3.from_file(f)
-        jugem = cls(position)
+        return cls.from_row(cls.STRUCT.unpack(f.read(cls.STRUCT.size)))
+
+    @classmethod
+    def from_row(cls, row):
+        jugem = cls(Vector3(*row[0:3]))
 
-        jugem.rotation = Rotation.from_file(f)
-        jugem.mission_id = read_uint16(f)
-        jugem.unk = read_uint16(f)
+        jugem.rotation = Rotation(*row[3:6])
+        jugem.mission_id, jugem.unk = row[6:8]
 
         return jugem
 
 
+    def to_row(self, count):
+        return (*self.get_file_position(), self.rotation.x, self.rotation.y, self.rotation.z,
+                count, self.unk)
+
     def write(self, f, count):
-        self.write_position(f)
-        self.rotation.write(f)
-        f.write(pack(">HH", count, self.unk) )
+        f.write(self.STRUCT.pack(*self.to_row(count)))
 
 class KMP(object):
     def __init__(self):
@@ -2798,21 +2765,9 @@ class KMP(object):
 
 
         f.read(0xC)       #header stuff
-        ktpt_offset = read_uint32(f)
-        enpt_offset = read_uint32(f)
-        enph_offset = read_uint32(f)
-        itpt_offset = read_uint32(f)
-        itph_offset = read_uint32(f)
-        ckpt_offset = read_uint32(f)
-        ckph_offset = read_uint32(f)
-        gobj_offset = read_uint32(f)
-        poti_offset = read_uint32(f)
-        area_offset = read_uint32(f)
-        came_offset = read_uint32(f)
-        jgpt_offset = read_uint32(f)
-        cnpt_offset = read_uint32(f)
-        mspt_offset = read_uint32(f)
-        stgi_offset = read_uint32(f)
+        (ktpt_offset, enpt_offset, enph_offset, itpt_offset, itph_offset, ckpt_offset,
+         ckph_offset, gobj_offset, poti_offset, area_offset, came_offset, jgpt_offset,
+         cnpt_offset, mspt_offset, stgi_offset) = unpack(">15I", f.read(15 * 4))
 
         header_len = f.tell()
         f.seek(ktpt_offset + header_len)
@@ -2866,22 +2821,20 @@ class KMP(object):
         assert f.read(4) == b"JGPT"
         count = read_uint16(f)
         f.read(2)
-        kmp.respawnpoints = ObjectContainer.from_file(f, count, JugemPoint)
+        kmp.respawnpoints = ObjectContainer(read_entries(f, count, JugemPoint))
 
         f.seek(cnpt_offset + header_len)
         assert f.read(4) == b"CNPT"
         count = read_uint16(f)
         f.read(2)
 
-        for i in range(count):
-            kmp.cannonpoints.append( CannonPoint.from_file(f)  )
+        kmp.cannonpoints.extend(read_entries(f, count, CannonPoint))
 
         f.seek(mspt_offset + header_len)
         assert f.read(4) == b"MSPT"
         count = read_uint16(f)
         f.read(2)
-        for i in range(count):
-            kmp.missionpoints.append( MissionPoint.from_file(f)  )
+        kmp.missionpoints.extend(read_entries(f, count, MissionPoint))
 
         f.seek(stgi_offset + header_len)
         assert f.read(4) == b"STGI"
@@ -3208,7 +3161,7 @@ class KMP(object):
         offsets.append(itph_off) #offset 5 for itph
 
         offsets.append(f.tell()) #offset 6 for ckpt
-        self.checkpoints.set_rspid(self.respawnpoints)
+        self.checkpoints.set_rspid(IndexMap(self.respawnpoints))
         ktph_offset = self.checkpoints.write(f)
         offsets.append(ktph_offset) #offset 7 for ktph
 
@@ -3222,6 +3175,7 @@ class KMP(object):
         routes.extend(cameraroutes)
         routes.extend(arearoutes)
         routes.extend(objectroutes)
+        route_indices = IndexMap(routes)
 
         all_objects = MapObjects()
         all_objects.extend(self.objects)
@@ -3229,25 +3183,19 @@ class KMP(object):
             all_objects.append(self.object_areas.boo_obj)
 
         offsets.append(f.tell() ) #offset 8 for gobj
-        all_objects.write(f, routes)
+        all_objects.write(f, route_indices)
 
         offsets.append(f.tell() ) #offset 9 for poti
         f.write(b"POTI")
         f.write(pack(">H", len(routes) ) )
-        count_off = f.tell()
-        f.write(pack(">H", 0xFFFF ) )  # will be overridden later
+        f.write(pack(">H", sum(len(route.points) for route in routes) ) )
 
-        count = 0
         for route in routes:
-            count += route.write(f)
+            route.write(f)
 
         offset = f.tell()
         offsets.append(offset) #offset 10 for AREA
 
-        f.seek(count_off)
-        f.write(pack(">H", count) ) #fill in count of points for poti
-        f.seek(offset)
-
         cameras = Cameras()
         replaycameras = self.replayareas.get_cameras()
         cameras.append( self.cameras.goalcam)
@@ -3259,17 +3207,18 @@ class KMP(object):
         areas.extend( self.replayareas )
         areas.extend( self.object_areas )
         areas.extend( self.minimap_areas )
-        areas.write(f, cameras, routes, self.enemypointgroups )
+        camera_indices = IndexMap(cameras)
+        areas.write(f, camera_indices, route_indices, IndexMap(self.enemypointgroups.points()))
 
-        startcam = self.cameras.startcam
-        startcamid = cameras.index(startcam) if startcam in cameras else 255
+        startcamid = camera_indices.find(self.cameras.startcam)
+        startcamid = 255 if startcamid < 0 else startcamid
         offsets.append(f.tell() ) # offset 11 for CAME
         f.write(b"CAME")
         f.write(pack(">H", len(cameras) ) )
         f.write(pack(">BB", startcamid, 0) )
 
-        for camera in cameras:
-            camera.write(f, cameras, routes)
+        rows = [camera.to_row(camera_indices, route_indices) for camera in cameras]
+        write_entries(f, Camera.WRITE_STRUCT, rows)
 
         offset = f.tell()  #offset 12 for JPGT
         offsets.append(offset)
@@ -3278,10 +3227,8 @@ class KMP(object):
         f.write(pack(">H", len(self.respawnpoints) ) )
         f.write(pack(">H", 0 ) )
 
-        count = 0
-        for point in self.respawnpoints:
-            point.write(f, count)
-            count += 1
+        rows = [point.to_row(count) for count, point in enumerate(self.respawnpoints)]
+        write_entries(f, JugemPoint.WRITE_STRUCT, rows)
 
 
         offset = f.tell()
@@ -3292,8 +3239,7 @@ class KMP(object):
         f.write(pack(">H", len(self.cannonpoints) ) )  # will be overridden later
         f.write(pack(">H", 0 ) )
 
-        for point in self.cannonpoints:
-            point.write(f)
+        write_entries(f, CannonPoint.STRUCT, [point.to_row() for point in self.cannonpoints])
         offset = f.tell()
         offsets.append(offset) #offset 14 for MSPT
 
@@ -3304,9 +3250,11 @@ class KMP(object):
 
 
         count = 0
+        rows = []
         for point in self.missionpoints:
-            point.write(f, count)
+            rows.append(point.to_row(count))
         count += 1
+        write_entries(f, MissionPoint.STRUCT, rows)
         offset = f.tell()
 
         offsets.append(offset) #offset 15 for STGI
@@ -3920,6 +3868,35 @@ valpairs.sort(key=lambda x: x[1])
 for key, val in valpairs:
     REVERSEOBJECTNAMES[OBJECTNAMES[key]] = key
 
+# Parsed object parameter files by object name; shared by everything in the process.
+OBJECT_PARAMETERS = {}
+
+
+def _freeze_json(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze_json(val) for key, val in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze_json(val) for val in value)
+    return value
+
+
+def get_object_parameters(objectid):
+    """
+    Returns the contents of the object's parameter file as a read-only mapping (with lists turned
+    into tuples), or None if the object id is unknown. All files are loaded at once from the
+    parameter database on first use.
+    """
+    if (objectid is None) or (not objectid in OBJECTNAMES):
+        return None
+    if not OBJECT_PARAMETERS:
+        for name, parameters in load_database().items():
+            OBJECT_PARAMETERS[name] = _freeze_json(parameters)
+    name = OBJECTNAMES[objectid]
+    if name not in OBJECT_PARAMETERS:
+        with open(os.path.join("object_parameters", name+".json"), "r") as f:
+            OBJECT_PARAMETERS[name] = _freeze_json(json.load(f))
+    return OBJECT_PARAMETERS[name]
+
 
 def get_kmp_name(id):
     if id not in OBJECTNAMES:
@@ -0,0 +1,115 @@
+"""
+Cache of the collision models of map objects (objects that name a "KCL File" in their
+parameters), shared by all documents the editor opens.
+
+Models are keyed by a hash of the KCL data, so every distinct file is parsed once no matter how
+many objects or documents use it. Parsing and building the collision happens on worker threads;
+the GL buffers of a model are only created on the GUI thread once it is first drawn, and only
+deleted there (see `MapObjectModelCache.free_evicted()`) while the GL context is current.
+"""
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import collision_cache
+from .collision_loader import load_kcl_collision
+
+MAX_MODELS = 64
+MAX_WORKERS = 2
+
+
+class MapObjectModel(object):
+    def __init__(self, data) -> None:
+        self.collision, self.visual_mesh = load_kcl_collision(
+            lambda percent, text: None, data, collision_cache.OBJECT_CACHE_DIR,
+            collision_cache.MAX_OBJECT_ENTRIES)
+
+
+def get_data_key(data):
+    return hashlib.sha1(data).digest()
+
+
+class MapObjectModelCache(object):
+    """
+    Least recently used cache of `MapObjectModel`s by data key (see `get_data_key()`). Only the
+    GUI thread calls into the cache; the worker threads merely build the models.
+    """
+
+    def __init__(self, max_models=MAX_MODELS):
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.pending = {}
+        # The keys of models that could not be built, which are not requested again.
+        self.failed = set()
+        # Models that were evicted and whose GL buffers are still to be deleted.
+        self.evicted = []
+        self._executor = None
+
+    def request(self, key, data):
+        """
+        Starts building the model of `data` in the background unless it is cached, already being
+        built or could not be built before.
+        """
+        if key in self.models or key in self.pending or key in self.failed:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                                thread_name_prefix="MapObjectModel")
+        self.pending[key] = self._executor.submit(MapObjectModel, data)
+
+    def get(self, key, read_data=None):
+        """
+        Returns the model for `key`, or None while it is still being built or if it could not be
+        built. If the model is neither cached nor being built, e.g. because it was evicted, it is
+        requested again with the data returned by `read_data()`.
+        """
+        future = self.pending.get(key)
+        if future is not None and future.done():
+            self._collect(key)
+
+        model = self.models.get(key)
+        if model is not None:
+            self.models.move_to_end(key)
+        elif read_data is not None and key not in self.pending and key not in self.failed:
+            data = read_data()
+            if data is not None:
+                self.request(key, data)
+        return model
+
+    def poll(self):
+        """
+        Moves the models that finished building into the cache. Returns True if any did, so that
+        the view can be redrawn to show them.
+        """
+        finished = [key for key, future in self.pending.items() if future.done()]
+        return any([self._collect(key) for key in finished])
+
+    def _collect(self, key):
+        """
+        Adds the model of the finished future of `key` to the cache. Returns False if it could
+        not be built.
+        """
+        future = self.pending.pop(key)
+        try:
+            model = future.result()
+        except Exception as e:
+            print("Could not load object collision:", str(e))
+            self.failed.add(key)
+            return False
+
+        self.models[key] = model
+        while len(self.models) > self.max_models:
+            _key, evicted = self.models.popitem(last=False)
+            self.evicted.append(evicted)
+        return True
+
+    def free_evicted(self):
+        """
+        Deletes the GL buffers of the evicted models. Must be called with the GL context of the
+        viewer current, e.g. from its `paintGL()`.
+        """
+        for model in self.evicted:
+            model.visual_mesh.delete_buffers()
+        self.evicted = []
+
+object_model_cache = MapObjectModelCache()
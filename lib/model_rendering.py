@@ -1,11 +1,14 @@
+import ctypes
 import json
 import math
 import os
 import re
 import sys
+import numpy
 from OpenGL.GL import *
 from PIL import Image
 from .vectors import Vector3
+from .obj_loader import read_obj
 from PySide6 import QtGui
 
 
@@ -15,19 +18,6 @@ with open("lib/color_coding.json") as f:
 selectioncolor = colors["SelectionColor"]
 
 
-def read_vertex(v_data):
-    split = v_data.split("/")
-    if len(split) >= 2:
-        if split[1] == "":
-            texcoord = None
-        else:
-            texcoord = int(split[1]) - 1
-    else:
-        texcoord = None
-    v = int(split[0])
-    return v, texcoord
-
-
 class Mesh(object):
     def __init__(self, name):
         self.name = name
@@ -38,6 +28,9 @@ class Mesh(object):
         self.lines = []
 
         self._displist = None
+        self._vbo = None
+        self._triangle_vertex_count = 0
+        self._line_vertex_count = 0
 
         self.texture = None
 
@@ -75,6 +68,41 @@ class Mesh(object):
         glColor3ub((id >> 16) & 0xFF, (id >> 8) & 0xFF, (id >> 0) & 0xFF)
         self.render()
 
+    def generate_buffers(self):
+        triangle_vertices = [self.vertices[vi] for triangle in self.triangles for vi, _ in triangle]
+        line_vertices = [self.vertices[vi] for line in self.lines for vi in line]
+        data = numpy.array(triangle_vertices + line_vertices, dtype=numpy.float32).reshape(-1, 3)
+
+        if self._vbo is None:
+            self._vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self._triangle_vertex_count = len(triangle_vertices)
+        self._line_vertex_count = len(line_vertices)
+
+    def render_instanced(self, count):
+        """
+        Draws `count` copies of the mesh with the instancing program, using the instance
+        matrices that are currently bound (see `MarkerInstances.bind()`).
+        """
+        if self._vbo is None:
+            self.generate_buffers()
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        if self._triangle_vertex_count:
+            glDrawArraysInstanced(GL_TRIANGLES, 0, self._triangle_vertex_count, count)
+        if self._line_vertex_count:
+            glDrawArraysInstanced(GL_LINES, self._triangle_vertex_count, self._line_vertex_count,
+                                  count)
+
+        glDisableVertexAttribArray(0)
+
 class TransMesh(Mesh):
     def generate_displist(self):
         if self._displist is not None:
@@ -107,50 +135,71 @@ class TransMesh(Mesh):
 
 class TexturedMesh(object):
     def __init__(self, material):
-        self.triangles = []
-        self.vertex_positions = []
-        self.vertex_texcoords = []
+        # The triangles are (N, 3) arrays of indices into the vertex positions and texture
+        # coordinates; a texture coordinate index of -1 means the corner has none.
+        self.triangles = numpy.zeros((0, 3), dtype=numpy.int64)
+        self.triangle_texcoords = None
+        self.vertex_positions = numpy.zeros((0, 3))
+        self.vertex_texcoords = numpy.zeros((0, 2))
 
         self.material = material
-        self._displist = None
-
-    def generate_displist(self):
-        if self._displist is not None:
-            glDeleteLists(self._displist, 1)
-
-        displist = glGenLists(1)
-        glNewList(displist, GL_COMPILE)
-        glBegin(GL_TRIANGLES)
-
-        for triangle in self.triangles:
-            assert len(triangle) == 3
-
-            # At this time, SuperBMD does not export vertex normals in the OBJ file. For now, a
-            # generated normal for the triangle will be provided.
-            v0 = Vector3(*self.vertex_positions[triangle[0][0]])
-            v1 = Vector3(*self.vertex_positions[triangle[1][0]])
-            v2 = Vector3(*self.vertex_positions[triangle[2][0]])
-            vn = (v1 - v0).cross(v2 - v0)
-            if not vn.norm():
-                # Implies that the points of the faces are colinear (don't form a triangle) and
-                # can be skipped. Several of these have been spotted in the stock Bowser's Castle.
-                continue
-            vn.normalize()
-
-            for vi, ti in triangle:
-                if self.material.tex is not None and t < len(self.vertex_texcoords):
-                    glTexCoord2f(*self.vertex_texcoords[ti])
-                glNormal3f(vn.x, vn.y, vn.z)
-                glVertex3f(*self.vertex_positions[vi])
-
-        glEnd()
-        glEndList()
-        self._displist = displist
+        self._vbo = None
+        self._vertex_count = 0
+
+    def generate_buffers(self):
+        corners = self.vertex_positions[self.triangles]
+
+        # At this time, SuperBMD does not export vertex normals in the OBJ file. For now, a
+        # generated normal for the triangle will be provided.
+        normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        norms = numpy.linalg.norm(normals, axis=1)
+
+        # Triangles without a normal imply that their points are colinear (don't form a triangle)
+        # and can be skipped. Several of these have been spotted in the stock Bowser's Castle.
+        valid = norms != 0
+
+        # One interleaved position/normal/texture coordinate vertex per triangle corner, as every
+        # triangle is shaded with its own normal.
+        vertices = numpy.zeros((numpy.count_nonzero(valid), 3, 8), dtype=numpy.float32)
+        vertices[:, :, 0:3] = corners[valid]
+        vertices[:, :, 3:6] = (normals[valid] / norms[valid][:, None])[:, None, :]
+        if self.triangle_texcoords is not None and len(self.vertex_texcoords):
+            indices = self.triangle_texcoords[valid]
+            has_texcoord = (indices >= 0) & (indices < len(self.vertex_texcoords))
+            texcoords = self.vertex_texcoords[numpy.where(has_texcoord, indices, 0)]
+            vertices[:, :, 6:8] = numpy.where(has_texcoord[..., None], texcoords, 0.0)
+        vertices = vertices.reshape(-1, 8)
+
+        if self._vbo is None:
+            self._vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices if len(vertices) else None,
+                     GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self._vertex_count = len(vertices)
+
+    def draw(self):
+        if self._vbo is None:
+            self.generate_buffers()
+        if not self._vertex_count:
+            return
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 32, None)
+        glNormalPointer(GL_FLOAT, 32, ctypes.c_void_p(12))
+        glTexCoordPointer(2, GL_FLOAT, 32, ctypes.c_void_p(24))
+
+        glDrawArrays(GL_TRIANGLES, 0, self._vertex_count)
+
+        glDisableClientState(GL_TEXTURE_COORD_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
 
     def render(self, selected=False, cull_faces=False):
-        if self._displist is None:
-            self.generate_displist()
-
         if self.material.tex is not None:
             glEnable(GL_TEXTURE_2D)
             glBindTexture(GL_TEXTURE_2D, self.material.tex)
@@ -170,7 +219,7 @@ class TexturedMesh(object):
             glFrontFace(GL_CW)
             glCullFace(self.material.cull_mode)
 
-        glCallList(self._displist)
+        self.draw()
 
         if cull_faces and self.material.cull_mode is not None:
             glCullFace(GL_BACK)
@@ -178,9 +227,6 @@ class TexturedMesh(object):
             glDisable(GL_CULL_FACE)
 
     def render_coloredid(self, id, cull_faces=False):
-
-        if self._displist is None:
-            self.generate_displist()
         glColor3ub((id >> 16) & 0xFF, (id >> 8) & 0xFF, (id >> 0) & 0xFF)
 
         if cull_faces and self.material.cull_mode is not None:
@@ -188,7 +234,7 @@ class TexturedMesh(object):
             glFrontFace(GL_CW)
             glCullFace(self.material.cull_mode)
 
-        glCallList(self._displist)
+        self.draw()
 
         if cull_faces and self.material.cull_mode is not None:
             glCullFace(GL_BACK)
@@ -198,9 +244,23 @@ class TexturedMesh(object):
 
 class Material(object):
     def __init__(self, diffuse=None, texturepath=None):
+        # The image is decoded right away, but only uploaded once the material is first used, so
+        # that models can be loaded away from the GL thread.
         if texturepath is not None:
-            image = Image.open(texturepath)
-            image = image.convert('RGBA')
+            self._image = Image.open(texturepath).convert('RGBA')
+        else:
+            self._image = None
+        self._tex = None
+
+        self.diffuse = diffuse
+
+        self.cull_mode = GL_BACK
+
+    @property
+    def tex(self):
+        if self._image is not None:
+            image = self._image
+            self._image = None
 
             ID = glGenTextures(1)
             glBindTexture(GL_TEXTURE_2D, ID)
@@ -210,15 +270,8 @@ class Material(object):
             glTexImage2D(GL_TEXTURE_2D, 0, 4, image.width, image.height, 0, GL_RGBA,
                          GL_UNSIGNED_BYTE, image.tobytes())
 
-            del image
-
-            self.tex = ID
-        else:
-            self.tex = None
-
-        self.diffuse = diffuse
-
-        self.cull_mode = GL_BACK
+            self._tex = ID
+        return self._tex
 
 
 class Model(object):
@@ -227,6 +280,10 @@ class Model(object):
         self.mesh_list = []
         self.named_meshes = {}
 
+    def generate_displists(self):
+        for mesh in self.mesh_list:
+            mesh.generate_displist()
+
     def render(self):
         for mesh in self.mesh_list:
             mesh.render()
@@ -247,58 +304,30 @@ class Model(object):
     @classmethod
     def from_obj(cls, f, scale=1.0, rotate=False):
         model = cls()
-        vertices = []
-        texcoords = []
-
-        curr_mesh = None
-
-        for line in f:
-            line = line.strip()
-            args = line.split(" ")
+        obj = read_obj(f)
 
-            if len(args) == 0 or line.startswith("#"):
-                continue
-            cmd = args[0]
+        positions = obj.positions * scale
+        if rotate:
+            positions = positions[:, (0, 2, 1)]
+        vertices = positions.tolist()
 
-            if cmd == "o":
-                objectname = args[1]
+        curr_mesh = None
+        curr_object = None
+        for group in obj.groups:
+            if curr_mesh is None or group.object_index != curr_object:
                 if curr_mesh is not None:
                     model.add_mesh(curr_mesh)
-                curr_mesh = cls.mesh_class(objectname)
+                curr_mesh = cls.mesh_class(group.object if group.object is not None else "")
                 curr_mesh.vertices = vertices
+                curr_object = group.object_index
 
-            elif cmd == "v":
-                if "" in args:
-                    args.remove("")
-                x, y, z = map(float, args[1:4])
-                if not rotate:
-                    vertices.append((x*scale, y*scale, z*scale))
-                else:
-                    vertices.append((x * scale, z * scale, y * scale, ))
-
-            elif cmd == "l":
-                curr_mesh.lines.append((int(args[1])-1, int(args[2])-1))
-            elif cmd == "f":
-                if curr_mesh is None:
-                    curr_mesh = cls.mesh_class("")
-                    curr_mesh.vertices = vertices
-
-                # if it uses more than 3 vertices to describe a face then we panic!
-                # no triangulation yet.
-                if len(args) == 5:
-                    #raise RuntimeError("Model needs to be triangulated! Only faces with 3 vertices are supported.")
-                    v1, v2, v3, v4 = map(read_vertex, args[1:5])
-                    curr_mesh.triangles.append(((v1[0] - 1, None), (v3[0] - 1, None), (v2[0] - 1, None)))
-                    curr_mesh.triangles.append(((v3[0] - 1, None), (v1[0] - 1, None), (v4[0] - 1, None)))
-
-                elif len(args) == 4:
-                    v1, v2, v3 = map(read_vertex, args[1:4])
-                    curr_mesh.triangles.append(((v1[0]-1, None), (v3[0]-1, None), (v2[0]-1, None)))
-        model.add_mesh(curr_mesh)
+            curr_mesh.triangles.extend(((v1, None), (v3, None), (v2, None))
+                                       for v1, v2, v3 in group.triangles.tolist())
+            curr_mesh.lines.extend(map(tuple, group.lines.tolist()))
+
+        if curr_mesh is not None:
+            model.add_mesh(curr_mesh)
         return model
-        #elif cmd == "vn":
-        #    nx, ny, nz = map(float, args[1:4])
-        #    normals.append((nx, ny, nz))
 
 
 class TransModel(Model):
@@ -322,20 +351,12 @@ class TexturedModel(object):
             mesh.render_coloredid(id, cull_faces=cull_faces)
 
     @classmethod
-    def from_obj_path(cls, objfilepath, scale=1.0, rotate=False):
-
-
+    def from_obj_path(cls, objfilepath, scale=1.0, rotate=False, obj=None):
+        """
+        Loads the model from the OBJ file at `objfilepath`. If the file was parsed already, its
+        `ObjData` can be passed as `obj`.
+        """
         model = cls()
-        vertices = []
-        texcoords = []
-
-        default_mesh = TexturedMesh(Material(diffuse=(1.0, 1.0, 1.0)))
-        default_mesh.vertex_positions = vertices
-        default_mesh.vertex_texcoords = texcoords
-        material_meshes = {}
-        materials = {}
-
-        currmat = None
 
         objpath = os.path.dirname(objfilepath)
 
@@ -346,126 +367,325 @@ class TexturedModel(object):
         except Exception:
             materials_json = {}
 
-        with open(objfilepath, "r") as f:
-            for line in f:
-                line = line.strip()
-                args = line.split(" ")
-
-                if len(args) == 0 or line.startswith("#"):
-                    continue
-                cmd = args[0]
-
-                #if there is a mtl file in the .obj file
-                if cmd == "mtllib":
-                    mtlpath = " ".join(args[1:])
-                    if not os.path.isabs(mtlpath):
-                        mtlpath = os.path.join(objpath, mtlpath)
-
-                    #read the .mtl file
-                    with open(mtlpath, "r") as g:
-                        lastmat = None
-                        lastdiffuse = None
-                        lasttex = None
-                        for mtl_line in g:
-                            mtl_line = mtl_line.strip()
-                            mtlargs = mtl_line.split(" ")
-
-                            if len(mtlargs) == 0 or mtl_line.startswith("#"):
-                                continue
-                            if mtlargs[0] == "newmtl":
-                                if lastmat is not None:
-                                    if lasttex is not None and not os.path.isabs(lasttex):
-                                        lasttex = os.path.join(objpath, lasttex)
-                                    materials[lastmat] = Material(diffuse=lastdiffuse, texturepath=lasttex)
-                                    lastdiffuse = None
-                                    lasttex = None
-
-                                lastmat = " ".join(mtlargs[1:])
-                            elif mtlargs[0].lower() == "kd":
-                                r, g, b = map(float, mtlargs[1:4])
-                                lastdiffuse = (r,g,b)
-                            elif mtlargs[0].lower() == "map_kd":
-                                lasttex = " ".join(mtlargs[1:])
-                                if lasttex.strip() == "":
-                                    lasttex = None
-
-                        if lastmat is not None:
-                            if lasttex is not None and not os.path.isabs(lasttex):
-                                lasttex = os.path.join(objpath, lasttex)
-                            materials[lastmat] = Material(diffuse=lastdiffuse, texturepath=lasttex)
-                            lastdiffuse = None
-                            lasttex = None
-
-                    for mtlname, material in materials.items():
-                        material_json = materials_json.get(mtlname)
-                        if material_json is not None:
-                            culmode_str = material_json.get("CullMode", "Back")
-                            if culmode_str == "Back":
-                                material.cull_mode = GL_BACK
-                            elif culmode_str == "Front":
-                                material.cull_mode = GL_FRONT
-                            else:
-                                material.cull_mode = None
-
-                elif cmd == "usemtl":
-                    mtlname = " ".join(args[1:])
-                    currmat = mtlname
-                    if currmat not in material_meshes:
-                        material_meshes[currmat] = TexturedMesh(materials[currmat])
-                        material_meshes[currmat].vertex_positions = vertices
-                        material_meshes[currmat].vertex_texcoords = texcoords
-
-                elif cmd == "v":
-                    args = [i for i in args if i != ""]
-                    x, y, z = map(float, args[1:4])
-                    if not rotate:
-                        vertices.append((x*scale, y*scale, z*scale))
-                    else:
-                        vertices.append((x * scale, z * scale, y * scale, ))
-
-                elif cmd == "vt":
-                    args = [i for i in args if i != ""]
-                    #x, y, z = map(float, args[1:4])
-                    #if not rotate:
-                    texcoords.append((float(args[1]), 1-float(args[2])  ))
-                    #else:
-                    #    vertices.append((x, y, ))
-
-                #elif cmd == "l":
-                #    curr_mesh.lines.append((int(args[1])-1, int(args[2])-1))
-                elif cmd == "f":
-                    if currmat is None:
-                        faces = default_mesh.triangles
-                    else:
-                        faces = material_meshes[currmat].triangles
-
-                    # if it uses more than 3 vertices to describe a face then we panic!
-                    # no triangulation yet.
-                    if len(args) == 5:
-                        #raise RuntimeError("Model needs to be triangulated! Only faces with 3 vertices are supported.")
-                        v1, v2, v3, v4 = map(read_vertex, args[1:5])
-                        faces.append(((v1[0] - 1, v1[1]), (v3[0] - 1, v3[1]), (v2[0] - 1, v2[1])))
-                        faces.append(((v3[0] - 1, v3[1]), (v1[0] - 1, v1[1]), (v4[0] - 1, v4[1])))
-
-                    elif len(args) == 4:
-                        v1, v2, v3 = map(read_vertex, args[1:4])
-                        faces.append(((v1[0]-1, v1[1]), (v3[0]-1, v3[1]), (v2[0]-1, v2[1])))
-
-            if len(default_mesh.triangles) > 0:
-                model.mesh_list.append(default_mesh)
-
-            for mesh in material_meshes.values():
-                model.mesh_list.append(mesh)
-            #model.add_mesh(curr_mesh)
-            return model
-            #elif cmd == "vn":
-            #    nx, ny, nz = map(float, args[1:4])
-            #    normals.append((nx, ny, nz))
+        if obj is None:
+            with open(objfilepath, "r") as f:
+                obj = read_obj(f)
+
+        #if there is a mtl file in the .obj file
+        materials = {}
+        for mtlpath in obj.material_libraries:
+            if not os.path.isabs(mtlpath):
+                mtlpath = os.path.join(objpath, mtlpath)
+            materials.update(read_mtl(mtlpath, objpath))
+
+        for mtlname, material in materials.items():
+            material_json = materials_json.get(mtlname)
+            if material_json is not None:
+                culmode_str = material_json.get("CullMode", "Back")
+                if culmode_str == "Back":
+                    material.cull_mode = GL_BACK
+                elif culmode_str == "Front":
+                    material.cull_mode = GL_FRONT
+                else:
+                    material.cull_mode = None
+
+        positions = obj.positions * scale
+        if rotate:
+            positions = positions[:, (0, 2, 1)]
+        texcoords = numpy.stack((obj.texcoords[:, 0], 1.0 - obj.texcoords[:, 1]), axis=1)
+
+        # The faces of every material are merged into a single mesh.
+        default_mesh = TexturedMesh(Material(diffuse=(1.0, 1.0, 1.0)))
+        material_meshes = {}
+        mesh_groups = {default_mesh: []}
+        for group in obj.groups:
+            if group.material is None:
+                mesh = default_mesh
+            else:
+                mesh = material_meshes.get(group.material)
+                if mesh is None:
+                    mesh = material_meshes[group.material] = TexturedMesh(materials[group.material])
+                    mesh_groups[mesh] = []
+            mesh_groups[mesh].append(group)
+
+        for mesh, groups in mesh_groups.items():
+            mesh.vertex_positions = positions
+            mesh.vertex_texcoords = texcoords
+            if not groups:
+                continue
+            mesh.triangles = numpy.concatenate([group.triangles for group in groups])[:, (0, 2, 1)]
+            if groups[0].triangle_texcoords is not None:
+                mesh.triangle_texcoords = numpy.concatenate(
+                    [group.triangle_texcoords for group in groups])[:, (0, 2, 1)]
+
+        if len(default_mesh.triangles) > 0:
+            model.mesh_list.append(default_mesh)
+
+        for mesh in material_meshes.values():
+            model.mesh_list.append(mesh)
+        return model
+
+
+def read_mtl(mtlpath, objpath):
+    materials = {}
+    with open(mtlpath, "r") as g:
+        lastmat = None
+        lastdiffuse = None
+        lasttex = None
+        for mtl_line in g:
+            mtl_line = mtl_line.strip()
+            mtlargs = mtl_line.split(" ")
+
+            if len(mtlargs) == 0 or mtl_line.startswith("#"):
+                continue
+            if mtlargs[0] == "newmtl":
+                if lastmat is not None:
+                    if lasttex is not None and not os.path.isabs(lasttex):
+                        lasttex = os.path.join(objpath, lasttex)
+                    materials[lastmat] = Material(diffuse=lastdiffuse, texturepath=lasttex)
+                    lastdiffuse = None
+                    lasttex = None
+
+                lastmat = " ".join(mtlargs[1:])
+            elif mtlargs[0].lower() == "kd":
+                r, g, b = map(float, mtlargs[1:4])
+                lastdiffuse = (r,g,b)
+            elif mtlargs[0].lower() == "map_kd":
+                lasttex = " ".join(mtlargs[1:])
+                if lasttex.strip() == "":
+                    lasttex = None
+
+        if lastmat is not None:
+            if lasttex is not None and not os.path.isabs(lasttex):
+                lasttex = os.path.join(objpath, lasttex)
+            materials[lastmat] = Material(diffuse=lastdiffuse, texturepath=lasttex)
+
+    return materials
 
 
 ALPHA = 0.8
 
 
+INSTANCE_MATRIX_LOCATION = 5
+INSTANCE_STRIDE = 2 * 16 * 4
+
+_instancing_program = None
+
+
+def get_instancing_program():
+    """
+    Returns the shader program that draws meshes with a per-instance transformation matrix. The
+    vertices are additionally scaled by the `vertex_scale` uniform; the color is taken from
+    glColor as usual.
+    """
+    global _instancing_program
+    if _instancing_program is not None:
+        return _instancing_program
+
+    vertshader = """
+    #version 330 compatibility
+    layout(location = 0) in vec4 vert;
+    layout(location = 5) in mat4 instance_matrix;
+    uniform float vertex_scale;
+
+    void main(void)
+    {
+        gl_FrontColor = gl_Color;
+        gl_Position = gl_ModelViewProjectionMatrix * instance_matrix * vec4(vert.xyz * vertex_scale, 1.0);
+    }
+    """
+
+    fragshader = """
+    #version 330 compatibility
+
+    void main(void)
+    {
+        gl_FragColor = gl_Color;
+    }
+    """
+
+    vertexShaderObject = glCreateShader(GL_VERTEX_SHADER)
+    fragmentShaderObject = glCreateShader(GL_FRAGMENT_SHADER)
+    glShaderSource(vertexShaderObject, vertshader)
+    glShaderSource(fragmentShaderObject, fragshader)
+
+    _compile_shader_with_error_report(vertexShaderObject)
+    _compile_shader_with_error_report(fragmentShaderObject)
+
+    program = glCreateProgram()
+
+    glAttachShader(program, vertexShaderObject)
+    glAttachShader(program, fragmentShaderObject)
+
+    glLinkProgram(program)
+    _instancing_program = program
+    return program
+
+
+class MarkerInstances(object):
+    """
+    Buffer of per-instance matrices for drawing many copies of a `SelectableModel` in one call.
+
+    Every instance holds two column-major 4x4 matrices: the model matrix, and the matrix the
+    orientation axis of rotated markers is drawn with. Unselected instances come first, followed
+    by the selected ones, so that each group can be drawn with a single call.
+
+    The buffer is only uploaded again when the key passed to `update()` changes.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.counts = (0, 0)
+        self._vbo = None
+
+    def update(self, key, build):
+        """
+        Uploads the matrices returned by `build()` (a (N, 2, 4, 4) float32 array and a (N,) bool
+        array of selection states), unless `key` equals the key of the last upload.
+        """
+        if self._vbo is not None and key == self.key:
+            return
+        self.key = key
+
+        matrices, selected = build()
+        order = numpy.argsort(selected, kind="stable")
+        data = numpy.ascontiguousarray(matrices[order], dtype=numpy.float32)
+
+        if self._vbo is None:
+            self._vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data if len(data) else None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        selected_count = int(numpy.count_nonzero(selected))
+        self.counts = (len(data) - selected_count, selected_count)
+
+    def bind(self, first, matrix=0):
+        bind_instance_matrices(self._vbo, first * INSTANCE_STRIDE + matrix * 64, INSTANCE_STRIDE)
+
+    def unbind(self):
+        unbind_instance_matrices()
+
+
+def bind_instance_matrices(vbo, offset, stride):
+    glBindBuffer(GL_ARRAY_BUFFER, vbo)
+    for column in range(4):
+        location = INSTANCE_MATRIX_LOCATION + column
+        glEnableVertexAttribArray(location)
+        glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, stride,
+                              ctypes.c_void_p(offset + column * 16))
+        glVertexAttribDivisor(location, 1)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+
+def unbind_instance_matrices():
+    for column in range(4):
+        location = INSTANCE_MATRIX_LOCATION + column
+        glVertexAttribDivisor(location, 0)
+        glDisableVertexAttribArray(location)
+
+
+class LineBuffer(object):
+    """
+    Vertex buffer of colored line segments, drawn with a single call per line width. The buffer
+    is only uploaded again when the key passed to `update()` changes.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.ranges = []
+        self._vbo = None
+
+    def update(self, key, build):
+        """
+        Uploads the vertices returned by `build()`, a (N, 6) float32 array of positions and colors
+        along with a list of (line width, first vertex, vertex count) ranges, unless `key` equals
+        the key of the last upload.
+        """
+        if self._vbo is not None and key == self.key:
+            return
+        self.key = key
+
+        vertices, self.ranges = build()
+
+        if self._vbo is None:
+            self._vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices if len(vertices) else None,
+                     GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def render(self):
+        if not self.ranges:
+            return
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 24, None)
+        glColorPointer(3, GL_FLOAT, 24, ctypes.c_void_p(12))
+
+        for width, first, count in self.ranges:
+            glLineWidth(width)
+            glDrawArrays(GL_LINES, first, count)
+
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glLineWidth(1.0)
+
+
+class ArrowHeadBuffer(object):
+    """
+    Buffer of per-instance matrices for drawing arrow heads, drawn with a single instanced call
+    per line width and color. The buffer is only uploaded again when the key passed to
+    `update()` changes.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.ranges = []
+        self._vbo = None
+
+    def update(self, key, build):
+        """
+        Uploads the matrices returned by `build()`, a (N, 4, 4) column-major float32 array along
+        with a list of (line width, color, first instance, instance count) ranges, unless `key`
+        equals the key of the last upload.
+        """
+        if self._vbo is not None and key == self.key:
+            return
+        self.key = key
+
+        matrices, self.ranges = build()
+        data = numpy.ascontiguousarray(matrices, dtype=numpy.float32)
+
+        if self._vbo is None:
+            self._vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data if len(data) else None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def render(self, model):
+        if not self.ranges:
+            return
+
+        program = get_instancing_program()
+        glUseProgram(program)
+        glUniform1f(glGetUniformLocation(program, "vertex_scale"), 1.0)
+
+        for width, color, first, count in self.ranges:
+            bind_instance_matrices(self._vbo, first * 64, 64)
+            glLineWidth(width)
+            glColor3f(*color)
+            for mesh in model.mesh_list:
+                mesh.render_instanced(count)
+
+        unbind_instance_matrices()
+        glUseProgram(0)
+        glLineWidth(1.0)
+
+
 class SelectableModel(Model):
     def __init__(self):
         self.mesh_list = []
@@ -473,6 +693,8 @@ class SelectableModel(Model):
         self.displistSelected = None
         self.displistUnselected = None
 
+        self._instance_count = None
+
     def generate_displists(self):
         for mesh in self.mesh_list:
             mesh.generate_displist()
@@ -491,6 +713,35 @@ class SelectableModel(Model):
         else:
             glCallList(self.displistUnselected)
 
+    def render_instanced(self, instances: MarkerInstances):
+        """
+        Draws the model once for every instance in `instances`, with the same three passes
+        `render()` uses for a single model.
+        """
+        program = get_instancing_program()
+        glUseProgram(program)
+        scale_location = glGetUniformLocation(program, "vertex_scale")
+
+        first = 0
+        for selected, count in zip((False, True), instances.counts):
+            if count:
+                instances.bind(first)
+                self._instance_count = count
+                self.__render_instanced(selected, scale_location)
+                self._instance_count = None
+            first += count
+
+        instances.unbind()
+        glUseProgram(0)
+
+    def _draw_mesh(self, mesh):
+        # Meshes are drawn through this method so that the outline and body passes work for both
+        # the display lists and instanced rendering.
+        if self._instance_count is None:
+            mesh.render()
+        else:
+            mesh.render_instanced(self._instance_count)
+
     def _render_outline(self):
         pass
 
@@ -534,6 +785,27 @@ class SelectableModel(Model):
         glPopMatrix()
         glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
 
+    def __render_instanced(self, selected, scale_location):
+        outline_scale = 1.3 if selected else 1.2
+
+        # Same passes as in `__render()`, with the outline scale applied in the shader.
+        glDepthMask(GL_FALSE)
+        if selected:
+            glColor4f(*selectioncolor)
+        else:
+            glColor4f(0.0, 0.0, 0.0, 1.0)
+        glUniform1f(scale_location, outline_scale)
+        self._render_outline()
+        glDepthMask(GL_TRUE)
+
+        glUniform1f(scale_location, 1.0)
+        self._render_body()
+
+        glColorMask(GL_FALSE, GL_FALSE, GL_FALSE, GL_FALSE)
+        glUniform1f(scale_location, outline_scale)
+        self._render_outline()
+        glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
+
 
 class Cube(SelectableModel):
     def __init__(self, color=(1.0, 1.0, 1.0, 1.0)):
@@ -546,11 +818,11 @@ class Cube(SelectableModel):
         self.color = color
 
     def _render_outline(self):
-        self.mesh_list[0].render()
+        self._draw_mesh(self.mesh_list[0])
 
     def _render_body(self):
         glColor4f(*self.color)
-        self.mesh_list[0].render()
+        self._draw_mesh(self.mesh_list[0])
 
 
 class Cylinder(SelectableModel):
@@ -564,11 +836,11 @@ class Cylinder(SelectableModel):
         self.color = color
 
     def _render_outline(self):
-        self.mesh_list[0].render()
+        self._draw_mesh(self.mesh_list[0])
 
     def _render_body(self):
         glColor4f(*self.color)
-        self.mesh_list[0].render()
+        self._draw_mesh(self.mesh_list[0])
 
 
 class GenericObject(SelectableModel):
@@ -582,13 +854,13 @@ class GenericObject(SelectableModel):
         self.bodycolor = bodycolor
 
     def _render_outline(self):
-        self.named_meshes["Cube"].render()
+        self._draw_mesh(self.named_meshes["Cube"])
 
     def _render_body(self):
         glColor4f(*self.bodycolor)
-        self.named_meshes["Cube"].render()
+        self._draw_mesh(self.named_meshes["Cube"])
         glColor4ub(0x09, 0x93, 0x00, 0xFF)
-        self.named_meshes["tip"].render()
+        self._draw_mesh(self.named_meshes["tip"])
 
     def render_coloredid(self, id):
         glColor3ub((id >> 16) & 0xFF, (id >> 8) & 0xFF, (id >> 0) & 0xFF)
@@ -849,31 +1121,20 @@ class CollisionModel(object):
     hidden_coltypes = set()
     hidden_colgroups = set()
     def __init__(self, mkwii_collision):
-        meshes = {}
-        self.program = None
-       
-        self._displists = []
-        self.hidden_collision_types = set()
-        self.hidden_collision_type_groups = set()
-
-        for v1, v2, v3, coltype in mkwii_collision.triangles:
-            v1_new = v1.copy()
-            v2_new = v2.copy()
-            v3_new = v3.copy()
-            v1_new.z = -v1_new.z
-            v2_new.z = -v2_new.z
-            v3_new.z = -v3_new.z
-
-            v1tov2 = v2 - v1
-            v1tov3 = v3 - v1
-
-            normal = v1tov2.cross(v1tov3)
-            if normal.norm() != 0.0:
-                normal.normalize()
-
-            if coltype not in meshes:
-                meshes[coltype] = []
-
+        triangles = mkwii_collision.triangle_vertices
+        coltypes = mkwii_collision.triangle_types
+
+        normals = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        norms = numpy.linalg.norm(normals, axis=1)
+        nonzero = norms != 0.0
+        normals[nonzero] /= norms[nonzero][:, None]
+
+        # One interleaved position/normal/color vertex per triangle corner, grouped by collision
+        # type so that every type is a single contiguous range.
+        vertex_data = []
+        ranges = []
+        first = 0
+        for coltype in numpy.unique(coltypes).tolist():
             basic_coltype = coltype & 0x1F
 
             if basic_coltype in colortypes:
@@ -882,36 +1143,70 @@ class CollisionModel(object):
             else:
                 color = otherwise
             color = (color[0]/255.0, color[1]/255.0, color[2]/255.0)
-            meshes[coltype].append((v1, v2, v3, normal, color))
 
-        self.meshes = meshes
+            selected = coltypes == coltype
+            vertices = numpy.empty((numpy.count_nonzero(selected), 3, 9), dtype=numpy.float32)
+            vertices[:, :, 0:3] = triangles[selected][:, :, (0, 2, 1)]
+            vertices[:, :, 3:6] = normals[selected][:, None, :]
+            vertices[:, :, 6:9] = color
+            vertex_data.append(vertices.reshape(-1, 9))
 
-    def generate_displists(self):
+            count = len(vertices) * 3
+            ranges.append((coltype, first, count))
+            first += count
+
+        vertex_data = numpy.ascontiguousarray(numpy.concatenate(vertex_data)) if vertex_data \
+            else numpy.zeros((0, 9), dtype=numpy.float32)
+
+        self._setup(vertex_data, ranges)
+
+    @classmethod
+    def from_vertex_data(cls, vertex_data, ranges):
+        """
+        Recreates a model from its `vertex_data` and `ranges`, e.g. as stored on disk.
+        """
+        model = cls.__new__(cls)
+        model._setup(vertex_data, ranges)
+        return model
+
+    def _setup(self, vertex_data, ranges):
+        self.program = None
+
+        self._vao = None
+        self._vbo = None
+        self.hidden_collision_types = set()
+        self.hidden_collision_type_groups = set()
+
+        # The vertices of all triangles and the (collision type, first vertex, vertex count) range
+        # of every collision type within them.
+        self.vertex_data = vertex_data
+        self.ranges = [tuple(r) for r in ranges]
+
+    @property
+    def coltypes(self):
+        return [coltype for coltype, _first, _count in self.ranges]
+
+    def generate_buffers(self):
         if self.program is None:
             self.create_shaders()
 
-        for meshtype, mesh in self.meshes.items():
-            displist = glGenLists(1)
-            glNewList(displist, GL_COMPILE)
-            glEnable(GL_CULL_FACE)
-            glBegin(GL_TRIANGLES)
+        vertex_data = self.vertex_data
+        stride = vertex_data.strides[0]
 
-            for v1, v2, v3, normal, color in mesh:
-                glVertexAttrib3f(3, normal.x, normal.y, normal.z)
-                glVertexAttrib3f(4, *color)
-                glVertex3f(v1.x, v1.z, v1.y)
-                glVertexAttrib3f(3, normal.x, normal.y, normal.z)
-                glVertexAttrib3f(4, *color)
-                glVertex3f(v2.x, v2.z, v2.y)
-                glVertexAttrib3f(3, normal.x, normal.y, normal.z)
-                glVertexAttrib3f(4, *color)
-                glVertex3f(v3.x, v3.z, v3.y)
+        self._vao = glGenVertexArrays(1)
+        glBindVertexArray(self._vao)
 
-            glEnd()
-            glDisable(GL_CULL_FACE)
-            glEndList()
+        self._vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data, GL_STATIC_DRAW)
 
-            self._displists.append((meshtype, displist))
+        for location, offset in ((0, 0), (3, 12), (4, 24)):
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 3, GL_FLOAT, GL_FALSE, stride,
+                                  ctypes.c_void_p(offset))
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
 
     def create_shaders(self):
         vertshader = """
@@ -967,12 +1262,14 @@ class CollisionModel(object):
 
     def render(self, selected=False, selectedPart=None, cull_faces=None):
         if self.program is None:
-            self.generate_displists()
+            self.generate_buffers()
         factorval = glGetUniformLocation(self.program, "interpolate")
 
         glUseProgram(self.program)
+        glBindVertexArray(self._vao)
+        glEnable(GL_CULL_FACE)
 
-        for colltype, displist in self._displists:
+        for colltype, first, count in self.ranges:
             if (colltype in self.__class__.hidden_coltypes
                     or colltype & 0x001F in self.__class__.hidden_colgroups):
                 continue
@@ -981,6 +1278,17 @@ class CollisionModel(object):
                 glUniform1f(factorval, 1.0)
             else:
                 glUniform1f(factorval, 0.0)
-            glCallList(displist)
+            glDrawArrays(GL_TRIANGLES, first, count)
 
+        glDisable(GL_CULL_FACE)
+        glBindVertexArray(0)
         glUseProgram(0)
+
+    def delete_buffers(self):
+        if self._vao is not None:
+            glDeleteVertexArrays(1, [self._vao])
+            glDeleteBuffers(1, [self._vbo])
+            self._vao = self._vbo = None
+        if self.program is not None:
+            glDeleteProgram(self.program)
+            self.program = None
@@ -0,0 +1,224 @@
+"""
+Bulk parsing of Wavefront OBJ files into NumPy arrays.
+
+Instead of splitting every line into Python tuples, the lines of each kind are gathered with
+regular expressions and their numbers converted with a single NumPy call. Faces with any number
+of corners are fan-triangulated in one vectorized step, and the triangles are returned grouped
+by object and material as index arrays, ready to be turned into vertex buffers.
+"""
+import re
+from collections import namedtuple
+
+import numpy
+
+# The statements that are read; anything else (normals, smoothing groups, ...) is skipped.
+STATEMENT_PATTERN = re.compile(r"^[ \t]*(v|vt|f|l|o|usemtl|mtllib)[ \t]+(.*)$", re.M)
+
+# A run of faces and lines that share their object and material. `object_index` counts the
+# "o" statements, so that objects which happen to share a name remain apart. `triangles` and
+# `lines` hold 0-based position indices, `triangle_texcoords` the texture coordinate indices of
+# the triangle corners (-1 where a corner has none) or None if no face of the file has any.
+ObjGroup = namedtuple("ObjGroup", ["object", "object_index", "material", "triangles",
+                                   "triangle_texcoords", "lines"])
+
+ObjData = namedtuple("ObjData", ["positions", "texcoords", "groups", "material_libraries"])
+
+
+def _parse_floats(lines, columns):
+    if not lines:
+        return numpy.zeros((0, columns), dtype=numpy.float64)
+
+    values = numpy.fromstring(" ".join(lines), dtype=numpy.float64, sep=" ")
+    if len(values) % len(lines) == 0 and len(values) // len(lines) >= columns:
+        return values.reshape(len(lines), -1)[:, :columns]
+
+    # Lines with differing numbers of values, e.g. only some vertices with a w component.
+    return numpy.array([line.split()[:columns] for line in lines],
+                       dtype=numpy.float64).reshape(-1, columns)
+
+
+def _parse_corners(face_lines):
+    """
+    Returns the corner count of every face and the position and texture coordinate indices of
+    all corners, as written in the file (1-based or negative). The texture coordinate indices are
+    None if no corner has any.
+    """
+    counts = numpy.fromiter(map(len, map(str.split, face_lines)), dtype=numpy.int64,
+                            count=len(face_lines))
+    text = " ".join(face_lines)
+    corner_count = int(counts.sum())
+
+    first = text.split(None, 1)[0]
+    slashes = first.count("/")
+    if text.count("/") == corner_count * slashes and text.count("//") == corner_count * (
+            "//" in first):
+        if "//" in first:
+            values = numpy.fromstring(text.replace("//", " "), dtype=numpy.int64, sep=" ")
+            columns, has_texcoords = 2, False
+        else:
+            values = numpy.fromstring(text.replace("/", " "), dtype=numpy.int64, sep=" ")
+            columns, has_texcoords = slashes + 1, slashes >= 1
+
+        if len(values) == corner_count * columns:
+            values = values.reshape(-1, columns)
+            return counts, values[:, 0], values[:, 1] if has_texcoords else None
+
+    # Corners written in different ways within the file.
+    positions = numpy.empty(corner_count, dtype=numpy.int64)
+    texcoords = numpy.zeros(corner_count, dtype=numpy.int64)
+    for i, corner in enumerate(text.split()):
+        parts = corner.split("/")
+        positions[i] = int(parts[0])
+        if len(parts) > 1 and parts[1]:
+            texcoords[i] = int(parts[1])
+    return counts, positions, texcoords if texcoords.any() else None
+
+
+def _resolve_indices(indices, defined_before):
+    """
+    Turns 1-based and negative (relative) OBJ indices into 0-based indices; missing indices (0)
+    become -1. `defined_before` gives the number of elements defined before every index, as a
+    scalar or an array.
+    """
+    return numpy.where(indices > 0, indices - 1,
+                       numpy.where(indices < 0, defined_before + indices, -1))
+
+
+def _triangulate(counts):
+    """
+    Returns the corner numbers of the triangles that fan-triangulate faces with the given corner
+    counts, as a (N, 3) array.
+    """
+    triangle_counts = numpy.maximum(counts - 2, 0)
+    starts = numpy.cumsum(counts) - counts
+    total = int(triangle_counts.sum())
+
+    first = numpy.repeat(starts, triangle_counts)
+    offsets = numpy.arange(total) - numpy.repeat(numpy.cumsum(triangle_counts) - triangle_counts,
+                                                 triangle_counts)
+    return numpy.stack((first, first + offsets + 1, first + offsets + 2), axis=1)
+
+
+def _count_definitions(statements):
+    """
+    Returns the number of vertices and of texture coordinates defined before every face, which
+    is only needed when faces use relative indices.
+    """
+    vertices_before = []
+    texcoords_before = []
+    vertex_count = texcoord_count = 0
+    for kind, _rest in statements:
+        if kind == "f":
+            vertices_before.append(vertex_count)
+            texcoords_before.append(texcoord_count)
+        elif kind == "v":
+            vertex_count += 1
+        elif kind == "vt":
+            texcoord_count += 1
+    return (numpy.array(vertices_before, dtype=numpy.int64),
+            numpy.array(texcoords_before, dtype=numpy.int64))
+
+
+def _parse_lines(lines):
+    segments = []
+    for rest, vertices_before in lines:
+        indices = numpy.array([int(corner.split("/")[0]) for corner in rest.split()],
+                              dtype=numpy.int64)
+        indices = _resolve_indices(indices, vertices_before)
+        segments.append(numpy.stack((indices[:-1], indices[1:]), axis=1))
+    return numpy.concatenate(segments) if segments else numpy.zeros((0, 2), dtype=numpy.int64)
+
+
+def parse_obj(text):
+    """
+    Parses the OBJ file contents `text` into an `ObjData` holding the (N, 3) vertex positions,
+    the (N, 2) texture coordinates, the `ObjGroup`s in file order and the paths of the material
+    libraries, as written in the file.
+    """
+    statements = STATEMENT_PATTERN.findall(text)
+
+    vertex_lines = []
+    texcoord_lines = []
+    face_lines = []
+    material_libraries = []
+    add_vertex = vertex_lines.append
+    add_texcoord = texcoord_lines.append
+    add_face = face_lines.append
+
+    # (first face, object name, object index, material, lines) of every group.
+    groups = [[0, None, -1, None, []]]
+    for kind, rest in statements:
+        if kind == "f":
+            add_face(rest)
+        elif kind == "v":
+            add_vertex(rest)
+        elif kind == "vt":
+            add_texcoord(rest)
+        elif kind == "l":
+            groups[-1][4].append((rest, len(vertex_lines)))
+        elif kind == "mtllib":
+            material_libraries.append(rest.strip())
+        else:
+            _first, object_name, object_index, material, _lines = groups[-1]
+            rest = rest.strip()
+            if kind == "o":
+                object_name = rest.split(" ")[0]
+                object_index += 1
+            else:
+                material = rest
+            groups.append([len(face_lines), object_name, object_index, material, []])
+
+    positions = _parse_floats(vertex_lines, 3)
+    texcoords = _parse_floats(texcoord_lines, 2)
+
+    triangles = numpy.zeros((0, 3), dtype=numpy.int64)
+    triangle_texcoords = None
+    triangle_starts = numpy.zeros(len(face_lines) + 1, dtype=numpy.int64)
+    if face_lines:
+        counts, corner_positions, corner_texcoords = _parse_corners(face_lines)
+        if (corner_positions < 0).any() or (corner_texcoords is not None
+                                            and (corner_texcoords < 0).any()):
+            vertices_before, texcoords_before = _count_definitions(statements)
+            corner_positions = _resolve_indices(corner_positions,
+                                                numpy.repeat(vertices_before, counts))
+            if corner_texcoords is not None:
+                corner_texcoords = _resolve_indices(corner_texcoords,
+                                                    numpy.repeat(texcoords_before, counts))
+        else:
+            corner_positions = corner_positions - 1
+            if corner_texcoords is not None:
+                corner_texcoords = corner_texcoords - 1
+
+        corners = _triangulate(counts)
+        triangles = corner_positions[corners]
+        if corner_texcoords is not None:
+            triangle_texcoords = corner_texcoords[corners]
+        triangle_starts[1:] = numpy.cumsum(numpy.maximum(counts - 2, 0))
+
+    if len(triangles) and (triangles.min() < 0 or triangles.max() >= len(positions)):
+        raise RuntimeError("OBJ file has faces that refer to undefined vertices.")
+
+    obj_groups = []
+    for i, (first_face, object_name, object_index, material, lines) in enumerate(groups):
+        last_face = groups[i + 1][0] if i + 1 < len(groups) else len(face_lines)
+        first, last = triangle_starts[first_face], triangle_starts[last_face]
+        lines = _parse_lines(lines)
+        if len(lines) and (lines.min() < 0 or lines.max() >= len(positions)):
+            raise RuntimeError("OBJ file has lines that refer to undefined vertices.")
+
+        # Faces before the first "o" or "usemtl" statement only make a group if there are any.
+        if i == 0 and first == last and not len(lines):
+            continue
+
+        obj_groups.append(ObjGroup(
+            object_name, object_index, material, triangles[first:last],
+            triangle_texcoords[first:last] if triangle_texcoords is not None else None, lines))
+
+    return ObjData(positions, texcoords, obj_groups, material_libraries)
+
+
+def read_obj(f):
+    """
+    Parses the OBJ file `f`, opened in text mode. See `parse_obj()`.
+    """
+    return parse_obj(f.read())
@@ -1,8 +1,9 @@
 import os
 import json
 from OpenGL.GL import *
-from .model_rendering import (GenericObject, Model, TexturedModel, Cube, TransModel, Cylinder)
-from .vectors import Vector3, rotation_matrix_with_up_dir
+from .model_rendering import (GenericObject, Mesh, Model, TexturedModel, Cube, TransModel, Cylinder,
+                              MarkerInstances, LineBuffer, ArrowHeadBuffer, get_instancing_program)
+from .vectors import Vector3, Rotation, align_z_axis_with_target_dir, rotation_matrix_with_up_dir
 import numpy
 
 with open("lib/color_coding.json", "r") as f:
@@ -15,6 +16,192 @@ def do_rotation(rotation):
     glScalef(scale, scale, scale ** 2)
 
 
+def _marker_matrices(markers, rotated):
+    """
+    Computes the instance matrices of the markers collected by `MarkerBatch`, matching the
+    transformations of `ObjectModels._render_generic_position()` and
+    `ObjectModels._render_generic_position_rotation()`.
+    """
+    values = numpy.array([marker[:9] for marker in markers], dtype=numpy.float64).reshape(-1, 9)
+    selected = numpy.array([marker[9] for marker in markers], dtype=bool)
+    count = len(markers)
+
+    axis = numpy.tile(numpy.identity(4), (count, 1, 1))
+    axis[:, 0, 3] = values[:, 0]
+    axis[:, 1, 3] = -values[:, 2]
+    axis[:, 2, 3] = values[:, 1]
+    if rotated:
+        # glMultMatrixf() reads the nested lists of get_render() as columns.
+        rotations = numpy.array([Rotation(*marker[3:6]).get_render() for marker in markers],
+                                dtype=numpy.float64).reshape(-1, 4, 4)
+        axis = axis @ rotations.transpose(0, 2, 1) @ numpy.diag((10.0, 10.0, 100.0, 1.0))
+
+    scale = numpy.zeros((count, 4, 4))
+    scale[:, 0, 0] = values[:, 6]
+    scale[:, 1, 1] = values[:, 8]
+    scale[:, 2, 2] = values[:, 7]
+    scale[:, 3, 3] = 1.0
+
+    matrices = numpy.stack((axis @ scale, axis), axis=1)
+    # OpenGL expects the matrices column by column.
+    return matrices.transpose(0, 1, 3, 2).astype(numpy.float32), selected
+
+
+def _line_vertices(lines):
+    """
+    Computes the vertices and draw ranges of the lines collected by `LineBatch`, grouped by line
+    width.
+    """
+    values = numpy.array(sorted(lines), dtype=numpy.float64).reshape(-1, 10)
+
+    vertices = numpy.empty((len(values), 2, 6), dtype=numpy.float32)
+    for i, start in enumerate((4, 7)):
+        vertices[:, i, 0] = values[:, start]
+        vertices[:, i, 1] = -values[:, start + 2]
+        vertices[:, i, 2] = values[:, start + 1]
+        vertices[:, i, 3:6] = values[:, 1:4]
+
+    widths, firsts, counts = numpy.unique(values[:, 0], return_index=True, return_counts=True)
+    ranges = [(float(width), int(first) * 2, int(count) * 2)
+              for width, first, count in zip(widths, firsts, counts)]
+
+    return vertices.reshape(-1, 6), ranges
+
+
+def _normalize_rows(vectors):
+    return vectors / numpy.linalg.norm(vectors, axis=1)[:, None]
+
+
+def _align_z_axis_with_target_dirs(target_dirs, up_dirs):
+    # Vectorized version of `align_z_axis_with_target_dir()`.
+    target_dirs = target_dirs.copy()
+    up_dirs = up_dirs.copy()
+    target_dirs[~target_dirs.any(axis=1)] = (0.0, 0.0, 1.0)
+    up_dirs[~up_dirs.any(axis=1)] = (0.0, 1.0, 0.0)
+
+    parallel = ~numpy.cross(up_dirs, target_dirs).any(axis=1)
+    up_dirs[parallel] = numpy.cross(target_dirs[parallel], (1.0, 0.0, 0.0))
+    parallel = ~up_dirs.any(axis=1)
+    up_dirs[parallel] = numpy.cross(target_dirs[parallel], (0.0, 0.0, 1.0))
+
+    target_perp_dirs = numpy.cross(up_dirs, target_dirs)
+    target_up_dirs = numpy.cross(target_dirs, target_perp_dirs)
+
+    matrices = numpy.zeros((len(target_dirs), 4, 4))
+    matrices[:, 0, :3] = _normalize_rows(target_perp_dirs)
+    matrices[:, 1, :3] = _normalize_rows(target_up_dirs)
+    matrices[:, 2, :3] = _normalize_rows(target_dirs)
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def _arrow_head_matrices(arrows, campos, topdown, scale):
+    """
+    Computes the instance matrices and draw ranges of the arrow heads collected by `LineBatch`,
+    grouped by line width and color. Every arrow head points from its start position to the
+    middle of the segment, like `ObjectModels.draw_arrow_head()` does.
+    """
+    arrows = sorted(arrows)
+    values = numpy.array(arrows, dtype=numpy.float64).reshape(-1, 10)
+    starts = values[:, 4:7]
+    mids = (starts + values[:, 7:10]) / 2
+
+    if topdown:
+        up_dirs = numpy.tile((0.0, 1.0, 0.0), (len(values), 1))
+    else:
+        up_dirs = _normalize_rows(mids - (campos.x, campos.y, campos.z))
+
+    # Convert to GL base.
+    starts = starts[:, (0, 2, 1)] * (1.0, -1.0, 1.0)
+    mids = mids[:, (0, 2, 1)] * (1.0, -1.0, 1.0)
+    up_dirs = up_dirs[:, (0, 2, 1)] * (1.0, -1.0, 1.0)
+    directions = mids - starts
+
+    from_matrix = numpy.asarray(align_z_axis_with_target_dir(Vector3(-1, 0, 0),
+                                                             Vector3(0, 1, 0)))
+    rotations = from_matrix @ _align_z_axis_with_target_dirs(directions, up_dirs)
+    # glMultMatrixf() reads the rows of the matrix as columns.
+    rotations = rotations.transpose(0, 2, 1)
+    unrotated = ~directions.any(axis=1) | ~up_dirs.any(axis=1)
+    rotations[unrotated] = numpy.identity(4)
+
+    translations = numpy.tile(numpy.identity(4), (len(values), 1, 1))
+    translations[:, :3, 3] = mids
+
+    matrices = translations @ rotations @ numpy.diag((scale, scale, scale, 1.0))
+
+    ranges = []
+    for i, arrow in enumerate(arrows):
+        width, color = arrow[0], arrow[1:4]
+        if ranges and ranges[-1][0] == width and ranges[-1][1] == color:
+            ranges[-1][3] += 1
+        else:
+            ranges.append([width, color, i, 1])
+
+    # OpenGL expects the matrices column by column.
+    return matrices.transpose(0, 2, 1).astype(numpy.float32), [tuple(r) for r in ranges]
+
+
+class LineBatch(object):
+    """
+    Collects the route lines and arrow heads of a frame by category, so that every category is
+    drawn from one vertex buffer and one instance buffer once `render()` is called. The buffers
+    of a category are only rebuilt when its lines or arrow heads change.
+    """
+
+    def __init__(self, models):
+        self.models = models
+        self.lines = {}
+        self.arrows = {}
+
+    def add_line(self, category, pos1, pos2, color, width=1.0):
+        self.lines.setdefault(category, []).append(
+            (width, color[0], color[1], color[2], pos1.x, pos1.y, pos1.z, pos2.x, pos2.y, pos2.z))
+
+    def add_line_strip(self, category, positions, color, width=1.0):
+        for pos1, pos2 in zip(positions, positions[1:]):
+            self.add_line(category, pos1, pos2, color, width)
+
+    def add_arrow_head(self, category, startpos, endpos, color, width=1.0):
+        self.arrows.setdefault(category, []).append(
+            (width, color[0], color[1], color[2],
+             startpos.x, startpos.y, startpos.z, endpos.x, endpos.y, endpos.z))
+
+    def render(self, campos, topdown, scale):
+        for category in self.lines.keys() | self.arrows.keys():
+            self.models.render_lines(category, self.lines.get(category, []),
+                                     self.arrows.get(category, []), campos, topdown, scale)
+        self.lines = {}
+        self.arrows = {}
+
+
+class MarkerBatch(object):
+    """
+    Collects the markers of a frame by model, so that all markers of a model are drawn with a
+    single set of instanced draw calls once `render()` is called.
+    """
+
+    def __init__(self, models):
+        self.models = models
+        self.markers = {}
+
+    def add_position_colored(self, position, selected, cubename, scale=Vector3(1, 1, 1)):
+        self.markers.setdefault((cubename, False), []).append(
+            (position.x, position.y, position.z, 0.0, 0.0, 0.0, scale.x, scale.y, scale.z,
+             bool(selected)))
+
+    def add_position_rotation_colored(self, objecttype, position, rotation, selected,
+                                      scale=Vector3(1, 1, 1)):
+        self.markers.setdefault((objecttype, True), []).append(
+            (position.x, position.y, position.z, rotation.x, rotation.y, rotation.z,
+             scale.x, scale.y, scale.z, bool(selected)))
+
+    def render(self):
+        for (name, rotated), markers in self.markers.items():
+            self.models.render_instanced(name, rotated, markers)
+        self.markers = {}
+
+
 
 class ObjectModels(object):
     def __init__(self):
@@ -74,6 +261,17 @@ class ObjectModels(object):
         with open("resources/solidcylinder.obj", "r") as f:
             self.trans_cylinder = TransModel.from_obj(f, rotate=True)
 
+        # The orientation axis drawn next to rotated markers.
+        self.axis = Mesh("axis")
+        self.axis.vertices = [(0.0, 0.0, 750.0), (0.0, 0.0, 0.0), (1000.0, 0.0, 0.0)]
+        self.axis.lines = [(0, 1), (1, 2)]
+
+        # Instance buffers of the markers drawn through `MarkerBatch`, by (model name, rotated).
+        self.instances = {}
+        # Line and arrow head buffers of the categories drawn through `LineBatch`.
+        self.line_buffers = {}
+        self.arrow_head_buffers = {}
+
     def init_gl(self):
         for cube in (self.cylinder, self.cube,
                      self.enemypoint, self.enemypointfirst, self.itempoint, self.itempointfirst,
@@ -87,6 +285,12 @@ class ObjectModels(object):
                      self.startpoints, self.cannons, self.missions):
             cube.generate_displists()
 
+        # The categories of the scene cache are recorded into display lists. No other list can be
+        # compiled while one is recorded, so the meshes they draw must not compile theirs lazily.
+        for model in (self.sphere, self.unitcylinder, self.wireframe_cylinder, self.wireframe_cube,
+                      self.arrow_head, self.trans_cylinder):
+            model.generate_displists()
+
     def draw_arrow_head(self, frompos, topos, up_dir, scale):
         # Convert to GL base.
         frompos = Vector3(frompos.x, -frompos.z, frompos.y)
@@ -202,6 +406,57 @@ class ObjectModels(object):
 
         glPopMatrix()
 
+    def marker_batch(self):
+        return MarkerBatch(self)
+
+    def render_instanced(self, name, rotated, markers):
+        """
+        Draws the markers collected by a `MarkerBatch` for one model. The instance matrices are
+        only computed and uploaded again if the markers differ from the last frame.
+        """
+        if not markers:
+            return
+
+        instances = self.instances.get((name, rotated))
+        if instances is None:
+            instances = self.instances[(name, rotated)] = MarkerInstances()
+        instances.update(markers, lambda: _marker_matrices(markers, rotated))
+
+        if rotated:
+            program = get_instancing_program()
+            glUseProgram(program)
+            glUniform1f(glGetUniformLocation(program, "vertex_scale"), 1.0)
+            glColor3f(0.0, 0.0, 0.0)
+            instances.bind(0, matrix=1)
+            self.axis.render_instanced(len(markers))
+            instances.unbind()
+            glUseProgram(0)
+
+        getattr(self, name).render_instanced(instances)
+
+    def line_batch(self):
+        return LineBatch(self)
+
+    def render_lines(self, category, lines, arrows, campos, topdown, scale):
+        """
+        Draws the lines and arrow heads collected by a `LineBatch` for one category. The buffers
+        are only rebuilt if the lines or arrow heads differ from the last frame; in the 3D view,
+        arrow heads also follow the camera.
+        """
+        line_buffer = self.line_buffers.get(category)
+        if line_buffer is None:
+            line_buffer = self.line_buffers[category] = LineBuffer()
+        line_buffer.update(lines, lambda: _line_vertices(lines))
+        line_buffer.render()
+
+        arrow_head_buffer = self.arrow_head_buffers.get(category)
+        if arrow_head_buffer is None:
+            arrow_head_buffer = self.arrow_head_buffers[category] = ArrowHeadBuffer()
+        camera_key = (topdown, scale) if topdown else (topdown, scale, campos.x, campos.y, campos.z)
+        arrow_head_buffer.update((arrows, camera_key),
+                                 lambda: _arrow_head_matrices(arrows, campos, topdown, scale))
+        arrow_head_buffer.render(self.arrow_head)
+
     def render_generic_position_colored_id(self, position, id, scale=Vector3(1, 1, 1)):
         glPushMatrix()
         glTranslatef(position.x, -position.z, position.y)
@@ -0,0 +1,76 @@
+"""
+Packs the object parameter files (object_parameters/<name>.json) into a single pickled database,
+so that the editor reads one file instead of hundreds. The database remembers the size and
+modification time of every JSON file it was built from and is rebuilt once they change.
+
+To rebuild it by hand (e.g. before bundling the editor), run from the editor's directory:
+
+    python -m lib.object_parameters
+"""
+import json
+import os
+import pickle
+
+PARAMETERS_DIR = "object_parameters"
+DATABASE_PATH = os.path.join(PARAMETERS_DIR, "object_parameters.pickle")
+DATABASE_VERSION = 1
+
+
+def get_sources(dirpath=PARAMETERS_DIR):
+    sources = {}
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                sources[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return sources
+
+
+def read_sources(sources, dirpath=PARAMETERS_DIR):
+    parameters = {}
+    for filename in sorted(sources):
+        with open(os.path.join(dirpath, filename), "r") as f:
+            parameters[filename[:-len(".json")]] = json.load(f)
+    return parameters
+
+
+def build_database(dirpath=PARAMETERS_DIR, path=DATABASE_PATH):
+    sources = get_sources(dirpath)
+    parameters = read_sources(sources, dirpath)
+
+    database = {
+        "version": DATABASE_VERSION,
+        "sources": sources,
+        "parameters": parameters,
+    }
+    with open(path, "wb") as f:
+        pickle.dump(database, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return parameters
+
+
+def load_database(dirpath=PARAMETERS_DIR, path=DATABASE_PATH):
+    """
+    Returns the parameters of every object, by object name. If the database is missing or older
+    than the JSON files, it is rebuilt; if it can't be written, the JSON files are read directly.
+    """
+    sources = get_sources(dirpath)
+
+    try:
+        with open(path, "rb") as f:
+            database = pickle.load(f)
+        if database["version"] == DATABASE_VERSION and database["sources"] == sources:
+            return database["parameters"]
+    except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+        pass
+
+    try:
+        return build_database(dirpath, path)
+    except OSError as e:
+        print("Could not write object parameter database:", str(e))
+        return read_sources(sources, dirpath)
+
+
+if __name__ == "__main__":
+    print("Packed {0} object parameter files into {1}".format(len(build_database()),
+                                                              DATABASE_PATH))
@@ -0,0 +1,79 @@
+from collections import namedtuple
+from math import sqrt
+
+import numpy
+
+# Radius of the sphere that bounds the cylinder a marker is picked with: the cylinder model has a
+# radius and half height of 150 units and is drawn 1.2 times larger for picking.
+PICK_RADIUS = 150 * 1.2 * sqrt(2)
+
+ObjectSelectionEntry = namedtuple("ObjectSelectionEntry", ["obj", "pos1", "pos2", "pos3", "rotation"])
+
+# A pickable marker: `index` identifies the entry (index // 4) and which of its positions is
+# meant (index & 0b11), `scale` is relative to the point scale of the view.
+PickSlot = namedtuple("PickSlot", ["index", "position", "rotation", "scale"])
+
+
+def decode_pick_ids(pixels, count):
+    """
+    Returns the distinct marker indices in the first `count` RGB pixels of the buffer read back
+    from the color ID pass. Pixels whose red channel is 0xFF are background.
+    """
+    if isinstance(pixels, (bytes, bytearray, memoryview)):
+        pixels = numpy.frombuffer(pixels, dtype=numpy.uint8)
+    pixels = numpy.asarray(pixels, dtype=numpy.uint8).reshape(-1)[:count * 3].reshape(-1, 3)
+
+    pixels = pixels[pixels[:, 0] != 0xFF].astype(numpy.int64)
+    ids = ((pixels[:, 0] & 0x0F) << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+    return numpy.unique(ids).tolist()
+
+
+class PickIndex(object):
+    """
+    Screen-space lookup of the pickable markers of the document. The marker positions are kept
+    in an array, so that a click or a selection box is resolved by projecting all of them at once
+    instead of drawing every marker with a color ID and reading the pixels back.
+    """
+
+    def __init__(self, entries, slots):
+        self.entries = entries
+        self.slots = slots
+
+        self.positions = numpy.array([(slot.position.x, -slot.position.z, slot.position.y)
+                                      for slot in slots], dtype=numpy.float64).reshape(-1, 3)
+        self.radii = numpy.array([max(abs(slot.scale.x), abs(slot.scale.y), abs(slot.scale.z))
+                                  for slot in slots], dtype=numpy.float64) * PICK_RADIUS
+        self.indices = numpy.array([slot.index for slot in slots], dtype=numpy.int64)
+
+    def query(self, mvp, width, height, x, y, w, h, point_scale=1.0):
+        """
+        Returns the numbers of the slots whose markers overlap the rectangle at (x, y) of size
+        (w, h) in window coordinates (origin at the bottom left), ordered from front to back.
+        `mvp` is the combined projection and modelview matrix the markers are drawn with.
+        """
+        if not len(self.slots):
+            return numpy.empty(0, dtype=numpy.int64)
+
+        clip = self.positions @ mvp[:, :3].T + mvp[:, 3]
+        clip_w = clip[:, 3]
+        visible = clip_w > 1e-6
+        clip_w = numpy.where(visible, clip_w, 1.0)
+        ndc = clip[:, :3] / clip_w[:, None]
+        visible &= (ndc[:, 2] >= -1.0) & (ndc[:, 2] <= 1.0)
+
+        screen_x = (ndc[:, 0] + 1.0) * 0.5 * width
+        screen_y = (ndc[:, 1] + 1.0) * 0.5 * height
+
+        # The modelview matrix doesn't scale, so the rows of the combined matrix give the number
+        # of pixels per unit.
+        pixels_per_unit = max(numpy.linalg.norm(mvp[0, :3]) * 0.5 * width,
+                              numpy.linalg.norm(mvp[1, :3]) * 0.5 * height)
+        radii = self.radii * (point_scale * pixels_per_unit) / clip_w
+
+        # Distance from the marker centers to the closest point of the rectangle.
+        dx = numpy.maximum(numpy.maximum(x - screen_x, screen_x - (x + w)), 0.0)
+        dy = numpy.maximum(numpy.maximum(y - screen_y, screen_y - (y + h)), 0.0)
+        hit = visible & (dx * dx + dy * dy <= radii * radii)
+
+        slots = numpy.flatnonzero(hit)
+        return slots[numpy.argsort(ndc[slots, 2], kind="stable")]
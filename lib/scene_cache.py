@@ -0,0 +1,195 @@
+"""
+Caching of what the map view draws for the KMP document, so that frames in which only the camera
+moved don't walk the whole document again.
+
+The editor bumps a revision counter for every collection of the document it edits. paintGL draws
+the document category by category; every category is cached along with a key built from the
+revisions of the collections it shows (and the view settings it depends on), and is only drawn
+again once that key changes.
+"""
+from itertools import count
+
+from OpenGL.GL import *
+
+from .libkmp import (Area, Camera, CannonPoint, Checkpoint, CheckpointGroup, EnemyPoint,
+                     EnemyPointGroup, ItemPoint, ItemPointGroup, JugemPoint, KartStartPoint,
+                     MapObject, MissionPoint, Route, RoutePoint)
+from .object_models import LineBatch, MarkerBatch
+from .undo import get_reachable_ids
+
+COLLECTIONS = ("kartpoints", "enemypointgroups", "itempointgroups", "checkpoints", "routes",
+               "objects", "object_areas", "areas", "replayareas", "cameras", "respawnpoints",
+               "cannonpoints", "missionpoints")
+
+# Collections an edited object can be part of, by object type.
+OBJECT_COLLECTIONS = (
+    ((EnemyPoint, EnemyPointGroup), ("enemypointgroups", )),
+    ((ItemPoint, ItemPointGroup), ("itempointgroups", )),
+    ((Checkpoint, CheckpointGroup), ("checkpoints", )),
+    ((Route, RoutePoint), ("routes", )),
+    (MapObject, ("objects", )),
+    (KartStartPoint, ("kartpoints", )),
+    # Replay cameras are stored along with the replay areas.
+    (Camera, ("cameras", "replayareas")),
+    (Area, ("areas", "object_areas", "replayareas")),
+    (JugemPoint, ("respawnpoints", )),
+    (CannonPoint, ("cannonpoints", )),
+    (MissionPoint, ("missionpoints", )),
+)
+
+
+def get_collections(obj):
+    for types, collections in OBJECT_COLLECTIONS:
+        if isinstance(obj, types):
+            return collections
+    return COLLECTIONS
+
+
+class SceneRevisions(object):
+    """
+    Revision counters of the collections of the document. Revisions are drawn from a single
+    counter, so a collection never returns to a revision it had before.
+    """
+
+    def __init__(self):
+        self._counter = count(1)
+        self.revisions = dict.fromkeys(COLLECTIONS, 0)
+
+        # The object of every collection and the ids of the objects reachable from it, by name.
+        self._reachable = {}
+
+    def bump(self, collections=COLLECTIONS):
+        revision = next(self._counter)
+        for collection in collections:
+            self.revisions[collection] = revision
+
+    def bump_objects(self, objects, document=None):
+        """
+        Bumps the collections that `objects` are part of. If `document` is given, `objects` can be
+        any objects of it, e.g. the vectors and lists reported as changed by an undo entry; they
+        are looked up among the objects reachable from every collection of `document`.
+        """
+        if document is not None:
+            collections = self._find_collections(document, set(map(id, objects)))
+        else:
+            collections = set()
+            for obj in objects:
+                collections.update(get_collections(obj))
+        if collections:
+            self.bump(collections)
+
+    def _find_collections(self, document, ids):
+        # The reachable objects of a collection can only change along with one of the objects
+        # reachable from it, so they are only gathered again for the collections that are found.
+        collections = []
+        for collection in COLLECTIONS:
+            root = getattr(document, collection)
+            cached = self._reachable.get(collection)
+            if cached is None or cached[0] is not root or not cached[1].isdisjoint(ids):
+                self._reachable[collection] = (root, get_reachable_ids(root))
+                collections.append(collection)
+        return collections
+
+    def get(self, *collections):
+        return tuple(self.revisions[collection] for collection in collections)
+
+
+class SceneCacheEntry(object):
+    def __init__(self):
+        self.key = None
+        self.displist = glGenLists(1)
+        self.markers = None
+        self.lines = None
+
+
+class SceneCache(object):
+    """
+    Cached drawing of the categories of the scene. For every category, the markers and route
+    lines are kept as collected by `MarkerBatch` and `LineBatch`, and everything else that is
+    drawn directly is recorded in a display list.
+    """
+
+    def __init__(self, models):
+        self.models = models
+        self.entries = {}
+        self.values = {}
+        self.drawn = []
+        self.current = None
+
+    @property
+    def markers(self) -> MarkerBatch:
+        return self.current.markers
+
+    @property
+    def lines(self) -> LineBatch:
+        return self.current.lines
+
+    def begin(self, category, key):
+        """
+        Returns True if `category` has to be drawn again, in which case the caller draws it into
+        `markers`, `lines` and the GL context and then calls `end()`. Otherwise the cached drawing
+        of the category is used.
+        """
+        if self.current is not None:
+            # The previous category was not finished (e.g. due to an exception); it is drawn
+            # again next time.
+            self.current.key = None
+            self.end()
+
+        self.drawn.append(category)
+        entry = self.entries.get(category)
+        if entry is not None and entry.key == key:
+            glCallList(entry.displist)
+            return False
+
+        if entry is None:
+            entry = self.entries[category] = SceneCacheEntry()
+        entry.key = key
+        entry.markers = MarkerBatch(self.models)
+        entry.lines = LineBatch(self.models)
+
+        glNewList(entry.displist, GL_COMPILE_AND_EXECUTE)
+        self.current = entry
+        return True
+
+    def end(self):
+        glEndList()
+        self.current = None
+
+    def value(self, name, key, compute):
+        """
+        Returns the value computed by `compute()`, which is only called again once `key` changes.
+        """
+        cached = self.values.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        value = compute()
+        self.values[name] = (key, value)
+        return value
+
+    def render(self, campos, topdown, arrow_head_scale):
+        """
+        Draws the markers and route lines of all categories that were drawn in this frame.
+        """
+        markers = MarkerBatch(self.models)
+        lines = LineBatch(self.models)
+        for category in self.drawn:
+            entry = self.entries[category]
+            for name, items in entry.markers.markers.items():
+                markers.markers.setdefault(name, []).extend(items)
+            for name, items in entry.lines.lines.items():
+                lines.lines.setdefault(name, []).extend(items)
+            for name, items in entry.lines.arrows.items():
+                lines.arrows.setdefault(name, []).extend(items)
+        self.drawn = []
+
+        markers.render()
+        lines.render(campos, topdown, arrow_head_scale)
+
+    def clear(self):
+        for entry in self.entries.values():
+            glDeleteLists(entry.displist, 1)
+        self.entries = {}
+        self.values = {}
+        self.drawn = []
+        self.current = None
@@ -0,0 +1,373 @@
+import sys
+from operator import is_
+
+# Objects from these modules make up the document and have their state recorded.
+TRACKED_MODULES = ("lib.libkmp", "lib.vectors")
+
+# Attributes that don't belong to the document data: the selection flags and the editing widgets.
+UNTRACKED_ATTRIBUTES = ("selected", "widget")
+
+ATOMIC_TYPES = (bool, int, float, complex, str, bytes, tuple, type(None))
+
+
+def _is_tracked(value):
+    if isinstance(value, (list, dict)):
+        return True
+    return type(value).__module__ in TRACKED_MODULES and hasattr(value, "__dict__")
+
+
+def _is_held_by_value(value):
+    # Vectors, lists and dicts belong to the object that holds them, unlike the other document
+    # objects, which are referred to from several places.
+    return type(value) in (list, dict) or type(value).__module__ == "lib.vectors"
+
+
+def _same_value(a, b):
+    # Tracked objects are compared by identity; their own changes are recorded separately.
+    if a is b:
+        return True
+    if type(a) is not type(b) or not isinstance(a, ATOMIC_TYPES):
+        return False
+    if isinstance(a, tuple):
+        # Tuples are compared by value, but the tracked objects in them still by identity.
+        return _same_values(a, b)
+    return a == b
+
+
+def _same_values(a, b):
+    if len(a) != len(b):
+        return False
+    # Unchanged values are almost always the very same objects, which is checked at C speed.
+    return all(map(is_, a, b)) or all(map(_same_value, a, b))
+
+
+def _same_attributes(a, b):
+    if a.keys() != b.keys():
+        return False
+    if all(map(is_, a.values(), b.values())):
+        return True
+    return all(_same_value(value, b[key]) for key, value in a.items()
+               if key not in UNTRACKED_ATTRIBUTES)
+
+
+def _matches_state(obj, state):
+    items, mapping, attributes, _children = state
+    if items is not None and not _same_values(obj, items):
+        return False
+    if mapping is not None and not (_same_values(mapping, obj)
+                                    and _same_values(mapping.values(), obj.values())):
+        return False
+    if attributes is not None and not _same_attributes(obj.__dict__, attributes):
+        return False
+    return True
+
+
+def _get_tracked_children(values, children):
+    for value in values:
+        if isinstance(value, tuple):
+            _get_tracked_children(value, children)
+        elif _is_tracked(value):
+            children.append(value)
+    return children
+
+
+def _get_state(obj):
+    """
+    Returns a shallow copy of the list items, dict entries and attributes of `obj`, along with the
+    tracked objects they refer to.
+    """
+    items = list(obj) if isinstance(obj, list) else None
+    mapping = dict(obj) if isinstance(obj, dict) else None
+    attributes = dict(obj.__dict__) if hasattr(obj, "__dict__") else None
+
+    children = []
+    if items is not None:
+        _get_tracked_children(items, children)
+    if mapping is not None:
+        _get_tracked_children(mapping.keys(), children)
+        _get_tracked_children(mapping.values(), children)
+    if attributes is not None:
+        _get_tracked_children(attributes.values(), children)
+
+    return items, mapping, attributes, children
+
+
+def get_reachable_ids(root):
+    """
+    Returns the ids of `root` and of all tracked objects that can be reached from it, i.e. the
+    objects whose changes an undo entry can report for that part of the document.
+    """
+    ids = set()
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        key = id(obj)
+        if key in ids:
+            continue
+        ids.add(key)
+
+        if isinstance(obj, list):
+            _get_tracked_children(obj, stack)
+        elif isinstance(obj, dict):
+            _get_tracked_children(obj.keys(), stack)
+            _get_tracked_children(obj.values(), stack)
+        if hasattr(obj, "__dict__"):
+            _get_tracked_children(obj.__dict__.values(), stack)
+    return ids
+
+
+def _set_state(obj, state):
+    items, mapping, attributes, _children = state
+    if items is not None:
+        obj[:] = items
+    if mapping is not None:
+        obj.clear()
+        obj.update(mapping)
+    if attributes is not None:
+        current = obj.__dict__
+        kept = {key: current[key] for key in UNTRACKED_ATTRIBUTES if key in current}
+        current.clear()
+        current.update(attributes)
+        current.update(kept)
+
+
+def _get_value_size(value):
+    # Tracked objects are measured by their own states.
+    if _is_tracked(value):
+        return 0
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(map(_get_value_size, value))
+    return size
+
+
+def _get_state_size(state):
+    """
+    Returns the number of bytes taken up by `state`: its containers along with the values stored in
+    them. Values that are shared with other states or the document are counted as well.
+    """
+    items, mapping, attributes, children = state
+    size = sys.getsizeof(children)
+    if items is not None:
+        size += sys.getsizeof(items) + sum(map(_get_value_size, items))
+    if mapping is not None:
+        size += (sys.getsizeof(mapping) + sum(map(_get_value_size, mapping.keys()))
+                 + sum(map(_get_value_size, mapping.values())))
+    if attributes is not None:
+        size += sys.getsizeof(attributes) + sum(map(_get_value_size, attributes.values()))
+    return size
+
+
+class UndoEntry:
+    """
+    The changes that lead from the previous undo entry to this one, as a mapping from object id to
+    (object, old state, new state). A state of None means the object was not part of the document
+    on that side of the change.
+    """
+
+    def __init__(self, document, previous_document, changes, selected):
+        self.document = document
+        self.previous_document = previous_document
+        self.changes = changes
+        self.selected = selected
+
+        self.size = sys.getsizeof(selected) + sum(_get_state_size(state) for _obj, old_state, new_state in changes.values()
+                        for state in (old_state, new_state) if state is not None)
+
+    @property
+    def document_changed(self) -> bool:
+        return bool(self.changes) or self.document is not self.previous_document
+
+
+class UndoHistory:
+    """
+    Undo history that stores per-object differences between document states instead of full
+    copies of the document. Undoing and redoing modify the recorded objects in place, so object
+    identities (and with them the editor's selection) survive.
+
+    Once the recorded changes take up more than `memory_limit` bytes, the oldest entries are
+    dropped.
+    """
+
+    def __init__(self, memory_limit):
+        self.memory_limit = memory_limit
+
+        self.undo_entries: list[UndoEntry] = []
+        self.redo_entries: list[UndoEntry] = []
+
+        # State of every object of the document at the top undo entry, by object id. Holding on to
+        # the objects keeps their ids from being reused.
+        self._states = {}
+        self._size = 0
+
+    @property
+    def top(self) -> UndoEntry:
+        return self.undo_entries[-1] if self.undo_entries else None
+
+    def can_undo(self) -> bool:
+        return len(self.undo_entries) > 1
+
+    def can_redo(self) -> bool:
+        return bool(self.redo_entries)
+
+    def record(self, document, selected, touched=None):
+        """
+        Compares `document` against the top undo entry and pushes a new entry if the document or
+        the selection differ. Returns the new entry, or None if nothing changed.
+
+        By default, every object of the document is compared. A caller that knows all objects it
+        changed since the top undo entry can pass them as `touched`; then only these objects, the
+        vectors, lists and dicts they hold and the objects added to them are compared. Objects that
+        were removed from the document are only noticed by the next full comparison.
+        """
+        top = self.top
+        if touched is None or top is None or top.document is not document:
+            states, changes = self._compare_all(document)
+        else:
+            states, changes = self._compare_touched(touched)
+
+        selected = list(selected)
+        if top is None:
+            # The first entry is the baseline that cannot be undone.
+            changes = {}
+        elif (not changes and top.document is document
+              and _same_values(top.selected, selected)):
+            return None
+
+        entry = UndoEntry(document, top.document if top is not None else document, changes,
+                          selected)
+        self._states = states
+        self.undo_entries.append(entry)
+        self._size += entry.size
+
+        for redo_entry in self.redo_entries:
+            self._size -= redo_entry.size
+        self.redo_entries.clear()
+
+        self._enforce_memory_limit()
+
+        return entry
+
+    def _compare_all(self, document):
+        previous_states = self._states
+        states = {}
+        changes = {}
+
+        stack = [document]
+        while stack:
+            obj = stack.pop()
+            key = id(obj)
+            if key in states:
+                continue
+
+            previous = previous_states.get(key)
+            if previous is not None and _matches_state(obj, previous[1]):
+                state = previous[1]
+            else:
+                state = _get_state(obj)
+                changes[key] = (obj, previous[1] if previous is not None else None, state)
+            states[key] = (obj, state)
+
+            stack.extend(state[3])
+
+        for key, (obj, state) in previous_states.items():
+            if key not in states:
+                changes[key] = (obj, state, None)
+
+        return states, changes
+
+    def _compare_touched(self, touched):
+        # The states of the other objects are left as they are, so they are updated in place.
+        states = self._states
+        changes = {}
+        compared = set()
+
+        stack = list(touched)
+        while stack:
+            obj = stack.pop()
+            key = id(obj)
+            if key in compared:
+                continue
+            compared.add(key)
+
+            previous = states.get(key)
+            if previous is not None and _matches_state(obj, previous[1]):
+                state = previous[1]
+            else:
+                state = _get_state(obj)
+                changes[key] = (obj, previous[1] if previous is not None else None, state)
+                states[key] = (obj, state)
+
+            stack.extend(child for child in state[3]
+                         if _is_held_by_value(child) or id(child) not in states)
+
+        return states, changes
+
+    def record_selection(self, selected):
+        """
+        Pushes an entry that only changes the selection, if it differs from the top undo entry.
+        Unlike `record()`, the document is not inspected at all; the entry merely holds the list of
+        selected objects.
+        """
+        top = self.top
+        selected = list(selected)
+        if top is None or _same_values(top.selected, selected):
+            return None
+
+        entry = UndoEntry(top.document, top.document, {}, selected)
+        self.undo_entries.append(entry)
+        self._size += entry.size
+
+        for redo_entry in self.redo_entries:
+            self._size -= redo_entry.size
+        self.redo_entries.clear()
+
+        self._enforce_memory_limit()
+
+        return entry
+
+    def undo(self):
+        """
+        Reverts the top undo entry in place and returns the entry that is now at the top, or None
+        if there is nothing to undo.
+        """
+        if not self.can_undo():
+            return None
+
+        entry = self.undo_entries.pop()
+        self._apply(entry, reverse=True)
+        self.redo_entries.insert(0, entry)
+        return self.top
+
+    def redo(self):
+        """
+        Reapplies the next redo entry in place and returns it, or None if there is nothing to redo.
+        """
+        if not self.can_redo():
+            return None
+
+        entry = self.redo_entries.pop(0)
+        self._apply(entry, reverse=False)
+        self.undo_entries.append(entry)
+        return entry
+
+    def _apply(self, entry, reverse):
+        for key, (obj, old_state, new_state) in entry.changes.items():
+            state = old_state if reverse else new_state
+            if state is None:
+                self._states.pop(key, None)
+            else:
+                _set_state(obj, state)
+                self._states[key] = (obj, state)
+
+    def _enforce_memory_limit(self):
+        while self._size > self.memory_limit and len(self.undo_entries) > 1:
+            self._size -= self.undo_entries.pop(0).size
+
+            # The oldest remaining entry becomes the new baseline; its changes are never applied
+            # again.
+            baseline = self.undo_entries[0]
+            self._size -= baseline.size
+            baseline.changes = {}
+            baseline.size = sys.getsizeof(baseline.selected)
+            self._size += baseline.size
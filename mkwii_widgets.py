@@ -21,13 +21,15 @@ from lib.vectors import Matrix4x4, Vector3, Line, Plane, Rotation
 from lib.model_rendering import Grid, TransPlane
 from gizmo import Gizmo
 from lib.object_models import ObjectModels
+from lib.scene_cache import COLLECTIONS, SceneCache, SceneRevisions
+from lib.pick_index import ObjectSelectionEntry, PickIndex, PickSlot, decode_pick_ids
+from lib.model_cache import get_data_key, object_model_cache
 from editor_controls import UserControl
 #from lib.libpath import Paths
 from lib.libkmp import KMP, ReplayCameraRoutePoint
 import numpy
 from editor_preview import *
 
-ObjectSelectionEntry = namedtuple("ObjectSelectionEntry", ["obj", "pos1", "pos2", "pos3", "rotation"])
 
 MOUSE_MODE_NONE = 0
 MOUSE_MODE_MOVEWP = 1
@@ -227,12 +229,14 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
         self.snapping_last_hash = None
         self.snapping_display_list = None
 
-        self.additional_models = {}
+        self.object_model_keys = {}
 
         # Initialize some models
         with open("resources/gizmo.obj", "r") as f:
             self.gizmo = Gizmo.from_obj(f, rotate=True)
         self.models = ObjectModels()
+        self.scene_cache = SceneCache(self.models)
+        self.scene_revisions = SceneRevisions()
         self.grid = Grid(1000000, 1000000, 10000)
 
         self.modelviewmatrix = None
@@ -373,6 +377,9 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
             check_gizmo_hover_id = self._mouse_pos_changed and self.should_check_gizmo_hover_id()
             self._mouse_pos_changed = False
 
+            if object_model_cache.poll():
+                self._frame_invalid = True
+
             if self._frame_invalid or check_gizmo_hover_id or self.preview is not None:
                 self.update()
                 self._lastrendertime = now
@@ -507,6 +514,19 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
         self.MOVE_LEFT = left
         self.MOVE_RIGHT = right
 
+    def invalidate_scene(self, objects=None, from_document=False):
+        """
+        Marks the collections of the document that `objects` belong to as changed, or all of them
+        if `objects` is None, so that paintGL draws them again. With `from_document`, `objects`
+        can be any objects of the document, such as the changes of an undo entry.
+        """
+        if objects is None:
+            self.scene_revisions.bump()
+        elif from_document:
+            self.scene_revisions.bump_objects(objects, self.level_file)
+        else:
+            self.scene_revisions.bump_objects(objects)
+
     def do_redraw(self, force=False):
         self._frame_invalid = True
         if force:
@@ -543,7 +563,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
         self.rotation_is_pressed = False
         self.connecting_mode = False
         self.connecting_start = None
-        self.additional_models = {}
+        self.object_model_keys = {}
 
         self._frame_invalid = False
         self._mouse_pos_changed = False
@@ -554,18 +574,21 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
         self.MOVE_RIGHT = 0
         self.SPEEDUP = 0
 
-    def set_collision(self, faces, alternative_mesh):
-        self.collision = Collision(faces)
+    def clear_collision(self):
+        self.collision = None
+        self.alternative_mesh = None
+        if self.main_model is not None:
+            glDeleteLists(self.main_model, 1)
+            self.main_model = None
+        self.do_redraw()
+
+    def set_collision(self, collision, alternative_mesh):
+        self.collision = collision
         additional_collision = {}
         for mapobject in self.level_file.objects:
-            kcl_name = mapobject.get_kcl_name()
-            if kcl_name is None:
-                continue
-            if kcl_name not in self.additional_models.keys():
-                collision_model = MapObjectModel(kcl_name, self.editor.read_kcl_file).collision
-                if collision_model is None:
-                    continue
-                additional_collision[mapobject] = collision_model
+            model = self.get_object_model(mapobject)
+            if model is not None:
+                additional_collision[mapobject] = model.collision
         self.collision.obj_meshes = additional_collision
 
         if self.main_model is None:
@@ -574,9 +597,13 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
         self.alternative_mesh = alternative_mesh
 
         glNewList(self.main_model, GL_COMPILE)
-        #glBegin(GL_TRIANGLES)
-        draw_collision(faces)
-        #glEnd()
+        if alternative_mesh is None:
+            # draw_collision() takes the faces in KMP coordinates.
+            corners = collision.vertices[collision.faces][..., (0, 2, 1)] * (1.0, 1.0, -1.0)
+            faces = [tuple(Vector3(*corner) for corner in face) for face in corners.tolist()]
+            #glBegin(GL_TRIANGLES)
+            draw_collision(faces)
+            #glEnd()
         glEndList()
 
     def set_mouse_mode(self, mode):
@@ -634,6 +661,8 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
     #@catch_exception_with_dialog
     #@catch_exception
     def paintGL(self):
+        object_model_cache.free_evicted()
+
         offset_x = self.position.x
         offset_z = self.position.z
 
@@ -715,12 +744,20 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
             pixels = glReadPixels(mouse_pos.x(), self.canvas_height - mouse_pos.y(), 1, 1, GL_RGB, GL_UNSIGNED_BYTE)
             gizmo_hover_id = pixels[2]
 
-        objectroutes = self.level_file.objects.get_routes()
-        cameraroutes = self.level_file.cameras.get_routes()
-        replaycameraroutes = self.level_file.replayareas.get_routes()
-        arearoutes = self.level_file.areas.get_routes()
-
-        replaycameras = self.level_file.replayareas.get_cameras()
+        scene = self.scene_cache
+        revisions = self.scene_revisions
+        objectroutes = scene.value("objectroutes", revisions.get("objects", "routes"),
+                                   self.level_file.objects.get_routes)
+        cameraroutes = scene.value("cameraroutes", revisions.get("cameras", "routes"),
+                                   self.level_file.cameras.get_routes)
+        replaycameraroutes = scene.value("replaycameraroutes",
+                                         revisions.get("replayareas", "routes"),
+                                         self.level_file.replayareas.get_routes)
+        arearoutes = scene.value("arearoutes", revisions.get("areas", "routes"),
+                                 self.level_file.areas.get_routes)
+
+        replaycameras = scene.value("replaycameras", revisions.get("replayareas", "cameras"),
+                                    self.level_file.replayareas.get_cameras)
 
         vismenu: FilterViewMenu = self.visibility_menu
 
@@ -772,206 +809,40 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
             selected_positions = []
             selected_rotations = []
 
+            gpu_picking = self.editorconfig is not None and self.editorconfig.get("gpu_picking") == "True"
+
+            if not do_gizmo:
+                pick_index = self.get_pick_index(vismenu, objectroutes, cameraroutes,
+                                                 replaycameraroutes, arearoutes, replaycameras)
+                objlist = pick_index.entries
+
             continue_picking = not do_gizmo
             while continue_picking:
-                glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-                id = 0x100000
-
-                objlist = []
-                offset = 0
-
-                #self.dolphin.render_collision(self, objlist)s
-
-                if vismenu.enemyroutes.is_selectable():
-                    for i, obj in enumerate(obj for obj in self.level_file.enemypointgroups.points() if obj not in selected):
-                        objlist.append(
-                            ObjectSelectionEntry(obj=obj,
-                                                 pos1=obj.position,
-                                                 pos2=None,
-                                                 pos3=None,
-                                                 rotation=None)
-                        )
-                        self.models.render_generic_position_colored_id(obj.position, id + (offset+i) * 4, point_scale)
-
-                    offset = len(objlist)
-
-                if vismenu.itemroutes.is_selectable():
-                    for i, obj in enumerate(obj for obj in self.level_file.itempointgroups.points() if obj not in selected):
-                        objlist.append(
-                            ObjectSelectionEntry(obj=obj,
-                                                 pos1=obj.position,
-                                                 pos2=None,
-                                                 pos3=None,
-                                                 rotation=None)
-                        )
-                        self.models.render_generic_position_colored_id(obj.position, id + (offset+i) * 4, point_scale)
-
-                    offset = len(objlist)
-
-                if vismenu.objects.is_selectable(): #object routes
-                    i = 0
-                    for route in objectroutes:
-                        for obj in route.points:
-                            if obj in selected:
-                                continue
-                            objlist.append(
-                                ObjectSelectionEntry(obj=obj,
-                                                 pos1=obj.position,
-                                                 pos2=None,
-                                                 pos3=None,
-                                                 rotation=None))
-                            self.models.render_generic_position_colored_id(obj.position, id + (offset+i) * 4, point_scale)
-                            i += 1
-                    offset = len(objlist)
-
-                if vismenu.objects.is_selectable(): #object routes
-                    for i, obj in enumerate(obj for obj in self.level_file.objects if obj not in selected):
-                        objlist.append(
-                            ObjectSelectionEntry(obj=obj,
-                                                pos1=obj.position,
-                                                pos2=None,
-                                                pos3=None,
-                                                rotation=obj.rotation))
-                        object_scale = point_scale.scale_vec(obj.scale)
-                        self.models.render_generic_position_rotation_colored_id(obj.position, obj.rotation, id + (offset+i) * 4, object_scale)
-                        i += 1
-                    offset = len(objlist)
-
-                if vismenu.cameras.is_selectable():
-                    for i, obj in enumerate(obj for obj in self.level_file.cameras if obj not in selected):
-                        objlist.append(
-                            ObjectSelectionEntry(obj=obj,
-                                                    pos1=obj.position,
-                                                    pos2=obj.position2_simple,
-                                                    pos3=obj.position3_simple,
-                                                    rotation=None))
-                        self.models.render_generic_position_colored_id(obj.position,
-                                                                                id + (offset + i) * 4, point_scale)
-                        self.models.render_generic_position_colored_id(obj.position2_simple, id + (offset + i) * 4 + 1, point_scale)
-                        self.models.render_generic_position_colored_id(obj.position3_simple, id + (offset + i) * 4 + 2, point_scale)
-
-                    offset = len(objlist)
-
-                if vismenu.cameras.is_selectable(): #camera routes
-                    i = 0
-                    for route in cameraroutes:
-                        for obj in route.points[1:]:
-                            if obj in selected:
-                                continue
-                            objlist.append(
-                                ObjectSelectionEntry(obj=obj,
-                                                 pos1=obj.position,
-                                                 pos2=None,
-                                                 pos3=None,
-                                                 rotation=None))
-                            self.models.render_generic_position_colored_id(obj.position, id + (offset+i) * 4, point_scale)
-                            i += 1
-
-                    offset = len(objlist)
-
-                if vismenu.replaycameras.is_selectable(): #routes
-                    i = 0
-                    for route in replaycameraroutes:
-                        for obj in route.points[1:]:
-                            if obj in selected:
-                                continue
-                            pos = obj.position.render()
-                            objlist.append(
-                                ObjectSelectionEntry(obj=obj,
-                                                 pos1=pos,
-                                                 pos2=None,
-                                                 pos3=None,
-                                                 rotation=None))
-                            self.models.render_generic_position_colored_id(pos, id + (offset+i) * 4, point_scale)
-                            i += 1
-
-                    offset = len(objlist)
-
-                if vismenu.replaycameras.is_selectable():
-                    for i, obj in enumerate(obj for obj in replaycameras if obj not in selected):
-                        pos1 = obj.position
-                        pos2 = None
-                        pos3 = None
-                        if (obj.type == 1 and not obj.follow_player):
-                            pos2 = obj.position2_simple.render()
-                            pos3 = obj.position3_simple.render()
-                        if obj.type == 3:
-                            pos1 = obj.position.render()
-                        objlist.append( ObjectSelectionEntry(obj=obj,
-                                                    pos1=pos1,
-                                                    pos2=pos2,
-                                                    pos3=pos3,
-                                                    rotation=None))
-                        self.models.render_generic_position_colored_id(pos1, id + (offset + i) * 4, point_scale)
-                        if pos2 is not None:
-                             self.models.render_generic_position_colored_id(pos2, id + (offset + i) * 4 + 1, point_scale)
-                        if pos3 is not None:
-                            self.models.render_generic_position_colored_id(pos3, id + (offset + i) * 4 + 2, point_scale)
-
-                    offset = len(objlist)
-
-                if vismenu.areas.is_selectable():
-
-                    i = 0
-                    for route in arearoutes:
-                        for obj in [point for point in  route.points if point not in selected]:
-                            objlist.append(
-                                ObjectSelectionEntry(obj=obj,
-                                                 pos1=obj.position,
-                                                 pos2=None,
-                                                 pos3=None,
-                                                 rotation=None))
-                            self.models.render_generic_position_colored_id(obj.position, id + (offset+i) * 4, point_scale)
-                            i += 1
-
-                    offset = len(objlist)
-
-                if vismenu.checkpoints.is_selectable():
-                    for i, obj in enumerate(obj for obj in self.level_file.objects_with_2positions() if obj not in selected):
-                        objlist.append(
-                            ObjectSelectionEntry(obj=obj,
-                                             pos1=obj.start,
-                                             pos2=obj.end,
-                                             pos3=None,
-                                             rotation=None))
-                        self.models.render_generic_position_colored_id(obj.start, id+(offset+i)*4, point_scale)
-                        self.models.render_generic_position_colored_id(obj.end, id+(offset+i)*4 + 1, point_scale)
-                    offset = len(objlist)
-
-                for is_selectable, collection in (
-                        (vismenu.kartstartpoints.is_selectable(), self.level_file.kartpoints),
-                        (vismenu.areas.is_selectable(), self.level_file.areas),
-                        (vismenu.objectareas.is_selectable(), self.level_file.object_areas),
-                        (vismenu.replaycameras.is_selectable(), self.level_file.replayareas),
-                        (vismenu.respawnpoints.is_selectable(), self.level_file.respawnpoints),
-                        (vismenu.cannonpoints.is_selectable(), self.level_file.cannonpoints),
-                        (vismenu.missionsuccesspoints.is_selectable(), self.level_file.missionpoints),
-                        (vismenu.trackinfo.is_selectable(), self.level_file.minimap_areas),
-
-                        ):
-                    if not is_selectable:
-                        continue
+                if gpu_picking:
+                    # Draw every marker with its color ID, like before the pick index existed.
+                    slots = [slot for slot in pick_index.slots
+                             if objlist[slot.index // 4].obj not in selected]
+                elif clickwidth == 1 and clickheight == 1:
+                    # Clicks are resolved against the actual marker meshes, drawing only the
+                    # markers whose bounds contain the click.
+                    candidates = pick_index.query(self.mvp_mat, width, height, click_x, click_y,
+                                                  clickwidth, clickheight, point_scale.x)
+                    slots = [pick_index.slots[i] for i in candidates]
+                else:
+                    slots = None
 
-                    for i, obj in enumerate(obj for obj in collection if obj not in selected):
-                        objlist.append(
-                            ObjectSelectionEntry(obj=obj,
-                                                 pos1=obj.position,
-                                                 pos2=None,
-                                                 pos3=None,
-                                                 rotation=obj.rotation))
-                        self.models.render_generic_position_rotation_colored_id(obj.position, obj.rotation,
-                                                                                id + (offset + i) * 4, point_scale)
-                    offset = len(objlist)
+                indexes = set()
+                if slots is None:
+                    candidates = pick_index.query(self.mvp_mat, width, height, click_x, click_y,
+                                                  clickwidth, clickheight, point_scale.x)
+                    indexes.update(pick_index.indices[candidates].tolist())
+                elif slots:
+                    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+                    self.render_pick_slots(slots, point_scale)
 
-                pixels = glReadPixels(click_x, click_y, clickwidth, clickheight, GL_RGB, GL_UNSIGNED_BYTE)
+                    pixels = glReadPixels(click_x, click_y, clickwidth, clickheight, GL_RGB, GL_UNSIGNED_BYTE)
 
-                indexes = set()
-                for i in range(0, clickwidth * clickheight):
-                    if pixels[i * 3] != 0xFF:
-                        upper = pixels[i * 3] & 0x0F
-                        index = (upper << 16) | (pixels[i * 3 + 1] << 8) | pixels[i * 3 + 2]
-                        indexes.add(index)
+                    indexes.update(decode_pick_ids(pixels, clickwidth * clickheight))
 
                 for index in indexes:
                     entry: ObjectSelectionEntry = objlist[index // 4]
@@ -998,7 +869,9 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
 
                     selected[obj] = elements_exist
 
-                continue_picking = (clickwidth > 1 or clickheight > 1) and indexes
+                # Only the color ID pass needs to be repeated to find the markers hidden behind the
+                # ones that were just picked.
+                continue_picking = gpu_picking and (clickwidth > 1 or clickheight > 1) and indexes
 
             selected = list(selected)
             if not shiftpressed:
@@ -1035,7 +908,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
 
             self.editor.select_from_3d_to_treeview()
 
-            self.editor.on_document_potentially_changed(update_unsaved_changes=False)
+            self.editor.on_selection_changed()
 
             self.gizmo.move_to_average(self.selected, self.selected_positions)
             if len(selected) == 0:
@@ -1089,15 +962,10 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
         additional_collision = {}
         if self.visibility_menu.objects.is_visible():
             for mapobject in self.level_file.objects:
-                kcl_name = mapobject.get_kcl_name()
-                if kcl_name is None:
-                    continue
-                if kcl_name not in self.additional_models.keys():
-                    self.additional_models[kcl_name] = MapObjectModel(kcl_name, self.editor.read_kcl_file)
-                visual_model = self.additional_models[kcl_name].visual_mesh
-
-                if visual_model is None:
+                model = self.get_object_model(mapobject)
+                if model is None:
                     continue
+                visual_model = model.visual_mesh
 
                 glPushMatrix()
                 glTranslatef(mapobject.position.x, -mapobject.position.z, mapobject.position.y)
@@ -1109,7 +977,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
 
                 glPopMatrix()
 
-                additional_collision[mapobject] = self.additional_models[kcl_name].collision
+                additional_collision[mapobject] = model.collision
         if self.collision is not None: self.collision.obj_meshes = additional_collision
 
         if self.snapping_enabled and self.collision is not None:
@@ -1135,13 +1003,13 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                 # Draw wireframe.
                 glColor4f(0.1, 0.1, 0.1, 0.3)
                 glBegin(GL_LINES)
-                for triangle in self.collision.get_triangles():
-                    glVertex3f(triangle.origin.x, triangle.origin.y, triangle.origin.z)
-                    glVertex3f(triangle.p2.x, triangle.p2.y, triangle.p2.z)
-                    glVertex3f(triangle.origin.x, triangle.origin.y, triangle.origin.z)
-                    glVertex3f(triangle.p3.x, triangle.p3.y, triangle.p3.z)
-                    glVertex3f(triangle.p2.x, triangle.p2.y, triangle.p2.z)
-                    glVertex3f(triangle.p3.x, triangle.p3.y, triangle.p3.z)
+                for v1, v2, v3 in self.collision.get_triangles().tolist():
+                    glVertex3f(*v1)
+                    glVertex3f(*v2)
+                    glVertex3f(*v1)
+                    glVertex3f(*v3)
+                    glVertex3f(*v2)
+                    glVertex3f(*v3)
                 glEnd()
 
                 glBlendFunc(GL_ONE, GL_ZERO)
@@ -1152,15 +1020,15 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                 glPointSize(5)
                 glColor3f(0.0, 0.0, 0.0)
                 glBegin(GL_POINTS)
-                points = self._get_snapping_points()
+                points = self._get_snapping_points().tolist()
                 for point in points:
-                    glVertex3f(point.x, point.y, point.z)
+                    glVertex3f(*point)
                 glEnd()
                 glPointSize(3)
                 glColor3f(1.0, 1.0, 1.0)
                 glBegin(GL_POINTS)
                 for point in points:
-                    glVertex3f(point.x, point.y, point.z)
+                    glVertex3f(*point)
                 glEnd()
                 glPointSize(1)
 
@@ -1219,11 +1087,29 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
             selected = self.selected
             positions = self.selected_positions
 
-            select_optimize = {x:True for x in selected}
-
-            if vismenu.trackinfo.is_visible():
+            # Every category of the document is cached: its markers and route lines are collected
+            # and drawn at the end, one instanced draw per marker model and one draw per line
+            # category, while everything else is recorded into a display list. A category is only
+            # walked again once the collections it shows, the selection or the view changes.
+            scene = self.scene_cache
+            revisions = self.scene_revisions
+
+            selection_key = (tuple(map(id, selected)), tuple(map(id, positions)))
+            select_optimize = scene.value("select_optimize", selection_key,
+                                          lambda: {x:True for x in selected})
+
+            view_key = (id(self.level_file), selection_key,
+                        (point_scale.x, point_scale.y, point_scale.z),
+                        self.editor.scale_points.isChecked(), self.mode)
+            # Arrow heads drawn directly face the camera in the 3D view.
+            arrow_head_key = (self.get_arrow_head_scale(), )
+            if self.mode != MODE_TOPDOWN:
+                arrow_head_key += (self.campos.x, self.campos.y, self.campos.z)
+
+            if vismenu.trackinfo.is_visible() and scene.begin(
+                    "minimapareas", (view_key, revisions.get("areas"))):
                 for object in self.level_file.minimap_areas:
-                    self.models.render_generic_position_rotation_colored("minimapareas",
+                    scene.markers.add_position_rotation_colored("minimapareas",
                                                                 object.position, object.rotation,
                                                                 object in select_optimize, point_scale)
                     if object in select_optimize:
@@ -1236,8 +1122,12 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                         self.models.draw_wireframe_cube(object.position, object.rotation, object.scale*100 * 100)
                     else:
                         self.models.draw_wireframe_cylinder(object.position, object.rotation, object.scale*50 * 100)
+                scene.end()
 
-            if vismenu.enemyroutes.is_visible(): 
+            draw_enemyroutes = vismenu.enemyroutes.is_visible() and scene.begin(
+                "enemyroutes", (view_key, revisions.get("enemypointgroups", "areas"),
+                                vismenu.enemyroutes.is_visibleplus()))
+            if draw_enemyroutes:
                 #basic enemyroute drawing is the points, lines between points, lines between groups, and area connections
                 all_groups = self.level_file.enemypointgroups.groups
                 selected_groups = [False] * len(all_groups) #used to determine if a group should be selected - use instead of group_selected
@@ -1262,20 +1152,12 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                             glColor3f(0.0, 0.0, 1.0)
                             self.models.draw_sphere(point.position, 2 * SPHERE_UNITS)
 
-                        self.models.render_generic_position_colored(point.position, point in select_optimize, point_type, point_scale)
+                        scene.markers.add_position_colored(point.position, point in select_optimize, point_type, point_scale)
 
-                    glLineWidth(1.0)
-                    if selected_groups[i]:
-                        glLineWidth(3.0)
-
-                    glBegin(GL_LINE_STRIP)
-                    glColor3f(*colors_json["EnemyRoutes"][:3])
-                    for point in group.points:
-                        pos = point.position
-                        glVertex3f(pos.x, -pos.z, pos.y)
-                    glEnd()
+                    scene.lines.add_line_strip("enemyroutes", [point.position for point in group.points],
+                                         colors_json["EnemyRoutes"], 3.0 if selected_groups[i] else 1.0)
 
-            if vismenu.enemyroutes.is_visible() and vismenu.enemyroutes.is_visibleplus():
+            if draw_enemyroutes and vismenu.enemyroutes.is_visibleplus():
                 #plus drawing are the arrows and enemy settings
                 all_groups = self.level_file.enemypointgroups.groups
                 for i, group in enumerate(all_groups):
@@ -1291,18 +1173,14 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                             glColor3f(  *enemyaction2_colors[point.enemyaction2 - 1]  )
                             self.models.draw_cylinder(point.position, 600 * point_scale.x, 600 * point_scale.x)
 
-                    glLineWidth(1.0)
-                    if selected_groups[i]:
-                        glLineWidth(3.0)
-                    glColor3f(*colors_json["EnemyRoutes"][:3])
-
+                    line_width = 3.0 if selected_groups[i] else 1.0
                     prev_point = None
                     for point in group.points:
                         if prev_point is not None:
-                            self.draw_arrow_head(prev_point, point.position)
+                            scene.lines.add_arrow_head("enemyroutes", prev_point, point.position,
+                                                 colors_json["EnemyRoutes"], line_width)
                         prev_point = point.position
-            if vismenu.enemyroutes.is_visible():
-                glColor3f(*colors_json["EnemyRoutes"][:3])
+            if draw_enemyroutes:
                 #draw connections between groups
                 for i, group in enumerate( all_groups ):
                     if len(group.points) == 0:
@@ -1314,21 +1192,18 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     if len(nextpoints) == 0:
                         continue
 
-                    glLineWidth(1.0)
-                    if selected_groups[i]: #or selected_groups[groupgroup]:
-                        glLineWidth(3.0)
+                    line_width = 3.0 if selected_groups[i] else 1.0 #or selected_groups[groupgroup]
                     prevpoint = group.points[-1]
                     for group, point in nextpoints:
-                        glBegin(GL_LINES)
-                        glVertex3f(prevpoint.position.x, -prevpoint.position.z, prevpoint.position.y)
-                        glVertex3f(point.position.x, -point.position.z, point.position.y)
-                        glEnd()
-
-                        glColor3f(*colors_json["EnemyRoutes"][:3])
-                        self.draw_arrow_head(prevpoint.position, point.position)
+                        scene.lines.add_line("enemyroutes", prevpoint.position, point.position,
+                                       colors_json["EnemyRoutes"], line_width)
+                        scene.lines.add_arrow_head("enemyroutes", prevpoint.position, point.position,
+                                             colors_json["EnemyRoutes"], line_width)
+                scene.end()
 
 
-            if vismenu.itemroutes.is_visible():
+            if vismenu.itemroutes.is_visible() and scene.begin(
+                    "itemroutes", (view_key, revisions.get("itempointgroups"))):
                 enemypoints_to_highlight = set()
 
                 all_groups = self.level_file.itempointgroups.groups
@@ -1360,7 +1235,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                         if i == 0 and j == 0:
                             point_type = "itempointfirst"
 
-                        self.models.render_generic_position_colored(point.position, point in select_optimize, point_type, point_scale)
+                        scene.markers.add_position_colored(point.position, point in select_optimize, point_type, point_scale)
 
 
                         #billaction_colors = [ [1.0, 0.0, 0.0], [0.5, 0.5, 0.5], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]  ]
@@ -1379,26 +1254,17 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
 
                         point_index += 1
 
-                    if selected_groups[i]:
-                        glLineWidth(3.0)
-
-                    glBegin(GL_LINE_STRIP)
-                    glColor3f(*colors_json["ItemRoutes"][:3])
-                    prev_point = None
-                    for point in group.points:
-                        pos = point.position
-                        glVertex3f(pos.x, -pos.z, pos.y)
-                    glEnd()
+                    line_width = 3.0 if selected_groups[i] else 1.0
+                    scene.lines.add_line_strip("itemroutes", [point.position for point in group.points],
+                                         colors_json["ItemRoutes"], line_width)
 
                     prev_point = None
                     for point in group.points:
                         if prev_point is not None:
-                            self.draw_arrow_head(prev_point, point.position)
+                            scene.lines.add_arrow_head("itemroutes", prev_point, point.position,
+                                                 colors_json["ItemRoutes"], line_width)
                         prev_point = point.position
 
-                    if selected_groups[i] and len(all_groups) > 1:
-                        glLineWidth(1.0)
-
                 for i, group in enumerate( all_groups ):
                     if len(group.points) == 0:
                         continue
@@ -1410,43 +1276,42 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                         continue
 
                     for j, (group, point) in enumerate(nextpoints):
-                        glColor3f(*colors_json["ItemRoutes"][:3])
+                        line_color = colors_json["ItemRoutes"]
                         line_width = 4.0
 
                         if selected_groups[i]: #or selected_groups[group]:
                             line_width *= 1.5
 
                         if j == 0 and point in default_points:
-                            glLineWidth(line_width)
-                            glColor3f(1.0, 0.0, 0.0)
+                            line_color = (1.0, 0.0, 0.0)
+                            glColor3f(*line_color)
                             self.models.draw_sphere(point.position, SPHERE_UNITS)
                             line_width *= 1.5
 
-                        glLineWidth(line_width)
-
-                        glBegin(GL_LINES)
-                        glVertex3f(prevpoint.position.x, -prevpoint.position.z, prevpoint.position.y)
-                        glVertex3f(point.position.x, -point.position.z, point.position.y)
-                        glEnd()
-
-                        self.draw_arrow_head(prevpoint.position, point.position)
+                        scene.lines.add_line("itemroutes", prevpoint.position, point.position,
+                                       line_color, line_width)
+                        scene.lines.add_arrow_head("itemroutes", prevpoint.position, point.position,
+                                             line_color, line_width)
 
                         #if selected_groups[i]: #or selected_groups[group]:
                         #    glLineWidth(4.0)
+                scene.end()
 
             #for checkpoints
             all_groups = self.level_file.checkpoints.groups
             selected_groups = [False] * len(all_groups)
 
-            respawns_to_highlight = set()
-
             highligh_sp_width = 8.0
             highligh_cp_width = 4.0
             highligh_cp_lengt = 4.0
             normal_width = 1.0
 
+            draw_checkpoints = vismenu.checkpoints.is_visible() and scene.begin(
+                "checkpoints", (view_key, revisions.get("checkpoints"),
+                                self.editor.next_checkpoint_start_position))
+
             #draw checkpoint groups first the points themselves and then the connections
-            if vismenu.checkpoints.is_visible():
+            if draw_checkpoints:
                 checkpoints_to_highlight = set()
                 count = 0
                 for i, group in enumerate(all_groups):
@@ -1455,11 +1320,10 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     for checkpoint in group.points:
                         start_point_selected = checkpoint.start in positions
                         end_point_selected = checkpoint.end in positions
-                        self.models.render_generic_position_colored(checkpoint.start, start_point_selected, "checkpointleft", point_scale)
-                        self.models.render_generic_position_colored(checkpoint.end, end_point_selected, "checkpointright", point_scale)
+                        scene.markers.add_position_colored(checkpoint.start, start_point_selected, "checkpointleft", point_scale)
+                        scene.markers.add_position_colored(checkpoint.end, end_point_selected, "checkpointright", point_scale)
 
                         if start_point_selected or end_point_selected:
-                            respawns_to_highlight.add(checkpoint.respawn_obj)
                             checkpoints_to_highlight.add(count)
 
                         if checkpoint.respawn_obj is not None and checkpoint.respawn_obj in select_optimize:
@@ -1467,7 +1331,6 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                             checkpoints_to_highlight.add(count)
 
                         count += 1
-                    glColor3f(*colors_json["Checkpoint"][:3])
 
                     #draw the lines between the points and between successive points
                     for j, checkpoint in enumerate(group.points):
@@ -1475,44 +1338,32 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                         pos2 = checkpoint.end
 
                         #draw the line for each singular checkpoint
-                        glLineWidth(normal_width)
-                        glColor3f(*colors_json["Checkpoint"][:3])
+                        line_width = normal_width
+                        line_color = colors_json["Checkpoint"]
 
                         if (checkpoint.type == 1 or checkpoint.lapcounter == 1) and selected_groups[i] :
-                            glLineWidth(highligh_sp_width)
+                            line_width = highligh_sp_width
                         elif checkpoint.type == 1 or selected_groups[i] or checkpoint.lapcounter == 1:
-                            glLineWidth(highligh_cp_width)
+                            line_width = highligh_cp_width
 
                         concave_next = j + 1 < len(group.points) and check_box_convex(checkpoint, group.points[j+1])
                         concave_prev = j - 1 >= 0 and check_box_convex(checkpoint, group.points[j-1])
                         if concave_next or concave_prev:
-                            glColor3f( 1.0, 0.0, 0.0 )
-
+                            line_color = (1.0, 0.0, 0.0)
                         elif checkpoint.lapcounter == 1:
-                            glColor3f( 1.0, 0.5, 0.0 )
+                            line_color = (1.0, 0.5, 0.0)
                         elif checkpoint.type == 1:
-                            glColor3f( 1.0, 1.0, 0.0 )
+                            line_color = (1.0, 1.0, 0.0)
 
-                        glBegin(GL_LINES)
-                        glVertex3f(pos1.x, -pos1.z, pos1.y)
-                        glVertex3f(pos2.x, -pos2.z, pos2.y)
-                        glEnd()
+                        scene.lines.add_line("checkpoints", pos1, pos2, line_color, line_width)
 
                         #draw lines between successive checkpoints
                         if not concave_prev:
-                            glColor3f(*colors_json["Checkpoint"][:3])
-                        glLineWidth(normal_width)
-                        glBegin(GL_LINES)
+                            line_color = colors_json["Checkpoint"]
                         if prev is not None:
-                            pos3 = prev.start
-                            pos4 = prev.end
+                            scene.lines.add_line("checkpoints", pos1, prev.start, line_color, normal_width)
+                            scene.lines.add_line("checkpoints", pos2, prev.end, line_color, normal_width)
 
-                            glVertex3f(pos1.x, -pos1.z, pos1.y)
-                            glVertex3f(pos3.x, -pos3.z, pos3.y)
-                            glVertex3f(pos2.x, -pos2.z, pos2.y)
-                            glVertex3f(pos4.x, -pos4.z, pos4.y)
-
-                        glEnd()
                         prev = checkpoint
 
                 #draw thicker lines for selected ones
@@ -1522,36 +1373,25 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     for i, group in enumerate(self.level_file.checkpoints.groups):
                         for checkpoint in group.points:
                             if point_index in checkpoints_to_highlight or selected_groups[i]:
-                                pos1 = checkpoint.start
-                                pos2 = checkpoint.end
-
-                                glColor3f(*colors_json["Checkpoint"][:3])
+                                line_color = colors_json["Checkpoint"]
                                 if checkpoint.lapcounter == 1:
-                                    glColor3f( 1.0, 0.5, 0.0 )
-                                    glLineWidth(highligh_sp_width)
+                                    line_color = (1.0, 0.5, 0.0)
+                                    line_width = highligh_sp_width
                                 elif checkpoint.type == 1:
-                                    glLineWidth(highligh_sp_width)
-                                    glColor3f( 1.0, 1.0, 0.0 )
+                                    line_width = highligh_sp_width
+                                    line_color = (1.0, 1.0, 0.0)
                                 else:
-                                    glLineWidth(highligh_cp_width)
+                                    line_width = highligh_cp_width
 
-
-                                glBegin(GL_LINES)
-                                glVertex3f(pos1.x, -pos1.z, pos1.y)
-                                glVertex3f(pos2.x, -pos2.z, pos2.y)
-                                glEnd()
+                                scene.lines.add_line("checkpoints", checkpoint.start, checkpoint.end,
+                                               line_color, line_width)
                             point_index += 1
-                glLineWidth(normal_width)
 
             glPushMatrix()
 
             #draw the arrow head between successive checkpoints in the same group
-            if vismenu.checkpoints.is_visible():
+            if draw_checkpoints:
                 for i, group in enumerate(self.level_file.checkpoints.groups):
-                    if selected_groups[i]:
-                        glLineWidth(normal_width)
-
-                    glColor3f(*colors_json["Checkpoint"][:3])
                     prev = None
                     for checkpoint in group.points:
                         if prev is None:
@@ -1560,18 +1400,13 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                             mid1 = (prev.start + prev.end) / 2.0
                             mid2 = (checkpoint.start + checkpoint.end) / 2.0
 
-                            self.draw_arrow_head(mid1, mid2)
-                            #lines.append((mid1, mid2))
+                            scene.lines.add_arrow_head("checkpoints", mid1, mid2,
+                                                 colors_json["Checkpoint"], normal_width)
                             prev = checkpoint
-
-                    if selected_groups[i]:
-                        glLineWidth(normal_width)
             #draw the arrow body between sucessive checkpoints
-            if vismenu.checkpoints.is_visible():
+            if draw_checkpoints:
                 for i, group in enumerate( self.level_file.checkpoints.groups ) :
-                    if selected_groups[i]:
-                        glLineWidth(highligh_cp_lengt)
-                    glColor3f(*colors_json["Checkpoint"][:3])
+                    line_width = highligh_cp_lengt if selected_groups[i] else normal_width
                     prev = None
                     for checkpoint in group.points:
                         if prev is None:
@@ -1579,16 +1414,12 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                         else:
                             mid1 = (prev.start+prev.end)/2.0
                             mid2 = (checkpoint.start+checkpoint.end)/2.0
-                            glBegin(GL_LINES)
-                            glVertex3f(mid1.x, -mid1.z, mid1.y)
-                            glVertex3f(mid2.x, -mid2.z, mid2.y)
+                            scene.lines.add_line("checkpoints", mid1, mid2, colors_json["Checkpoint"],
+                                           line_width)
                             prev = checkpoint
-                            glEnd()
-                    if selected_groups[i]:
-                        glLineWidth(normal_width)
 
             #draw arrows between groups
-            if vismenu.checkpoints.is_visible():
+            if draw_checkpoints:
                 all_groups = self.level_file.checkpoints.groups
                 for i, group in enumerate( all_groups ):
                     if len(group.points) == 0:
@@ -1601,41 +1432,28 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     if len(nextpoints) == 0:
                         continue
 
-                    glColor3f(0,0,0)
+                    line_width = highligh_cp_lengt if selected_groups[i] else normal_width #or selected_groups[group]
                     for group, point in nextpoints:
-                        if selected_groups[i]: #or selected_groups[group]:
-                            glLineWidth(highligh_cp_lengt)
-
-                        glBegin(GL_LINES)
-                        glVertex3f(prevpoint.start.x, -prevpoint.start.z, prevpoint.start.y)
-                        glVertex3f(point.start.x, -point.start.z, point.start.y)
-                        glEnd()
-
-                        self.draw_arrow_head(prevpoint.start, point.start)
-
-                        glBegin(GL_LINES)
-                        glVertex3f(prevpoint.end.x, -prevpoint.end.z, prevpoint.end.y)
-                        glVertex3f(point.end.x, -point.end.z, point.end.y)
-                        glEnd()
-
-                        self.draw_arrow_head(prevpoint.end, point.end)
-
-                        if selected_groups[i] :#or selected_groups[group]:
-                            glLineWidth(normal_width)
+                        for pos1, pos2 in ((prevpoint.start, point.start), (prevpoint.end, point.end)):
+                            scene.lines.add_line("checkpoints", pos1, pos2, (0.0, 0.0, 0.0), line_width)
+                            scene.lines.add_arrow_head("checkpoints", pos1, pos2, (0.0, 0.0, 0.0), line_width)
                 if self.editor.next_checkpoint_start_position is not None:
                     self.models.render_generic_position_colored(
                     Vector3(*self.editor.next_checkpoint_start_position), True,
                     "checkpointleft", point_scale)
+                scene.end()
             glPopMatrix()
             #go between the groups
-            if vismenu.objects.is_visible():
+            if vismenu.objects.is_visible() and scene.begin(
+                    "objects", (view_key, revisions.get("objects", "routes"),
+                                self.editor.render_gobj_scale.isChecked())):
                 for object in self.level_file.objects:
                     object_scale = Vector3(1, 1, 1)
                     if self.editor.render_gobj_scale.isChecked():
                         object_scale = object.scale
                     if self.editor.scale_points.isChecked():
                         object_scale = point_scale.scale_vec(object_scale)
-                    self.models.render_generic_position_rotation_colored("objects",
+                    scene.markers.add_position_rotation_colored("objects",
                                                                  object.position, object.rotation,
                                                                  object in select_optimize,
                                                                  object_scale)
@@ -1650,8 +1468,6 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
 
                 objs_to_highlight = set()
 
-                glLineWidth(1.0)
-
                 for i, route in enumerate(objectroutes):
 
                     selected = route in routes_to_highlight
@@ -1659,7 +1475,6 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     if route in self.selected:
                         selected = True
 
-                    last_point = None
                     used_by = self.level_file.route_used_by(route)
 
                     render_type = "objectpoint" if used_by else "unusedobjectpoint"
@@ -1668,35 +1483,24 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                         point_selected = point in select_optimize
                         if point_selected:
                             objs_to_highlight.update( used_by )
-                        self.models.render_generic_position_colored(point.position, point_selected, render_type, point_scale)
+                        scene.markers.add_position_colored(point.position, point_selected, render_type, point_scale)
                         selected = selected or point_selected
 
-                        if last_point is not None:
-                            self.draw_arrow_head(last_point.position, point.position)
-                        last_point = point
-
                         if point in routepoints_to_circle:
                             glColor3f(*colors_json["ObjectRoutes"][:3])
                             self.models.draw_sphere(point.position, SPHERE_UNITS)
-                    if selected:
-                        glLineWidth(3.0)
 
-                    glBegin(GL_LINE_STRIP)
-                    glColor3f(*colors_json["ObjectRoutes"][:3])
-                    if len(route.points) == 2 and route.smooth != 0:
-                        glColor3f(1.0, 0.0, 0.0 )
-                    for point in route.points:
-                        pos = point.position
-                        glVertex3f(pos.x, -pos.z, pos.y)
-                    glEnd()
-                    if selected:
-                        glLineWidth(1.0)
+                    self.add_route_lines(scene.lines, "objectroutes", route, colors_json["ObjectRoutes"],
+                                         3.0 if selected else 1.0)
 
                 for obj in objs_to_highlight:
                     glColor3f(*colors_json["Objects"][:3])
                     self.models.draw_sphere(obj.position, SPHERE_UNITS)
+                scene.end()
 
-            if vismenu.objectareas.is_visible():
+            if vismenu.objectareas.is_visible() and scene.begin(
+                    "objectareas", (view_key, revisions.get("object_areas", "objects"),
+                                    vismenu.objects.is_visible())):
                 object_areas = self.level_file.object_areas
 
                 object_load_areas = [area for area in object_areas if area.type in (8,9)]
@@ -1704,7 +1508,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
 
                 selected_object_areas = list(set([area.setting1 for area in object_load_areas if area in select_optimize]))
                 for object in object_load_areas:
-                    self.models.render_generic_position_rotation_colored("objectarea",
+                    scene.markers.add_position_rotation_colored("objectarea",
                                                                 object.position, object.rotation,
                                                                 object in select_optimize, point_scale)
                     if object in select_optimize:
@@ -1727,7 +1531,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                         self.models.draw_wireframe_cylinder(object.position, object.rotation, object.scale*50 * 100)
 
                 for object in boo_areas:
-                    self.models.render_generic_position_rotation_colored("areas",
+                    scene.markers.add_position_rotation_colored("areas",
                                                                 object.position, object.rotation,
                                                                 object in select_optimize, point_scale)
                     if object in select_optimize:
@@ -1751,19 +1555,23 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                             if area.check(object.position):
                                 self.models.draw_sphere( object.position, SPHERE_UNITS)
                                 break
+                scene.end()
 
-            if vismenu.kartstartpoints.is_visible():
+            if vismenu.kartstartpoints.is_visible() and scene.begin(
+                    "kartpoints", (view_key, revisions.get("kartpoints"))):
                 for object in self.level_file.kartpoints:
-                    self.models.render_generic_position_rotation_colored("startpoints",
+                    scene.markers.add_position_rotation_colored("startpoints",
                                                                 object.position, object.rotation,
                                                                 object in select_optimize, point_scale)
                     z_scale = 4800 if self.level_file.kartpoints.start_squeeze else 5300
                     self.models.draw_wireframe_cube( object.position,
                                                         object.rotation,
                                                         Vector3( 2000, 50, z_scale   ), kartstart = True)
-            if vismenu.areas.is_visible():
+                scene.end()
+            if vismenu.areas.is_visible() and scene.begin(
+                    "areas", (view_key, revisions.get("areas", "routes"))):
                 for object in self.level_file.areas:
-                    self.models.render_generic_position_rotation_colored("areas",
+                    scene.markers.add_position_rotation_colored("areas",
                                                                 object.position, object.rotation,
                                                                 object in select_optimize, point_scale)
                     if object in select_optimize:
@@ -1786,41 +1594,27 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     selected = False
                     circle = route in routes_to_circle
 
-                    last_point = None
                     if self.level_file.route_used_by(route):
                         for point in route.points:
                             point_selected = point in select_optimize
-                            self.models.render_generic_position_colored(point.position, point_selected, "areapoint", point_scale)
+                            scene.markers.add_position_colored(point.position, point_selected, "areapoint", point_scale)
                             if circle:
                                 glColor3f(*colors_json["Areas"][:3])
                                 self.models.draw_sphere(point.position, 2 * SPHERE_UNITS)
                             selected = selected or point_selected
-                            if last_point is not None:
-                                self.draw_arrow_head(last_point.position, point.position)
-                            last_point = point
                     else:
                         for point in route.points:
                             point_selected = point in select_optimize
-                            self.models.render_generic_position_colored(point.position, point_selected, "unusedpoint", point_scale)
+                            scene.markers.add_position_colored(point.position, point_selected, "unusedpoint", point_scale)
                             selected = selected or point_selected
-                            if last_point is not None:
-                                self.draw_arrow_head(last_point.position, point.position)
-                            last_point = point
 
-                    if selected or circle:
-                        glLineWidth(3.0)
-                    glBegin(GL_LINE_STRIP)
-                    glColor3f(*colors_json["AreaRoutes"][:3])
-                    if len(route.points) == 2 and route.smooth != 0:
-                        glColor3f(1.0, 0.0, 0.0 )
-                    for point in route.points:
-                        pos = point.position
-                        glVertex3f(pos.x, -pos.z, pos.y)
-                    glEnd()
-                    if selected or circle:
-                        glLineWidth(1.0)
+                    self.add_route_lines(scene.lines, "arearoutes", route, colors_json["AreaRoutes"],
+                                         3.0 if selected or circle else 1.0)
+                scene.end()
 
-            if vismenu.replaycameras.is_visible():
+            if vismenu.replaycameras.is_visible() and scene.begin(
+                    "replaycameras", (view_key, revisions.get("replayareas", "cameras", "routes"),
+                                      arrow_head_key)):
                 #define levels of :
 
                 #stuff that is directly selected by a user
@@ -1846,7 +1640,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
 
                 for object in self.level_file.replayareas:
                     bolded = object in linked_areas
-                    self.models.render_generic_position_rotation_colored( "replayareas",
+                    scene.markers.add_position_rotation_colored( "replayareas",
                                                                 object.position, object.rotation,
                                                                 bolded, point_scale)
                     if bolded:
@@ -1867,7 +1661,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     bolded = object in linked_cameras
 
                     if object.type == 1:
-                        self.models.render_generic_position_colored(object.position, bolded, "replaycameras", point_scale)
+                        scene.markers.add_position_colored(object.position, bolded, "replaycameras", point_scale)
                         if not object.follow_player:
                             glColor4f(*colors_replaycamera)
                             pos2 = object.position2_simple.render() #if absolute_poses else object.position2.absolute()
@@ -1889,7 +1683,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                             self.draw_arrow_head(pos2, pos3)
 
                     elif object.type == 3:
-                        self.models.render_generic_position_colored(object.position,
+                        scene.markers.add_position_colored(object.position,
                                                                 bolded, "replaycamerasplayer", point_scale)
                 for i, route in enumerate(replaycameraroutes):
                     selected = route in selected_routes
@@ -1897,7 +1691,7 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
 
                     last_point = route.points[0]
                     for point in route.points[1:]:
-                        self.models.render_generic_position_colored(point.position.render(), bolded, "replaycamerapoint", point_scale)
+                        scene.markers.add_position_colored(point.position.render(), bolded, "replaycamerapoint", point_scale)
                         if last_point is not None:
                             self.draw_arrow_head(last_point.position.render(), point.position.render())
                         last_point = point
@@ -1913,12 +1707,14 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     glEnd()
                     if bolded:
                         glLineWidth(1.0)
+                scene.end()
 
-            if vismenu.cameras.is_visible():
+            if vismenu.cameras.is_visible() and scene.begin(
+                    "cameras", (view_key, revisions.get("cameras", "routes"), arrow_head_key)):
                 for i, object in enumerate(self.level_file.cameras):
                     if object.type == 0:
                         continue
-                    self.models.render_generic_position_colored(object.position,
+                    scene.markers.add_position_colored(object.position,
                                                                  object in select_optimize,
                                                                  "camera", point_scale)
                     if object in select_optimize:
@@ -1952,38 +1748,35 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                         self.models.draw_sphere(object.position, 2 * SPHERE_UNITS)
 
                 routes_to_highlight = set( [camera.route_obj for camera in self.level_file.cameras if camera in select_optimize]  )
-                glLineWidth(1.0)
                 for i, route in enumerate(cameraroutes):
                     selected = route in routes_to_highlight or route in self.selected
 
-                    last_point = None
                     for point in route.points:
                         point_selected = point in select_optimize
-                        self.models.render_generic_position_colored(point.position, point_selected, "camerapoint", point_scale)
+                        scene.markers.add_position_colored(point.position, point_selected, "camerapoint", point_scale)
                         selected = selected or point_selected
-                        if last_point is not None:
-                            self.draw_arrow_head(last_point.position, point.position)
-                        last_point = point
 
-                    if selected:
-                        glLineWidth(3.0)
-                    glBegin(GL_LINE_STRIP)
-                    glColor3f(*colors_json["CameraRoutes"][:3])
-                    if len(route.points) == 2 and route.smooth != 0:
-                        glColor3f(1.0, 0.0, 0.0 )
-                    for point in route.points:
-                        pos = point.position
-                        glVertex3f(pos.x, -pos.z, pos.y)
-                    glEnd()
-                    if selected:
-                        glLineWidth(1.0)
-            if vismenu.respawnpoints.is_visible():
+                    self.add_route_lines(scene.lines, "cameraroutes", route, colors_json["CameraRoutes"],
+                                         3.0 if selected else 1.0)
+                scene.end()
+            if vismenu.respawnpoints.is_visible() and scene.begin(
+                    "respawnpoints", (view_key, revisions.get("respawnpoints", "checkpoints"),
+                                      vismenu.checkpoints.is_visible())):
                 used_respawns = self.level_file.checkpoints.get_used_respawns()
+
+                # Respawns of the checkpoints whose ends are selected are highlighted.
+                respawns_to_highlight = set()
+                if vismenu.checkpoints.is_visible():
+                    for group in self.level_file.checkpoints.groups:
+                        for checkpoint in group.points:
+                            if checkpoint.start in positions or checkpoint.end in positions:
+                                respawns_to_highlight.add(checkpoint.respawn_obj)
+
                 for i, object in enumerate( self.level_file.respawnpoints):
                     render_type = "unusedrespawn"
                     if object in used_respawns:
                         render_type = "respawn"
-                    self.models.render_generic_position_rotation_colored(render_type,
+                    scene.markers.add_position_rotation_colored(render_type,
                                                                 object.position, object.rotation,
                                                                 object in select_optimize, point_scale)
 
@@ -1993,17 +1786,24 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
                     self.models.draw_wireframe_cube( object.position,
                                                         object.rotation,
                                                         Vector3( 900, 50, 600   ), kartstart = True)
+                scene.end()
 
-            if vismenu.cannonpoints.is_visible():
+            if vismenu.cannonpoints.is_visible() and scene.begin(
+                    "cannonpoints", (view_key, revisions.get("cannonpoints"))):
                 for object in self.level_file.cannonpoints:
-                    self.models.render_generic_position_rotation_colored("cannons",
+                    scene.markers.add_position_rotation_colored("cannons",
                                                                 object.position, object.rotation,
                                                                  object in select_optimize, point_scale)
-            if vismenu.missionsuccesspoints.is_visible():
+                scene.end()
+            if vismenu.missionsuccesspoints.is_visible() and scene.begin(
+                    "missionpoints", (view_key, revisions.get("missionpoints"))):
                 for object in self.level_file.missionpoints:
-                    self.models.render_generic_position_rotation_colored("mission",
+                    scene.markers.add_position_rotation_colored("mission",
                                                                 object.position, object.rotation,
                                                                  object in select_optimize, point_scale)
+                scene.end()
+
+            scene.render(self.campos, self.mode == MODE_TOPDOWN, self.get_arrow_head_scale())
 
         if self.level_file is not None and self.editor.render_area_fill.isChecked():
             normal_areas = (
@@ -2157,12 +1957,149 @@ class KMPMapViewer(QtOpenGLWidgets.QOpenGLWidget):
         glFinish()
         #now = default_timer() - start
 
+    def get_object_model(self, mapobject):
+        """
+        Returns the collision model of the KCL file `mapobject` uses, or None if it has none or
+        the model is still being loaded in the background.
+        """
+        kcl_name = mapobject.get_kcl_name()
+        if kcl_name is None:
+            return None
+
+        if kcl_name not in self.object_model_keys:
+            data = self.editor.read_kcl_data(kcl_name, True)
+            key = get_data_key(data) if data is not None else None
+            self.object_model_keys[kcl_name] = key
+            if key is not None:
+                object_model_cache.request(key, data)
+
+        key = self.object_model_keys[kcl_name]
+        if key is None:
+            return None
+        return object_model_cache.get(key, lambda: self.editor.read_kcl_data(kcl_name, True))
+
+    def get_pick_index(self, vismenu, objectroutes, cameraroutes, replaycameraroutes, arearoutes,
+                       replaycameras):
+        selectable = tuple(toggle.is_selectable() for toggle in (
+            vismenu.enemyroutes, vismenu.itemroutes, vismenu.objects, vismenu.cameras,
+            vismenu.replaycameras, vismenu.areas, vismenu.checkpoints, vismenu.kartstartpoints,
+            vismenu.objectareas, vismenu.respawnpoints, vismenu.cannonpoints,
+            vismenu.missionsuccesspoints, vismenu.trackinfo))
+        key = (id(self.level_file), self.scene_revisions.get(*COLLECTIONS), selectable)
+        return self.scene_cache.value(
+            "pick_index", key, lambda: self.build_pick_index(vismenu, objectroutes, cameraroutes,
+                                                             replaycameraroutes, arearoutes,
+                                                             replaycameras))
+
+    def build_pick_index(self, vismenu, objectroutes, cameraroutes, replaycameraroutes, arearoutes,
+                         replaycameras):
+        objlist = []
+        slots = []
+        unscaled = Vector3(1, 1, 1)
+
+        def add(obj, pos1, pos2=None, pos3=None, rotation=None, scale=unscaled):
+            index = len(objlist) * 4
+            objlist.append(ObjectSelectionEntry(obj=obj, pos1=pos1, pos2=pos2, pos3=pos3,
+                                                rotation=rotation))
+            for i, pos in enumerate((pos1, pos2, pos3)):
+                if pos is not None:
+                    slots.append(PickSlot(index + i, pos, rotation, scale))
+
+        if vismenu.enemyroutes.is_selectable():
+            for obj in self.level_file.enemypointgroups.points():
+                add(obj, obj.position)
+
+        if vismenu.itemroutes.is_selectable():
+            for obj in self.level_file.itempointgroups.points():
+                add(obj, obj.position)
+
+        if vismenu.objects.is_selectable(): #object routes
+            for route in objectroutes:
+                for obj in route.points:
+                    add(obj, obj.position)
+
+            for obj in self.level_file.objects:
+                add(obj, obj.position, rotation=obj.rotation, scale=obj.scale)
+
+        if vismenu.cameras.is_selectable():
+            for obj in self.level_file.cameras:
+                add(obj, obj.position, obj.position2_simple, obj.position3_simple)
+
+            for route in cameraroutes:
+                for obj in route.points[1:]:
+                    add(obj, obj.position)
+
+        if vismenu.replaycameras.is_selectable():
+            for route in replaycameraroutes:
+                for obj in route.points[1:]:
+                    add(obj, obj.position.render())
+
+            for obj in replaycameras:
+                pos1 = obj.position
+                pos2 = None
+                pos3 = None
+                if (obj.type == 1 and not obj.follow_player):
+                    pos2 = obj.position2_simple.render()
+                    pos3 = obj.position3_simple.render()
+                if obj.type == 3:
+                    pos1 = obj.position.render()
+                add(obj, pos1, pos2, pos3)
+
+        if vismenu.areas.is_selectable():
+            for route in arearoutes:
+                for obj in route.points:
+                    add(obj, obj.position)
+
+        if vismenu.checkpoints.is_selectable():
+            for obj in self.level_file.objects_with_2positions():
+                add(obj, obj.start, obj.end)
+
+        for is_selectable, collection in (
+                (vismenu.kartstartpoints.is_selectable(), self.level_file.kartpoints),
+                (vismenu.areas.is_selectable(), self.level_file.areas),
+                (vismenu.objectareas.is_selectable(), self.level_file.object_areas),
+                (vismenu.replaycameras.is_selectable(), self.level_file.replayareas),
+                (vismenu.respawnpoints.is_selectable(), self.level_file.respawnpoints),
+                (vismenu.cannonpoints.is_selectable(), self.level_file.cannonpoints),
+                (vismenu.missionsuccesspoints.is_selectable(), self.level_file.missionpoints),
+                (vismenu.trackinfo.is_selectable(), self.level_file.minimap_areas),
+                ):
+            if not is_selectable:
+                continue
+
+            for obj in collection:
+                add(obj, obj.position, rotation=obj.rotation)
+
+        return PickIndex(objlist, slots)
+
+    def render_pick_slots(self, slots, point_scale):
+        for slot in slots:
+            id = 0x100000 + slot.index
+            scale = point_scale.scale_vec(slot.scale)
+            if slot.rotation is None:
+                self.models.render_generic_position_colored_id(slot.position, id, scale)
+            else:
+                self.models.render_generic_position_rotation_colored_id(slot.position, slot.rotation,
+                                                                        id, scale)
+
+    def get_arrow_head_scale(self):
+        if self.editor.scale_points.isChecked() and self.mode == MODE_TOPDOWN:
+            return self.gizmo_scale / 100
+        return 1
+
+    def add_route_lines(self, lines, category, route, color, width):
+        # Routes with two points that are meant to be smooth are flagged in red.
+        if len(route.points) == 2 and route.smooth != 0:
+            color = (1.0, 0.0, 0.0)
+        positions = [point.position for point in route.points]
+        lines.add_line_strip(category, positions, color, width)
+        for startpos, endpos in zip(positions, positions[1:]):
+            lines.add_arrow_head(category, startpos, endpos, color, width)
+
     def draw_arrow_head(self, startpos, endpos):
         mid_position = (startpos + endpos) / 2
-        
-        scale = 1
-        if self.editor.scale_points.isChecked() and self.mode == MODE_TOPDOWN:
-            scale = self.gizmo_scale / 100
+
+        scale = self.get_arrow_head_scale()
 
         if self.mode == MODE_TOPDOWN:
         #    scale = self.zoom_factor / 16
@@ -2537,14 +2474,3 @@ class FilterViewMenu(QtWidgets.QMenu):
                 QtWidgets.QMenu.mouseReleaseEvent(self, e)
         except:
             traceback.print_exc()
-
-class MapObjectModel(object):
-    def __init__(self, filepath, read_kcl_file) -> None:
-        faces, model = read_kcl_file(filepath, True)
-        if faces is None:
-            self.collision = None
-            self.visual_mesh = None
-        else:
-            self.collision = Collision(faces)
-            self.visual_mesh = model
-
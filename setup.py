@@ -3,6 +3,8 @@ import shutil
 
 from cx_Freeze import setup, Executable
 
+from lib.object_parameters import build_database
+
 version = "1.2"
 # Dependencies are automatically detected, but it might need fine tuning.
 
@@ -13,6 +15,9 @@ include_files = [
     ("lib/color_coding.json", "lib/color_coding.json"),
 ]
 
+# Pack the object parameter files so the bundle ships with an up-to-date database.
+build_database()
+
 build_dirpath = 'build'
 bundle_dirname = f'mkdd-track-editor-{version}'
 bundle_dirpath = os.path.join(build_dirpath, bundle_dirname)
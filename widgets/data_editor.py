@@ -56,13 +56,7 @@ def get_cmn_obj(objs, kmp_file=None):
     return cmn_obj
 
 def load_parameter_names(objectid):
-    if (objectid is None) or (not objectid in OBJECTNAMES):
-        return None
-    name = OBJECTNAMES[objectid]
-    path = os.path.join("object_parameters", name+".json")
-    with open(path, "r") as f:
-        data = json.load(f)
-    return data
+    return get_object_parameters(objectid)
 
 def clear_layout(layout):
     while layout.count():
@@ -14,6 +14,8 @@ from PIL import Image
 from PySide6 import QtCore, QtGui, QtWidgets
 
 import lib.libkmp as libkmp
+from lib import kmp_analysis
+from lib.kmp_analysis import check_box_convex
 from widgets.data_editor import choose_data_editor, ObjectEdit
 from lib.libkmp import get_kmp_name
 
@@ -120,100 +122,7 @@ class ErrorAnalyzer(QtWidgets.QDialog):
     @classmethod
     @catch_exception
     def analyze_kmp(cls, kmp: libkmp.KMP) -> 'list[str]':
-        lines: list[str] = []
-
-        def write_line(line):
-            lines.append(line)
-
-        #ktpt testing
-        #check number
-        num_kartpoints = len(kmp.kartpoints)
-        if num_kartpoints == 0:
-            write_line("WARNING: There are no starting points.")
-        elif num_kartpoints > 2 and num_kartpoints < 12:
-            write_line("There are {0} starting points.".format(num_kartpoints))
-        elif num_kartpoints > 12:
-            write_line("There are {0} starting points. Battle stages use 12".format(num_kartpoints))
-
-        player_ids = {}
-        for i, point in enumerate(kmp.kartpoints):
-            id = point.playerid
-            if id in player_ids:
-                player_ids[id].append(i)
-            else:
-                player_ids[id] = [i]
-
-        #check for ids outside of the -1 to 11 range
-        #check for reused ids
-        for id in player_ids:
-            num_with_id = len(player_ids[id])
-            if id == 255 and num_with_id > 2:
-                write_line("There are {0} starting points with id 255 : {1}. Normally there is one, but LE-CODE supports two.".format(num_with_id, player_ids[255]))
-            elif num_with_id > 1 and id != 255:
-                write_line("There are {0} starting points with id {1} : {2}.".format(num_with_id, id, player_ids[id]))
-
-        #check enemy poitns
-        if len(kmp.enemypointgroups.groups) == 0:
-            write_line("You need at least one enemy point group!")
-        """
-        else:
-            for group in kmp.enemypointgroups.groups:
-                if len(group.points) == 1 and (group in group.next or group in group.prev):
-                    write_line("There is a self-linked enemy group. Oh no!")"""
-        #check for unreachable groups
-
-        #check for empty (and used!) routes
-        """
-        for i, group in enumerate(kmp.routes):
-
-            if len(group.used_by) > 0 :
-                if len(group.points) == 0:
-                    write_line("Route {0} is used, but does not have any points".format( i ))
-                elif len(group.points) == 1:
-                    write_line("Route {0} is used, but only has one point".format( i ))
-            if len(group.points) == 2 and group.smooth != 0:
-                write_line("Route {0} has two points, but is set to smooth".format( i ))
-        """
-        # Validate path id in objects
-        for object in kmp.objects:
-            if object.route_info() > 0 and object.route_obj is None:
-                write_line("Object {0} needs a route.".format( get_kmp_name(object.objectid)))
-        # Check camera indices in areas
-        for i, area in enumerate(kmp.replayareas):
-            if area.camera is None:
-                write_line("Area {0} needs a connected camera".format(i))
-
-        cls.check_checkpoints_convex(kmp, write_line)
-
-        return lines
-
-    @classmethod
-    def check_checkpoints_convex(cls, kmp, write_line):
-        for gindex, group in enumerate(kmp.checkpoints.groups):
-            if len(group.points) > 1:
-                for i in range(1, len(group.points)):
-                    c1 = group.points[i-1]
-                    c2 = group.points[i]
-
-                    if check_box_convex(c1, c2):
-                        write_line("Quad formed by checkpoints {0} and {1} in checkpoint group {2} isn't convex.".format(
-                                    i-1, i, gindex
-                                ))
-
-def check_box_convex(c1, c2):
-    lastsign = None
-    for p1, mid, p3 in ((c1.start, c2.start, c2.end),
-                        (c2.start, c2.end, c1.end),
-                        (c2.end, c1.end, c1.start),
-                        (c1.end, c1.start, c2.start)):
-        side1 = p1 - mid
-        side2 = p3 - mid
-        prod = side1.x * side2.z - side2.x * side1.z
-        if lastsign is None:
-            lastsign = prod > 0
-        else:
-            if not (lastsign == (prod > 0)):
-                return True
+        return kmp_analysis.analyze_kmp(kmp)
 
 class ErrorAnalyzerButton(QtWidgets.QPushButton):
     def __init__(self, parent=None):
@@ -227,8 +136,20 @@ class ErrorAnalyzerButton(QtWidgets.QPushButton):
         self.setStyleSheet("QPushButton { border: 0px; padding: 2px; } "
                            f"QPushButton:hover {{ background: {background_color}; }}")
 
-    def analyze_kmp(self, bol: libkmp.KMP):
-        lines = ErrorAnalyzer.analyze_kmp(bol)
+        # Only the checks whose sections were edited run again on every change.
+        self.analyzer = kmp_analysis.IncrementalAnalyzer()
+
+    @catch_exception
+    def _analyze(self, bol, changed):
+        return self.analyzer.analyze(bol, changed)
+
+    def analyze_kmp(self, bol: libkmp.KMP, changed=None):
+        """
+        Updates the button with the problems found in `bol`. `changed` holds the ids of the objects
+        that changed since the previous call (see `IncrementalAnalyzer.analyze()`), or is None if
+        they are not known.
+        """
+        lines = self._analyze(bol, changed)
         if lines:
             self.setIcon(self.warning_icon)
             self.setText(str(len(lines)))